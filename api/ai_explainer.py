@@ -1,9 +1,57 @@
 import os
 import json
-from typing import Optional
-from openai import OpenAI
+import random
+import asyncio
+import threading
+from functools import lru_cache
+from typing import Optional, Callable, Dict, List, Tuple, TYPE_CHECKING
+
+from explanation_cache import ExplanationCache, explanation_signature, PLACEHOLDER_RULES
+from metrics import span
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+MODEL = "gpt-4o"
+AI_CONCURRENCY = int(os.getenv("AI_CONCURRENCY", "8"))      # requests in flight
+AI_TIMEOUT_SEC = float(os.getenv("AI_TIMEOUT_SEC", "60"))   # per request
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "4"))
+AI_BACKOFF_SEC = 1.0
+
+# Small calls are packed into one request (answer split back per call)
+AI_BATCH_SIZE = int(os.getenv("AI_BATCH_SIZE", "5"))
+AI_BATCH_MAX_CHARS = 4000  # serialized analysis size of a "small" call
+
+AI_FAILED_PREFIX = "AI explanation failed:"
+
+# Repeated call shapes are answered from here (persistent across jobs)
+explanation_cache = ExplanationCache()
+
+# Created on first get_client()
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "OpenAI":
+    """
+    Shared sync OpenAI client (one connection pool for explanations and
+    chat), created on first use: the SDK import and the key are only
+    needed once a request is made.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+@lru_cache(maxsize=None)
+def retryable_errors() -> Tuple[type, ...]:
+    from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+    return (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, asyncio.TimeoutError)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 SYSTEM_PROMPT = """
 You are a Senior telecom troubleshooting engineer.
@@ -31,17 +79,18 @@ def explain_call(call_context: dict, question: Optional[str] = None) -> str:
     }
 
     try:
-        response = client.chat.completions.create(
-             model="gpt-4o",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {
-                    "role": "user",
-                    "content": json.dumps(payload, indent=2)
-                }
-            ],
-            temperature=0.2,
-        )
+        with span("openai.request"):
+            response = get_client().chat.completions.create(
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {
+                        "role": "user",
+                        "content": json.dumps(payload, indent=2)
+                    }
+                ],
+                temperature=0.2,
+            )
 
         return response.choices[0].message.content.strip()
 
@@ -61,8 +110,8 @@ Rules:
 - Use professional telecom language.
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o",  
+    response = get_client().chat.completions.create(
+        model=MODEL,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": json.dumps(file_context, indent=2)}
@@ -71,3 +120,196 @@ Rules:
     )
 
     return response.choices[0].message.content.strip()
+
+
+# -----------------------------
+# Concurrent fan-out (many calls)
+# -----------------------------
+BATCH_INSTRUCTIONS = """
+You receive several independent call analyses, each with a "ref".
+Answer EACH one separately, following the rules above.
+Return a JSON object: {"explanations": {"<ref>": "<explanation>", ...}}
+with exactly one entry per ref.
+"""
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after")) + random.uniform(0, AI_BACKOFF_SEC)
+    except (TypeError, ValueError):
+        # full jitter: spreads the retries of a whole fan-out over the window
+        return random.uniform(0, AI_BACKOFF_SEC * (2 ** attempt))
+
+
+async def _complete(ai: "AsyncOpenAI", semaphore: asyncio.Semaphore, messages: List[Dict[str, str]], **kwargs) -> str:
+    for attempt in range(AI_MAX_RETRIES + 1):
+        async with semaphore:
+            try:
+                with span("openai.request"):
+                    response = await asyncio.wait_for(
+                        ai.chat.completions.create(
+                            model=MODEL,
+                            messages=messages,
+                            temperature=0.2,
+                            **kwargs
+                        ),
+                        timeout=AI_TIMEOUT_SEC,
+                    )
+                return response.choices[0].message.content.strip()
+            except retryable_errors() as e:
+                if attempt == AI_MAX_RETRIES:
+                    raise
+                delay = _retry_delay(e, attempt)
+
+        # back off outside the semaphore so other calls keep flowing
+        await asyncio.sleep(delay)
+
+
+async def _explain_one(ai: "AsyncOpenAI", semaphore: asyncio.Semaphore, call_context: dict, question: str) -> str:
+    payload = {"analysis": call_context, "question": question}
+    try:
+        return await _complete(ai, semaphore, [
+            {"role": "system", "content": SYSTEM_PROMPT + PLACEHOLDER_RULES},
+            {"role": "user", "content": json.dumps(payload, indent=2)}
+        ])
+    except Exception as e:
+        return f"{AI_FAILED_PREFIX} {str(e)}"
+
+
+async def _explain_batch(ai: "AsyncOpenAI", semaphore: asyncio.Semaphore, calls: List[dict], question: str) -> List[Optional[str]]:
+    """
+    One request for several small calls. Calls missing from the answer
+    come back as None (the caller explains them individually).
+    """
+    payload = {
+        "question": question,
+        "calls": [{"ref": f"c{i}", "analysis": call} for i, call in enumerate(calls)]
+    }
+    try:
+        answer = await _complete(ai, semaphore, [
+            {"role": "system", "content": SYSTEM_PROMPT + PLACEHOLDER_RULES + BATCH_INSTRUCTIONS},
+            {"role": "user", "content": json.dumps(payload)}
+        ], response_format={"type": "json_object"})
+        explanations = json.loads(answer).get("explanations", {})
+    except Exception as e:
+        print("⚠️ Batched AI explanation failed:", e)
+        explanations = {}
+
+    out: List[Optional[str]] = []
+    for i in range(len(calls)):
+        text = explanations.get(f"c{i}")
+        out.append(text.strip() if isinstance(text, str) and text.strip() else None)
+    return out
+
+
+async def _fan_out(
+    calls: List[dict],
+    question: str,
+    on_result: Callable[[int, str], None],
+) -> None:
+    """
+    Explains many calls concurrently (at most AI_CONCURRENCY requests in
+    flight). Small calls are packed AI_BATCH_SIZE per request, large ones
+    go alone. on_result(index, text) fires as each one lands.
+    """
+    semaphore = asyncio.Semaphore(AI_CONCURRENCY)
+    # Client per fan-out: its connection pool belongs to this event loop.
+    # Retries are ours (jittered, Retry-After aware), not the SDK's.
+    from openai import AsyncOpenAI
+    ai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+    async def run_single(i: int) -> None:
+        on_result(i, await _explain_one(ai, semaphore, calls[i], question))
+
+    async def run_batch(indices: List[int]) -> None:
+        texts = await _explain_batch(ai, semaphore, [calls[i] for i in indices], question)
+        missing = []
+        for i, text in zip(indices, texts):
+            if text is None:
+                missing.append(run_single(i))
+            else:
+                on_result(i, text)
+        await asyncio.gather(*missing)
+
+    small: List[int] = []
+    tasks = []
+    for i, call in enumerate(calls):
+        if AI_BATCH_SIZE > 1 and len(json.dumps(call, default=str)) <= AI_BATCH_MAX_CHARS:
+            small.append(i)
+        else:
+            tasks.append(run_single(i))
+
+    for start in range(0, len(small), AI_BATCH_SIZE):
+        chunk = small[start:start + AI_BATCH_SIZE]
+        tasks.append(run_batch(chunk) if len(chunk) > 1 else run_single(chunk[0]))
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await ai.close()
+
+
+async def explain_calls_async(
+    calls: List[dict],
+    question: Optional[str] = None,
+    on_result: Optional[Callable[[int, str], None]] = None,
+) -> List[str]:
+    """
+    Per-call explanations, in input order; on_result(index, text) fires as
+    each one lands.
+
+    Calls are reduced to their explanation signature first: structurally
+    identical calls share one answer, cached answers cost no request, and
+    only the remaining distinct shapes are fanned out. Call-specific
+    identifiers are filled back into every answer.
+    """
+    question = question or "Explain the call failure clearly."
+    results: List[Optional[str]] = [None] * len(calls)
+
+    def _done(i: int, text: str) -> None:
+        results[i] = text
+        if on_result:
+            on_result(i, text)
+
+    signatures = [explanation_signature(call, question, MODEL) for call in calls]
+    groups: Dict[str, List[int]] = {}
+    for i, sig in enumerate(signatures):
+        groups.setdefault(sig.key, []).append(i)
+
+    pending: List[List[int]] = []
+    for key, indices in groups.items():
+        text = explanation_cache.get(key)
+        if text is None:
+            pending.append(indices)
+            continue
+        for i in indices:
+            _done(i, signatures[i].refill(text))
+
+    def _shared(n: int, text: str) -> None:
+        indices = pending[n]
+        if not text.startswith(AI_FAILED_PREFIX):
+            explanation_cache.put(signatures[indices[0]].key, text)
+        for i in indices:
+            _done(i, signatures[i].refill(text))
+
+    if pending:
+        try:
+            await _fan_out([signatures[ix[0]].normalized for ix in pending], question, _shared)
+        except Exception as e:
+            # Best effort (e.g. no API key): unanswered calls get the failure text
+            for n, indices in enumerate(pending):
+                if results[indices[0]] is None:
+                    _shared(n, f"{AI_FAILED_PREFIX} {e}")
+    return results
+
+
+def explain_calls(
+    calls: List[dict],
+    question: Optional[str] = None,
+    on_result: Optional[Callable[[int, str], None]] = None,
+) -> List[str]:
+    """
+    Sync entry point for worker threads (no running event loop there).
+    """
+    return asyncio.run(explain_calls_async(calls, question, on_result))
@@ -0,0 +1,240 @@
+import os
+import tarfile
+import zipfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Dict, Any, BinaryIO, Callable, List, Optional
+
+from upload_stream import save_upload_stream, UploadRejected, MAX_UPLOAD_BYTES
+from file_summary import build_file_summary
+
+CAPTURE_SUFFIXES = (".pcap", ".pcapng")
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+
+# Shared across batch jobs: files analyzed at once, and their summed size
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+BATCH_INFLIGHT_BYTES = int(os.getenv("BATCH_INFLIGHT_BYTES", str(1024 ** 3)))
+
+# Worst first: a Call-ID's merged verdict is its worst leg
+VERDICT_SEVERITY = ["SIP_FAILURE", "MEDIA_FAILURE", "MEDIA_DEGRADED", "SUCCESS"]
+
+
+@dataclass
+class BatchFile:
+    index: int
+    name: str
+    path: str
+    size: int
+    sha256: str
+
+
+class BatchInputs:
+    """
+    Lays out the captures of one batch job as files/<i>/capture.<ext>
+    (each file dir works like a single-capture job dir: exports, frame
+    manifest). Uploads may be captures or zip/tar archives of captures;
+    file count and total bytes are capped across all of them.
+    Blocking: run in a worker thread.
+    """
+
+    def __init__(self, job_dir: str, max_files: int = BATCH_MAX_FILES, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.job_dir = job_dir
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.files: List[BatchFile] = []
+        self.skipped: List[str] = []   # archive members that are not captures
+        self.total_bytes = 0
+
+    def file_dir(self, index: int) -> str:
+        return os.path.join(self.job_dir, "files", str(index))
+
+    def add_upload(self, name: str, source: BinaryIO) -> None:
+        lower = name.lower()
+        if lower.endswith(CAPTURE_SUFFIXES):
+            self.add_capture(name, source)
+        elif lower.endswith(ARCHIVE_SUFFIXES):
+            self.add_archive(name, source)
+        else:
+            raise UploadRejected(400, f"Only pcap/pcapng or zip/tar of captures supported: {name}")
+
+    def add_capture(self, name: str, source: BinaryIO) -> BatchFile:
+        if len(self.files) >= self.max_files:
+            raise UploadRejected(413, f"Batch exceeds {self.max_files} captures")
+
+        index = len(self.files)
+        file_dir = self.file_dir(index)
+        os.makedirs(file_dir, exist_ok=True)
+        path = os.path.join(file_dir, "capture" + os.path.splitext(name)[1].lower())
+
+        try:
+            saved = save_upload_stream(source, path, self.max_bytes - self.total_bytes)
+        except UploadRejected as e:
+            raise UploadRejected(e.status_code, f"{name}: {e.detail}")
+
+        self.total_bytes += saved.size
+        batch_file = BatchFile(index=index, name=name, path=path, size=saved.size, sha256=saved.sha256)
+        self.files.append(batch_file)
+        return batch_file
+
+    def add_archive(self, name: str, source: BinaryIO) -> None:
+        # Members are streamed out one by one (size / magic checked as they copy)
+        try:
+            if name.lower().endswith(".zip"):
+                with zipfile.ZipFile(source) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir():
+                            continue
+                        if not info.filename.lower().endswith(CAPTURE_SUFFIXES):
+                            self.skipped.append(f"{name}/{info.filename}")
+                            continue
+                        with archive.open(info) as member:
+                            self.add_capture(f"{name}/{info.filename}", member)
+            else:
+                with tarfile.open(fileobj=source, mode="r:*") as archive:
+                    for info in archive:
+                        if not info.isfile():
+                            continue
+                        if not info.name.lower().endswith(CAPTURE_SUFFIXES):
+                            self.skipped.append(f"{name}/{info.name}")
+                            continue
+                        member = archive.extractfile(info)
+                        if member is not None:
+                            self.add_capture(f"{name}/{info.name}", member)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+            raise UploadRejected(400, f"{name}: unreadable archive ({e})")
+
+
+class BatchPool:
+    """
+    Worker pool shared by all batch jobs. Files are started largest
+    first, and a file only starts while the summed size of the files in
+    flight stays within max_inflight_bytes (a file larger than the whole
+    budget runs alone), so a batch of big captures does not run all at
+    once while small ones still pack in.
+    """
+
+    def __init__(self, workers: int = BATCH_WORKERS, max_inflight_bytes: int = BATCH_INFLIGHT_BYTES):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+        self.workers = workers
+        self.max_inflight_bytes = max_inflight_bytes
+        self._inflight_bytes = 0
+        self._running = 0
+        self._cond = threading.Condition()
+
+    def _run(self, size: int, fn: Callable[[BatchFile], Any], batch_file: BatchFile) -> Any:
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._running == 0 or self._inflight_bytes + size <= self.max_inflight_bytes
+            )
+            self._inflight_bytes += size
+            self._running += 1
+        try:
+            return fn(batch_file)
+        finally:
+            with self._cond:
+                self._inflight_bytes -= size
+                self._running -= 1
+                self._cond.notify_all()
+
+    def map(
+        self,
+        files: List[BatchFile],
+        fn: Callable[[BatchFile], Any],
+        on_result: Optional[Callable[[BatchFile, Any, Optional[BaseException]], None]] = None,
+    ) -> List[Any]:
+        """
+        fn(file) for every file; results (or raised exceptions) come back
+        in input order. on_result fires as each file finishes.
+        """
+        futures = {}
+        for batch_file in sorted(files, key=lambda f: f.size, reverse=True):
+            # Per-file context copy: spans land in the calling job's timings
+            ctx = contextvars.copy_context()
+            futures[self._executor.submit(ctx.run, self._run, batch_file.size, fn, batch_file)] = batch_file
+
+        results: Dict[int, Any] = {}
+        for future in as_completed(futures):
+            batch_file = futures[future]
+            error = future.exception()
+            results[batch_file.index] = error if error is not None else future.result()
+            if on_result:
+                on_result(batch_file, results[batch_file.index], error)
+
+        return [results[f.index] for f in files]
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "running": self._running,
+                "inflight_bytes": self._inflight_bytes,
+                "workers": self.workers,
+                "max_inflight_bytes": self.max_inflight_bytes,
+            }
+
+
+batch_pool = BatchPool()
+
+
+# -----------------------------
+# Cross-file views
+# -----------------------------
+def _worst(verdicts: List[str]) -> str:
+    ranked = [v for v in VERDICT_SEVERITY if v in verdicts]
+    return ranked[0] if ranked else verdicts[0]
+
+
+def correlate_calls(files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Call-IDs seen in more than one capture, from the per-file call
+    records (no re-extraction). Each leg keeps its own verdict; the
+    merged verdict is the worst leg.
+    """
+    legs: Dict[str, List[Dict[str, Any]]] = {}
+    for f in files:
+        for call in f.get("calls", []):
+            legs.setdefault(call["call_id"], []).append({
+                "file_index": f["index"],
+                "file": f["file"],
+                "final_verdict": call.get("final_verdict"),
+                "root_cause": call.get("root_cause"),
+                "invite_packet": call.get("invite_packet"),
+                "failure_packet": call.get("failure_packet"),
+            })
+
+    correlated = []
+    for call_id, seen in legs.items():
+        if len({leg["file_index"] for leg in seen}) < 2:
+            continue
+        merged = _worst([leg["final_verdict"] for leg in seen])
+        correlated.append({
+            "call_id": call_id,
+            "merged_verdict": merged,
+            "failing_files": [leg["file"] for leg in seen if leg["final_verdict"] != "SUCCESS"],
+            "legs": seen,
+        })
+    return correlated
+
+
+def merge_file_summary(files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    build_file_summary over distinct Call-IDs across all captures (a call
+    seen in several captures counts once, with its worst verdict), plus
+    batch counters.
+    """
+    verdicts: Dict[str, List[str]] = {}
+    for f in files:
+        for call in f.get("calls", []):
+            verdicts.setdefault(call["call_id"], []).append(call.get("final_verdict"))
+
+    summary = build_file_summary({"calls": [{"final_verdict": _worst(v)} for v in verdicts.values()]})
+    summary.update(
+        total_files=len(files),
+        failed_files=sum(1 for f in files if f.get("status") == "failed"),
+        total_call_legs=sum(len(v) for v in verdicts.values()),
+        correlated_calls=sum(1 for v in verdicts.values() if len(v) > 1),
+    )
+    return summary
@@ -0,0 +1,335 @@
+"""
+Stage-level benchmark of analyze_pcap_calls on generated captures.
+
+    python benchmark.py                       # small + medium, compare to baselines
+    python benchmark.py --sizes large         # large only
+    python benchmark.py --update-baselines    # record current numbers
+    python benchmark.py --sizes none          # API worker startup only
+
+Each size runs in its own interpreter, so peak RSS is per size. Exits 1
+when a stage (or peak RSS) regresses past BENCH_TOLERANCE over its
+stored baseline, or when API worker startup misses STARTUP_TARGET_SEC.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import platform
+import resource
+import argparse
+import subprocess
+import tempfile
+from collections import Counter
+from dataclasses import asdict
+from typing import Dict, Any, List, Optional
+
+from pcap_exporter import OUTPUT_DIR
+from synthetic_capture import SyntheticProfile, generate_capture
+
+BENCH_DIR = os.path.join(OUTPUT_DIR, "bench")
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines.json")
+
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))   # +25% over baseline fails
+BENCH_MIN_DELTA_SEC = 0.05                                        # ignore jitter on tiny stages
+BENCH_REPEAT = 3
+
+# Cold API worker boot (fresh interpreter, `import main`, no cloud credentials)
+STARTUP_TARGET_SEC = float(os.getenv("STARTUP_TARGET_SEC", "1.0"))
+CLOUD_ENV_VARS = ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "OPENAI_API_KEY")
+
+SIZES = {
+    "small": SyntheticProfile(calls=20, call_duration_sec=5, concurrency=5),
+    "medium": SyntheticProfile(calls=200, call_duration_sec=10, concurrency=20),
+    "large": SyntheticProfile(calls=1000, call_duration_sec=20, concurrency=50),
+}
+DEFAULT_SIZES = ["small", "medium"]
+
+# Reported in pipeline order
+STAGES = [
+    "packet_counts",     # frame index (offsets + total frames)
+    "capture_read",      # single decode pass: SIP records + RTP columns + stats
+    "sip_extraction",    # Call-ID grouping + per-call summaries
+    "rtp_extraction",    # SDP routing + time index for unrouted media
+    "scoping",           # per-call media selection
+    "rtp_analysis",      # direction + per-SSRC quality
+    "timeline",
+    "export",            # failing-call pcaps
+    "file_summary",
+]
+
+
+def capture_for(size: str) -> Dict[str, Any]:
+    """
+    Generated once per profile, reused across runs (output is deterministic).
+    """
+    profile = SIZES[size]
+    digest = hashlib.sha256(json.dumps(asdict(profile), sort_keys=True).encode()).hexdigest()[:12]
+    path = os.path.join(BENCH_DIR, f"{size}-{digest}.pcap")
+    manifest_path = f"{path}.json"
+
+    if os.path.exists(path) and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    manifest = generate_capture(path, profile)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def _timed(timings: Dict[str, float], stage: str, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+    return result
+
+
+def run_stages(pcap_file: str, failing: List[str], output_dir: str) -> Dict[str, float]:
+    """
+    The analyze_pcap_calls steps, each timed on its own.
+    """
+    from packet_index import build_packet_index
+    from capture_extractor import extract_capture
+    from sip_parser import extract_sip_calls, build_call_summary
+    from media_index import route_media
+    from rtp_index import RtpTimeIndex
+    from rtp_parser import analyze_rtp_direction
+    from rtp_stats import analyze_rtp_streams, summarize_rtp_quality
+    from timeline_builder import build_timeline
+    from pcap_exporter import export_calls
+    from file_summary import build_file_summary
+
+    t: Dict[str, float] = {}
+
+    _timed(t, "packet_counts", build_packet_index, pcap_file)
+    capture = _timed(t, "capture_read", extract_capture, pcap_file)
+
+    def summarize(packets):
+        calls = extract_sip_calls(packets)
+        return {cid: build_call_summary(cid, events) for cid, events in calls.items()}
+
+    summaries = _timed(t, "sip_extraction", summarize, capture["sip_packets"])
+
+    def index_media(sip_packets, rtp_packets):
+        rtp_by_call, unrouted = route_media(sip_packets, rtp_packets)
+        return rtp_by_call, RtpTimeIndex(unrouted)
+
+    rtp_by_call, rtp_index = _timed(t, "rtp_extraction", index_media, capture["sip_packets"], capture["rtp_packets"])
+
+    def scope(events):
+        if any(e.get("media") for e in events):
+            return rtp_by_call.get(events[0]["call_id"], rtp_index.packets[:0])
+        return rtp_index.window(events[0]["time"], events[-1]["time"])
+
+    def analyze(rtp_packets):
+        result = analyze_rtp_direction(rtp_packets)
+        result["streams"] = analyze_rtp_streams(rtp_packets)
+        result["quality"] = summarize_rtp_quality(result["streams"])
+        return result
+
+    call_frames: Dict[str, List[int]] = {}
+    calls: List[Dict[str, Any]] = []
+    for call_id, summary in summaries.items():
+        events = summary["events"]
+        rtp_packets = _timed(t, "scoping", scope, events)
+        rtp_result = _timed(t, "rtp_analysis", analyze, rtp_packets)
+        _timed(t, "timeline", build_timeline, events, rtp_packets)
+        call_frames[call_id] = [e["frame"] for e in events] + rtp_packets.frame.tolist()
+        calls.append({"call_id": call_id, "final_verdict": "SIP_FAILURE" if call_id in failing else "SUCCESS", "rtp": rtp_result})
+
+    _timed(t, "export", export_calls, pcap_file, {cid: call_frames[cid] for cid in failing}, output_dir)
+    _timed(t, "file_summary", build_file_summary, {"calls": calls})
+    return t
+
+
+def run_size(size: str, repeat: int) -> Dict[str, Any]:
+    """
+    Child-process entry point: best-of-`repeat` per stage + end to end.
+    """
+    from call_analyzer import analyze_pcap_calls
+    import pcap_exporter
+
+    manifest = capture_for(size)
+    pcap_file = manifest["path"]
+
+    best: Dict[str, float] = {}
+    verdicts: Optional[Dict[str, int]] = None
+
+    for _ in range(repeat):
+        output_dir = tempfile.mkdtemp(prefix=f"bench-{size}-")
+        try:
+            pcap_exporter._index_cache.clear()  # measure cold, like a fresh upload
+            started = time.perf_counter()
+            analysis = analyze_pcap_calls(pcap_file, output_dir)
+            elapsed = time.perf_counter() - started
+            best["end_to_end"] = min(best.get("end_to_end", elapsed), elapsed)
+
+            verdicts = dict(Counter(c["final_verdict"] for c in analysis["calls"]))
+            failing = [c["call_id"] for c in analysis["calls"] if c["final_verdict"] != "SUCCESS"]
+
+            pcap_exporter._index_cache.clear()
+            for stage, seconds in run_stages(pcap_file, failing, output_dir).items():
+                best[stage] = min(best.get(stage, seconds), seconds)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    total = best["end_to_end"]
+
+    return {
+        "size": size,
+        "packets": manifest["packets"],
+        "calls": manifest["profile"]["calls"],
+        "mb": round(manifest["bytes"] / 1e6, 1),
+        "verdicts_ok": verdicts == manifest["expected_verdicts"],
+        "end_to_end_sec": round(total, 4),
+        "packets_per_sec": round(manifest["packets"] / total),
+        "calls_per_sec": round(manifest["profile"]["calls"] / total, 1),
+        "stages": {stage: round(best[stage], 4) for stage in STAGES},
+        # ru_maxrss is KB on Linux, bytes on macOS
+        "peak_rss_mb": round(usage.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024), 1),
+        "children_peak_rss_mb": round(children.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024), 1),
+    }
+
+
+def _run_isolated(size: str, repeat: int) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", size, "--repeat", str(repeat)],
+        capture_output=True,
+        text=True,
+        cwd=os.getcwd(),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark [{size}] failed:\n{proc.stderr[-4000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure_startup(repeat: int) -> Dict[str, Any]:
+    """
+    Best-of-`repeat` API worker boot: whole process (interpreter start,
+    `import main`, exit) and the import alone. Cloud credentials are
+    removed from the environment: boot must not need them.
+    """
+    env = {k: v for k, v in os.environ.items() if k not in CLOUD_ENV_VARS}
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    api_dir = os.path.dirname(os.path.abspath(__file__))
+
+    best_process = best_import = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=api_dir)
+        elapsed = time.perf_counter() - started
+        if proc.returncode != 0:
+            raise RuntimeError(f"API import failed:\n{proc.stderr[-4000:]}")
+        best_process = min(best_process, elapsed)
+        best_import = min(best_import, float(proc.stdout.strip().splitlines()[-1]))
+
+    return {
+        "process_sec": round(best_process, 4),
+        "import_sec": round(best_import, 4),
+        "target_sec": STARTUP_TARGET_SEC,
+        "ok": best_process <= STARTUP_TARGET_SEC,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Regressions of one size against its baseline (empty list = pass).
+    """
+    regressions = []
+
+    measured = dict(result["stages"], end_to_end=result["end_to_end_sec"])
+    expected = dict(baseline.get("stages", {}), end_to_end=baseline.get("end_to_end_sec"))
+    for stage, seconds in measured.items():
+        base = expected.get(stage)
+        if base is None:
+            continue
+        if seconds > base * (1 + tolerance) and seconds - base > BENCH_MIN_DELTA_SEC:
+            regressions.append(f"{result['size']}.{stage}: {seconds:.3f}s vs baseline {base:.3f}s")
+
+    base_rss = baseline.get("peak_rss_mb")
+    if base_rss and result["peak_rss_mb"] > base_rss * (1 + tolerance):
+        regressions.append(f"{result['size']}.peak_rss: {result['peak_rss_mb']} MB vs baseline {base_rss} MB")
+
+    return regressions
+
+
+def _host() -> Dict[str, Any]:
+    return {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage-level analysis benchmark")
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES), help=f"comma-separated, from {list(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=BENCH_REPEAT)
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE)
+    parser.add_argument("--baselines", default=BASELINES_FILE)
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_size(args.child, args.repeat)))
+        return
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip() and s.strip() != "none"]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        print(f"Unknown sizes: {unknown} (known: {list(SIZES)})")
+        sys.exit(2)
+
+    try:
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    except (OSError, ValueError):
+        baselines = {"host": None, "sizes": {}}
+
+    results = []
+    regressions: List[str] = []
+    for size in sizes:
+        capture_for(size)  # generate outside the timed child
+        result = _run_isolated(size, args.repeat)
+        results.append(result)
+
+        if not result["verdicts_ok"]:
+            regressions.append(f"{size}: verdicts differ from the generated scenarios")
+        if size in baselines["sizes"] and not args.update_baselines:
+            regressions.extend(compare(result, baselines["sizes"][size], args.tolerance))
+
+    startup = measure_startup(args.repeat)
+    if not startup["ok"]:
+        regressions.append(f"startup: {startup['process_sec']:.3f}s vs target {STARTUP_TARGET_SEC:.3f}s")
+    base_startup = baselines.get("startup")
+    if base_startup and not args.update_baselines:
+        base = base_startup["import_sec"]
+        if startup["import_sec"] > base * (1 + args.tolerance) and startup["import_sec"] - base > BENCH_MIN_DELTA_SEC:
+            regressions.append(f"startup.import: {startup['import_sec']:.3f}s vs baseline {base:.3f}s")
+
+    print(json.dumps({"host": _host(), "baseline_host": baselines.get("host"), "startup": startup, "runs": results}, indent=2))
+
+    if args.update_baselines:
+        baselines["host"] = _host()
+        baselines["startup"] = {"import_sec": startup["import_sec"], "process_sec": startup["process_sec"]}
+        for result in results:
+            baselines["sizes"][result["size"]] = {
+                "end_to_end_sec": result["end_to_end_sec"],
+                "stages": result["stages"],
+                "peak_rss_mb": result["peak_rss_mb"],
+            }
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"✅ Baselines written: {args.baselines}")
+
+    if regressions:
+        print("❌ Regressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
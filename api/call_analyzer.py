@@ -1,129 +1,139 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, List, Optional
 import os
 
-from sip_parser import (
-    extract_sip_packets,
-    extract_sip_calls,
-    build_call_summary
-)
-from rtp_parser import extract_rtp_packets, analyze_rtp_direction
+from sip_parser import build_call_summary
+from sip_dialog import SipDialogTracker
+from rtp_parser import analyze_rtp_direction
+from rtp_stats import analyze_rtp_streams, summarize_rtp_quality
+from rtp_index import RtpTimeIndex
+from media_index import route_media
 from timeline_builder import build_timeline
-from pcap_exporter import export_failing_call
+from pcap_exporter import OUTPUT_DIR, export_calls, save_call_frames
 from file_summary import build_file_summary
-from tshark_runner import get_packet_counts
+from capture_extractor import extract_capture
+from packet_store import RtpColumns
+from metrics import span
 
+# Bump whenever analysis output changes: cached results are keyed on it.
+ANALYZER_VERSION = "mvp1-rtpq2"
 
-def analyze_pcap_calls(pcap_file: str) -> Dict[str, Any]:
+
+def analyze_pcap_calls(
+    pcap_file: str,
+    output_dir: str = OUTPUT_DIR,
+    on_call: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
     """
     MVP-1 PCAP Analyzer
 
     Responsibilities:
     - SIP signaling analysis (source of truth)
-    - RTP presence + direction (no quality yet)
+    - RTP presence + direction, routed to calls via SDP
+    - RTP stream quality per SSRC (loss, jitter, gaps)
     - Timeline construction
-    - Export failing calls
-    - File-level summary + packet stats
+    - Export failing calls (one batched sweep, call-scoped frames)
+    - File-level summary + packet stats + capture context
+
+    SIP, RTP, packet counts and context all come from ONE tshark pass.
+    Calls are analyzed as the SIP dialog tracker finishes them (capture
+    order), so per-call state follows concurrent calls. on_call(call)
+    fires as each call is analyzed (its export block is filled in place
+    after the loop).
     """
 
-    # -----------------------------
-    # 1️⃣ SIP analysis (SOURCE OF TRUTH)
-    # -----------------------------
-    sip_packets = extract_sip_packets(pcap_file)
-    sip_calls = extract_sip_calls(sip_packets)
+    with span("analysis.capture_read"):
+        capture = extract_capture(pcap_file)
 
     # -----------------------------
-    # 2️⃣ RTP packets (parsed once)
+    # 1️⃣ RTP packets (parsed once, routed to calls by SDP endpoint)
     # -----------------------------
-    all_rtp_packets = extract_rtp_packets(pcap_file)
+    with span("analysis.rtp_extraction"):
+        rtp_by_call, unrouted_rtp = route_media(capture["sip_packets"], capture["rtp_packets"])
+
+        # Calls without SDP fall back to time-window scoping over unrouted media
+        rtp_index = RtpTimeIndex(unrouted_rtp)
 
     final_calls: List[Dict[str, Any]] = []
+    position: Dict[str, int] = {}   # call_id -> index in final_calls
 
-    # Ensure output directory exists
-    os.makedirs("output", exist_ok=True)
+    # call_id -> own SIP + media frames (exports, on-demand downloads)
+    call_frames: Dict[str, List[int]] = {}
 
-    # -----------------------------
-    # 3️⃣ Per-call processing
-    # -----------------------------
-    for call_id, events in sip_calls.items():
-        if not events:
-            continue  # safety guard
+    # Ensure output directory exists
+    os.makedirs(output_dir, exist_ok=True)
 
-        summary = build_call_summary(call_id, events)
+    def finish(call_id: str, events: List[Dict[str, Any]]) -> None:
+        events.sort(key=lambda x: (x["time"], x["frame"]))
 
-        # ---- SIP time window ----
-        start_time = events[0]["time"]
-        end_time = events[-1]["time"]
+        if call_id in position:
+            # Call-ID reopened after its dialog timed out (rare): one
+            # record per Call-ID, re-analyzed over all of its packets
+            events = sorted(
+                (p for p in capture["sip_packets"] if p["call_id"] == call_id),
+                key=lambda x: (x["time"], x["frame"]),
+            )
 
-        # ---- RTP scoped to SIP window ----
-        rtp_packets = [
-            r for r in all_rtp_packets
-            if start_time <= r["time"] <= end_time
-        ]
+        # ---- RTP owned by this call (SDP), else scoped to SIP window ----
+        with span("analysis.scoping"):
+            if any(e.get("media") for e in events):
+                rtp_packets = rtp_by_call.get(call_id, rtp_index.packets[:0])
+            else:
+                rtp_packets = rtp_index.window(events[0]["time"], events[-1]["time"])
 
-        rtp_result = analyze_rtp_direction(rtp_packets)
+        call = analyze_call(call_id, events, rtp_packets)
 
         # -----------------------------
-        # 4️⃣ Final verdict logic (LOCKED FOR MVP-1)
+        # Frames owned by this call (exported after the loop)
         # -----------------------------
-        if summary.get("failure_packet"):
-            final_verdict = "SIP_FAILURE"
-            protocol = "SIP"
-            failure_stage = "SIP"
-
-        elif not rtp_result["rtp_present"]:
-            final_verdict = "MEDIA_FAILURE"
-            protocol = "RTP"
-            failure_stage = "RTP"
-
-        elif rtp_result["direction"] == "ONE_WAY":
-            final_verdict = "MEDIA_DEGRADED"
-            protocol = "RTP"
-            failure_stage = "RTP"
-
-        else:
-            final_verdict = "SUCCESS"
-            protocol = "NONE"
-            failure_stage = "NONE"
+        call_frames[call_id] = (
+            [e["frame"] for e in events] + rtp_packets.frame.tolist()
+        )
 
-        # -----------------------------
-        # 5️⃣ Timeline (SIP + sampled RTP)
-        # -----------------------------
-        timeline = build_timeline(events, rtp_packets)
+        if call_id in position:
+            final_calls[position[call_id]].update(call)
+            return
 
-        # -----------------------------
-        # 6️⃣ Export failing calls only
-        # -----------------------------
-        export_info = {"pcap_available": False}
+        position[call_id] = len(final_calls)
+        final_calls.append(call)
+        if on_call:
+            on_call(call)
 
-        if final_verdict != "SUCCESS":
-            export_info = export_failing_call(
-                pcap_file=pcap_file,
-                call_id=call_id,
-            )
+    # -----------------------------
+    # 2️⃣ SIP dialogs (SOURCE OF TRUTH), analyzed as each one finishes
+    # -----------------------------
+    tracker = SipDialogTracker(keep_events=True)
+    for pkt in capture["sip_packets"]:
+        for dialog in tracker.feed(pkt):
+            finish(dialog.call_id, dialog.events)
+    for dialog in tracker.flush():
+        finish(dialog.call_id, dialog.events)
 
-        final_calls.append({
-            "call_id": call_id,
-            "final_verdict": final_verdict,
-            "root_cause": summary.get("root_cause"),
-            "failure_stage": failure_stage,
-            "protocol_responsible": protocol,
-            "invite_packet": summary.get("invite_packet"),
-            "ok_200_packet": summary.get("ok_200_packet"),
-            "failure_packet": summary.get("failure_packet"),
-            "invite_to_200_latency_sec": summary.get("invite_to_200_latency_sec"),
-            "rtp": rtp_result,
-            "timeline": timeline,
-            "export": export_info
-        })
+    failing_call_ids = [c["call_id"] for c in final_calls if c["final_verdict"] != "SUCCESS"]
+
+    # -----------------------------
+    # 6️⃣ Export failing calls only (single sweep)
+    # -----------------------------
+    with span("analysis.export"):
+        exports = export_calls(
+            pcap_file,
+            {cid: call_frames[cid] for cid in failing_call_ids},
+            output_dir,
+        )
+        for call in final_calls:
+            if call["call_id"] in exports:
+                call["export"] = exports[call["call_id"]]
+
+        save_call_frames(output_dir, call_frames)
 
     # -----------------------------
     # 7️⃣ FILE-LEVEL METRICS
     # -----------------------------
-    file_summary = build_file_summary({
-        "calls": final_calls
-    })
+    with span("analysis.file_summary"):
+        file_summary = build_file_summary({
+            "calls": final_calls
+        })
 
-    packet_stats = get_packet_counts(pcap_file)
+    packet_stats = capture["packet_stats"]
 
     # -----------------------------
     # 8️⃣ Final response (API + AI ready)
@@ -132,6 +142,96 @@ def analyze_pcap_calls(pcap_file: str) -> Dict[str, Any]:
         "pcap": pcap_file,
         "file_summary": file_summary,
         "packet_stats": packet_stats,
+        "capture_context": capture["context"],
         "total_calls": len(final_calls),
         "calls": final_calls
     }
+
+
+def analyze_call(call_id: str, events: List[Dict[str, Any]], rtp_packets: RtpColumns) -> Dict[str, Any]:
+    """
+    One call's record from its SIP events (time-ordered) and its RTP.
+    Shared by the batch analyzer and live mode (live_analyzer).
+    """
+    summary = build_call_summary(call_id, events)
+
+    with span("analysis.rtp_analysis"):
+        rtp_result = analyze_rtp_direction(rtp_packets)
+
+        # ---- Per-SSRC stream quality (loss / jitter / gaps) ----
+        rtp_result["streams"] = analyze_rtp_streams(rtp_packets)
+        rtp_result["quality"] = summarize_rtp_quality(rtp_result["streams"])
+
+    # -----------------------------
+    # 4️⃣ Final verdict logic (LOCKED FOR MVP-1)
+    # -----------------------------
+    if summary.get("failure_packet"):
+        final_verdict = "SIP_FAILURE"
+        protocol = "SIP"
+        failure_stage = "SIP"
+
+    elif not rtp_result["rtp_present"]:
+        final_verdict = "MEDIA_FAILURE"
+        protocol = "RTP"
+        failure_stage = "RTP"
+
+    elif rtp_result["direction"] == "ONE_WAY" or rtp_result["quality"]["degraded"]:
+        final_verdict = "MEDIA_DEGRADED"
+        protocol = "RTP"
+        failure_stage = "RTP"
+
+    else:
+        final_verdict = "SUCCESS"
+        protocol = "NONE"
+        failure_stage = "NONE"
+
+    # -----------------------------
+    # 5️⃣ Timeline (SIP + sampled RTP)
+    # -----------------------------
+    with span("analysis.timeline"):
+        timeline = build_timeline(events, rtp_packets)
+
+    return {
+        "call_id": call_id,
+        "final_verdict": final_verdict,
+        "root_cause": summary.get("root_cause"),
+        "failure_stage": failure_stage,
+        "protocol_responsible": protocol,
+        "invite_packet": summary.get("invite_packet"),
+        "ok_200_packet": summary.get("ok_200_packet"),
+        "failure_packet": summary.get("failure_packet"),
+        "invite_to_200_latency_sec": summary.get("invite_to_200_latency_sec"),
+        "rtp": rtp_result,
+        "timeline": timeline,
+        "export": {"pcap_available": False}
+    }
+
+
+def restore_cached_analysis(
+    pcap_file: str,
+    cached: Dict[str, Any],
+    output_dir: str = OUTPUT_DIR,
+) -> Dict[str, Any]:
+    """
+    Re-homes a cached analysis onto a new upload of the same capture:
+    frame manifest + failing-call exports are rebuilt from the packet
+    index (no tshark, no dissection).
+    """
+    analysis = cached["analysis"]
+    call_frames = cached.get("call_frames", {})
+
+    save_call_frames(output_dir, call_frames)
+
+    failing = {
+        c["call_id"]: call_frames.get(c["call_id"], [])
+        for c in analysis.get("calls", [])
+        if c.get("final_verdict") != "SUCCESS"
+    }
+    with span("analysis.export"):
+        exports = export_calls(pcap_file, failing, output_dir)
+
+    for call in analysis.get("calls", []):
+        call["export"] = exports.get(call["call_id"], {"pcap_available": False})
+
+    analysis["pcap"] = pcap_file
+    return analysis
@@ -0,0 +1,71 @@
+from typing import Dict, Any, Callable, List, Optional
+
+# fields=summary: verdict-level view, no timeline / per-stream RTP / export
+SUMMARY_FIELDS = [
+    "call_id",
+    "final_verdict",
+    "root_cause",
+    "failure_stage",
+    "protocol_responsible",
+    "invite_packet",
+    "ok_200_packet",
+    "failure_packet",
+    "invite_to_200_latency_sec",
+    "ai_explanation",
+    "file_index",   # batch jobs
+    "file",
+]
+SUMMARY_RTP_FIELDS = ["rtp_present", "direction", "total_packets"]
+
+FAILING = "failing"
+SUCCESS = "success"
+
+MAX_PAGE_SIZE = 1000
+
+
+def call_filter(verdict: Optional[str] = None, status: Optional[str] = None) -> Optional[Callable[[Dict[str, Any]], bool]]:
+    """
+    verdict: comma-separated final verdicts (any case);
+    status: "failing" (any non-SUCCESS verdict) or "success".
+    """
+    verdicts = {v.strip().upper() for v in (verdict or "").split(",") if v.strip()}
+    if status not in (None, "", FAILING, SUCCESS):
+        raise ValueError(f"status must be '{FAILING}' or '{SUCCESS}'")
+    if not verdicts and not status:
+        return None
+
+    def match(call: Dict[str, Any]) -> bool:
+        v = call.get("final_verdict")
+        if verdicts and v not in verdicts:
+            return False
+        if status == FAILING and v == "SUCCESS":
+            return False
+        if status == SUCCESS and v != "SUCCESS":
+            return False
+        return True
+
+    return match
+
+
+def call_projection(fields: Optional[str] = None) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    fields: "full" (default), "summary", or comma-separated top-level keys
+    (call_id is always kept).
+    """
+    if not fields or fields == "full":
+        return lambda call: call
+
+    if fields == "summary":
+        def summary(call: Dict[str, Any]) -> Dict[str, Any]:
+            out = {k: call[k] for k in SUMMARY_FIELDS if k in call}
+            rtp = call.get("rtp")
+            if rtp:
+                out["rtp"] = {k: rtp[k] for k in SUMMARY_RTP_FIELDS if k in rtp}
+                quality = rtp.get("quality")
+                if quality is not None:
+                    out["rtp"]["degraded"] = quality.get("degraded")
+            return out
+        return summary
+
+    keys: List[str] = ["call_id"] + [k.strip() for k in fields.split(",") if k.strip() and k.strip() != "call_id"]
+    return lambda call: {k: call[k] for k in keys if k in call}
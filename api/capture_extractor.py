@@ -0,0 +1,145 @@
+import sys
+import json
+from contextlib import closing
+from typing import Dict, List, Any, Iterator
+
+from tshark_runner import iter_tshark_chunks, detect_context_from_protocols
+from sip_parser import SIP_FIELDS, AGGREGATOR, parse_sip_record
+from rtp_parser import RTP_FIELDS
+from parallel_reader import try_read_capture_sharded
+from sharkd import iter_sharkd_fields
+from packet_store import RtpColumnsBuilder, split_field_rows, first_values
+
+
+# One dissection pass emits everything the SIP, RTP, packet-count and
+# context stages need. frame.number / frame.time_relative are shared,
+# frame.protocols tags each row with its protocol stack.
+COMMON_FIELDS = [
+    "frame.number",
+    "frame.time_relative",
+    "frame.protocols",
+]
+
+CAPTURE_FIELDS = COMMON_FIELDS + SIP_FIELDS[2:] + RTP_FIELDS[2:]
+
+_SIP_SLICE = slice(len(COMMON_FIELDS), len(COMMON_FIELDS) + len(SIP_FIELDS) - 2)
+_RTP_SLICE = slice(_SIP_SLICE.stop, _SIP_SLICE.stop + len(RTP_FIELDS) - 2)
+
+
+def _tshark_args(pcap_file: str) -> List[str]:
+    args = [
+        "-r", pcap_file,
+        "-T", "fields",
+        "-E", "separator=|",
+        "-E", "occurrence=a",
+        "-E", f"aggregator={AGGREGATOR}",
+    ]
+
+    for f in CAPTURE_FIELDS:
+        args += ["-e", f]
+    return args
+
+
+def _tshark_pages(pcap_file: str, width: int) -> Iterator[List[str]]:
+    # Closing the pages closes tshark too (slot released right away)
+    with closing(iter_tshark_chunks(_tshark_args(pcap_file))) as chunks:
+        for block in chunks:
+            yield split_field_rows(block, width)
+
+
+def extract_capture(pcap_file: str) -> Dict[str, Any]:
+    """
+    Single, streamed dissection pass over the capture.
+
+    Returns:
+    - sip_packets  (same records as extract_sip_packets)
+    - rtp_packets  (RtpColumns, same as extract_rtp_packets)
+    - packet_stats (same shape as get_packet_counts)
+    - context      (same shape as detect_context)
+
+    Plain UDP SIP/RTP captures are read natively (no tshark process),
+    sharded over ANALYSIS_WORKERS processes when large; everything else
+    goes through a pooled sharkd session, or tshark.
+    """
+    native = try_read_capture_sharded(pcap_file)
+    if native is not None:
+        return native
+
+    width = len(CAPTURE_FIELDS)
+
+    # Flat field lists, page by page (sharkd) or block by block (tshark)
+    pages = iter_sharkd_fields(pcap_file, CAPTURE_FIELDS)
+    if pages is None:
+        pages = _tshark_pages(pcap_file, width)
+
+    sip_packets: List[Dict[str, Any]] = []
+    rtp_builder = RtpColumnsBuilder()
+
+    total_packets = 0
+    sip_count = 0
+    rtp_count = 0
+
+    # frame.protocols repeats a handful of distinct stacks
+    stacks: Dict[str, List[str]] = {}
+
+    # Closed on errors too: a pending page holds a tshark slot / sharkd session
+    with closing(pages):
+        for flat in pages:
+            rtp_rows: List[int] = []
+
+            for row, stack in enumerate(flat[2::width]):
+                layers = stacks.get(stack)
+                if layers is None:
+                    layers = stacks[stack] = stack.split(":")
+
+                base = row * width
+
+                if "sip" in layers:
+                    sip_count += 1
+                    pkt = parse_sip_record(flat[base:base + 2] + flat[base + _SIP_SLICE.start:base + _SIP_SLICE.stop])
+                    if pkt:
+                        sip_packets.append(pkt)
+
+                if "rtp" in layers:
+                    rtp_rows.append(base)
+
+            total_packets += len(flat) // width
+            rtp_count += len(rtp_rows)
+
+            # RTP rows go to the column store in bulk
+            if rtp_rows:
+                rtp_builder.extend_fields(
+                    [flat[b] for b in rtp_rows],
+                    [flat[b + 1] for b in rtp_rows],
+                    *(first_values([flat[b + k] for b in rtp_rows], AGGREGATOR) for k in range(_RTP_SLICE.start, _RTP_SLICE.stop))
+                )
+
+    return {
+        "sip_packets": sip_packets,
+        "rtp_packets": rtp_builder.build(),
+        "packet_stats": {
+            "total_packets": total_packets,
+            "sip_packets": sip_count,
+            "rtp_packets": rtp_count
+        },
+        "context": detect_context_from_protocols(stacks.keys())
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python capture_extractor.py <pcap_file>")
+        sys.exit(1)
+
+    capture = extract_capture(sys.argv[1])
+
+    print(json.dumps({
+        "packet_stats": capture["packet_stats"],
+        "context": capture["context"],
+        "sip_records": len(capture["sip_packets"]),
+        "rtp_records": len(capture["rtp_packets"])
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, Any, List, Optional, Set
+
+CHAT_CONTEXT_TTL_SEC = int(os.getenv("CHAT_CONTEXT_TTL_SEC", "900"))
+CHAT_CONTEXT_MAX_JOBS = int(os.getenv("CHAT_CONTEXT_MAX_JOBS", "64"))
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "3000"))   # call lines in the prompt
+
+CHARS_PER_TOKEN = 4          # rough estimate, good enough for a budget
+MAX_TIMELINE_EVENTS = 8      # per call line
+
+_TOKEN = re.compile(r"[A-Za-z0-9_.:@\-]+")
+_STATUS = re.compile(r"\b([1-6]\d\d)\b")
+_STOPWORDS = {
+    "the", "a", "an", "is", "are", "was", "were", "why", "what", "which", "how",
+    "did", "does", "do", "of", "in", "on", "for", "to", "and", "or", "with",
+    "call", "calls", "this", "that", "there", "any", "show", "me", "all", "it",
+}
+
+# question words -> verdict tokens
+VERDICT_SYNONYMS = {
+    "fail": "sip_failure", "failed": "sip_failure", "failure": "sip_failure",
+    "failing": "sip_failure", "rejected": "sip_failure", "error": "sip_failure",
+    "media": "media_failure", "rtp": "media_failure", "audio": "media_failure",
+    "one-way": "media_degraded", "oneway": "media_degraded", "degraded": "media_degraded",
+    "jitter": "media_degraded", "loss": "media_degraded", "quality": "media_degraded",
+    "success": "success", "successful": "success", "ok": "success", "answered": "success",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _tokens(text: str) -> List[str]:
+    return [t.strip(".:-").lower() for t in _TOKEN.findall(text or "") if t.strip(".:-")]
+
+
+def normalize_call(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    sip_calls row (outcome/reason/events) or analysis call
+    (final_verdict/root_cause/timeline/rtp) -> one record shape.
+    """
+    rtp = row.get("rtp") or {}
+    return {
+        "call_id": row.get("call_id") or "",
+        "outcome": row.get("outcome") or row.get("final_verdict") or "",
+        "reason": row.get("reason") or row.get("root_cause") or "",
+        "events": row.get("events") or row.get("timeline") or [],
+        "endpoints": rtp.get("endpoints") or [],
+    }
+
+
+class JobContext:
+    """
+    One job's calls + an inverted index token -> call positions over
+    Call-ID, verdict, status codes, SIP methods, IPs and reason keywords.
+    select() ranks calls for a question (IDF-weighted matches) and packs
+    the best ones into a token budget.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.calls = [normalize_call(r) for r in rows]
+        self.lines = [self._format(c) for c in self.calls]
+        self.index: Dict[str, Set[int]] = defaultdict(set)
+
+        for pos, call in enumerate(self.calls):
+            for token in self._call_tokens(call):
+                self.index[token].add(pos)
+
+        self.outcomes = Counter(c["outcome"] for c in self.calls)
+        self.reasons = Counter(c["reason"] for c in self.calls if c["reason"])
+
+    @staticmethod
+    def _call_tokens(call: Dict[str, Any]) -> Set[str]:
+        tokens = {call["call_id"].lower(), call["outcome"].lower()}
+        tokens.update(_tokens(call["call_id"]))
+        tokens.update(_tokens(call["reason"]))
+        tokens.update(_STATUS.findall(call["reason"]))
+        for ip in call["endpoints"]:
+            tokens.add(str(ip).lower())
+        for e in call["events"]:
+            label = str(e.get("label", ""))
+            tokens.update(_tokens(label))
+            tokens.update(_STATUS.findall(label))
+        tokens.discard("")
+        return tokens - _STOPWORDS
+
+    @staticmethod
+    def _format(call: Dict[str, Any]) -> str:
+        events = call["events"]
+        steps = [f"{e.get('label')}(#{e.get('packet')})" for e in events[:MAX_TIMELINE_EVENTS]]
+        if len(events) > MAX_TIMELINE_EVENTS:
+            steps.append(f"… +{len(events) - MAX_TIMELINE_EVENTS} events")
+        line = f"- Call-ID: {call['call_id']}, Outcome: {call['outcome']}, Reason: {call['reason']}"
+        if steps:
+            line += f", Timeline: {' → '.join(steps)}"
+        if call["endpoints"]:
+            line += f", RTP endpoints: {', '.join(map(str, call['endpoints']))}"
+        return line
+
+    def summary(self) -> str:
+        outcomes = ", ".join(f"{k or 'UNKNOWN'}: {v}" for k, v in self.outcomes.most_common())
+        reasons = "; ".join(f"{k} ({v})" for k, v in self.reasons.most_common(5))
+        return (
+            f"Parsed SIP Calls ({len(self.calls)} total)\n"
+            f"Outcomes: {outcomes or 'none'}\n"
+            f"Top reasons: {reasons or 'none'}"
+        )
+
+    def rank(self, question: str) -> List[int]:
+        terms = set(_tokens(question)) | set(_STATUS.findall(question or ""))
+        terms |= {VERDICT_SYNONYMS[t] for t in terms if t in VERDICT_SYNONYMS}
+        terms -= _STOPWORDS
+
+        n = max(len(self.calls), 1)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in terms:
+            postings = self.index.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + n / len(postings))
+            for pos in postings:
+                scores[pos] += idf
+
+        # best score first, capture order among equals
+        return sorted(scores, key=lambda pos: (-scores[pos], pos))
+
+    def select(self, question: str, token_budget: int = CHAT_TOKEN_BUDGET) -> Dict[str, Any]:
+        """
+        Call lines relevant to the question, within token_budget. With no
+        matching term, non-successful calls come first (then the rest).
+        """
+        ranked = self.rank(question)
+        matched = len(ranked)
+        if not ranked:
+            ranked = sorted(range(len(self.calls)), key=lambda pos: (self.calls[pos]["outcome"] == "SUCCESS", pos))
+
+        lines: List[str] = []
+        used = 0
+        for pos in ranked:
+            cost = estimate_tokens(self.lines[pos])
+            if used + cost > token_budget:
+                break
+            lines.append(self.lines[pos])
+            used += cost
+
+        return {"lines": lines, "matched": matched, "included": len(lines), "tokens": used}
+
+
+class ChatContextCache:
+    """
+    job_id -> JobContext, LRU-bounded, entries expire after ttl_sec.
+    """
+
+    def __init__(self, ttl_sec: int = CHAT_CONTEXT_TTL_SEC, max_jobs: int = CHAT_CONTEXT_MAX_JOBS):
+        self.ttl_sec = ttl_sec
+        self.max_jobs = max_jobs
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[JobContext]:
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is None:
+                return None
+            expires, context = entry
+            if time.monotonic() > expires:
+                del self._entries[job_id]
+                return None
+            self._entries.move_to_end(job_id)
+            return context
+
+    def put(self, job_id: str, context: JobContext) -> None:
+        with self._lock:
+            self._entries[job_id] = (time.monotonic() + self.ttl_sec, context)
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_jobs:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, job_id: str) -> None:
+        with self._lock:
+            self._entries.pop(job_id, None)
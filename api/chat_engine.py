@@ -1,29 +1,49 @@
-from db import supabase
-from openai import OpenAI
+from typing import Dict, Any, List, Optional
 
-client = OpenAI()
+from db import get_supabase
+from ai_explainer import get_client
+from chat_context import ChatContextCache, JobContext
 
-def chat_about_job(job_id: str, question: str) -> str:
-    # 1. Fetch parsed SIP calls
-    res = supabase.table("sip_calls") \
-        .select("call_id,outcome,reason,root_cause,events") \
-        .eq("job_id", job_id) \
-        .execute()
+# job_id -> indexed calls (no Supabase round trip per question)
+chat_contexts = ChatContextCache()
 
-    calls = res.data or []
 
-    # 2. Build compact context (VERY IMPORTANT)
-    summary_lines = []
-    for c in calls:
-        summary_lines.append(
-            f"- Call-ID: {c['call_id']}, "
-            f"Outcome: {c['outcome']}, "
-            f"Reason: {c['reason']}"
-        )
+def load_job_context(job_id: str, calls: Optional[List[Dict[str, Any]]] = None, cache: bool = True) -> JobContext:
+    """
+    Cached per job. `calls` (the in-memory analysis, when the API still
+    holds the job) saves the Supabase query; otherwise sip_calls is read once.
+    cache=False (job still running: partial calls) neither reads nor stores
+    the cached context.
+    """
+    context = chat_contexts.get(job_id) if cache else None
+    if context is not None:
+        return context
+
+    if calls is None:
+        res = get_supabase().table("sip_calls") \
+            .select("call_id,outcome,reason,root_cause,events") \
+            .eq("job_id", job_id) \
+            .execute()
+        calls = res.data or []
+
+    context = JobContext(calls)
+    if cache and context.calls:
+        chat_contexts.put(job_id, context)  # never pin an empty (not yet persisted) job
+    return context
+
+
+def chat_about_job(job_id: str, question: str, calls: Optional[List[Dict[str, Any]]] = None, cache: bool = True) -> str:
+    # 1. Parsed SIP calls (cached + indexed per job)
+    job_context = load_job_context(job_id, calls, cache)
+
+    # 2. Build compact context: totals + only the calls relevant to the
+    #    question, capped by the token budget (VERY IMPORTANT)
+    selected = job_context.select(question)
 
     context = (
-        f"Parsed SIP Calls ({len(calls)} total):\n"
-        + "\n".join(summary_lines)
+        job_context.summary()
+        + f"\n\nRelevant calls ({selected['included']} of {len(job_context.calls)} shown):\n"
+        + "\n".join(selected["lines"])
     )
 
     # 3. Ask AI WITH CONTEXT
@@ -37,10 +57,11 @@ User question:
 {question}
 
 Answer ONLY using the context above.
+Calls not listed are omitted for size; use the totals for counts.
 If packet numbers are not available, say so clearly.
 """
 
-    response = client.chat.completions.create(
+    response = get_client().chat.completions.create(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.2
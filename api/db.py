@@ -1,5 +1,5 @@
 import os
-from supabase import create_client
+import threading
 from dotenv import load_dotenv
 
 # Load .env file
@@ -8,7 +8,28 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise Exception("SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY is missing")
+_client = None
+_client_lock = threading.Lock()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+def get_supabase():
+    """
+    Shared Supabase client, created on first use: importing this module
+    needs neither the SDK loaded nor credentials (CLI tools, fast boot).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise Exception("SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY is missing")
+                from supabase import create_client
+                _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _client
+
+
+def __getattr__(name: str):
+    # `from db import supabase` / db.supabase still work (connects on access)
+    if name == "supabase":
+        return get_supabase()
+    raise AttributeError(f"module 'db' has no attribute {name!r}")
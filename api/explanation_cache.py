@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+from result_cache import CACHE_DIR
+
+EXPLANATION_CACHE_DIR = os.path.join(CACHE_DIR, "explanations")
+EXPLANATION_TTL_SEC = int(os.getenv("EXPLANATION_TTL_SEC", str(7 * 24 * 3600)))
+EXPLANATION_CACHE_MAX_ENTRIES = int(os.getenv("EXPLANATION_CACHE_MAX_ENTRIES", "20000"))
+EVICT_EVERY = 100  # puts between LRU sweeps
+
+# Bump when normalization or the placeholder prompt changes
+SIGNATURE_VERSION = "sig2"
+
+# key -> placeholder kind (call-specific identifiers, normalized out)
+IDENTIFIER_KEYS = {
+    "call_id": "CALL_ID",
+    "packet": "PKT",
+    "invite_packet": "PKT",
+    "ok_200_packet": "PKT",
+    "failure_packet": "PKT",
+    "first_packet": "PKT",
+    "last_packet": "PKT",
+    "time": "T",
+    "src": "IP",
+    "dst": "IP",
+    "endpoints": "IP",
+    "src_port": "PORT",
+    "dst_port": "PORT",
+    "ssrc": "SSRC",
+}
+
+# Not explanation-relevant (job paths)
+DROPPED_KEYS = {"path"}
+
+PLACEHOLDER_RULES = """
+Identifiers are given as placeholders ({{CALL_ID}}, {{PKT1}}, {{T1}}, {{IP1}},
+{{PORT1}}, {{SSRC1}}). Copy them verbatim wherever you reference them.
+"""
+
+_PLACEHOLDER = re.compile(r"\{\{[A-Z_]+\d*\}\}")
+# Whole tokens only: "1" must not match inside "481" or "10.0.0.1"
+_TOKEN_BEFORE = r"(?<![\w.:@-])"
+_TOKEN_AFTER = r"(?![\w.:@-])"
+
+
+@dataclass
+class ExplanationSignature:
+    """
+    Canonical, identifier-free form of one call + the question.
+    Calls with the same signature get the same (refilled) explanation.
+    """
+    key: str
+    normalized: Dict[str, Any]
+    identifiers: Dict[str, str] = field(default_factory=dict)  # placeholder -> value
+
+    def refill(self, text: str) -> str:
+        identifiers = self.identifiers
+        return _PLACEHOLDER.sub(lambda m: identifiers.get(m.group(0), m.group(0)), text)
+
+
+def explanation_signature(call: Dict[str, Any], question: str, model: str = "") -> ExplanationSignature:
+    """
+    Replaces Call-ID, packet numbers, timestamps, addresses, ports and SSRCs
+    with placeholders numbered by first appearance, so structurally
+    identical calls normalize to the same JSON.
+    """
+    placeholders: Dict[Any, str] = {}   # (kind, value) -> placeholder
+    identifiers: Dict[str, str] = {}
+    counters: Dict[str, int] = {}
+
+    def placeholder(kind: str, value: Any) -> str:
+        token = placeholders.get((kind, value))
+        if token is None:
+            if kind == "CALL_ID":
+                token = "{{CALL_ID}}"
+            else:
+                counters[kind] = counters.get(kind, 0) + 1
+                token = "{{%s%d}}" % (kind, counters[kind])
+            placeholders[(kind, value)] = token
+            identifiers[token] = str(value)
+        return token
+
+    def walk(value: Any, kind: Optional[str] = None) -> Any:
+        if isinstance(value, dict):
+            return {
+                k: walk(v, IDENTIFIER_KEYS.get(k))
+                for k, v in value.items()
+                if k not in DROPPED_KEYS
+            }
+        if isinstance(value, list):
+            return [walk(v, kind) for v in value]
+        if kind and value is not None and not isinstance(value, bool):
+            return placeholder(kind, value)
+        return value
+
+    normalized = walk(call)
+
+    # Identifiers also appear inside free text (e.g. quality reasons)
+    text_ids = sorted(
+        ((str(v), token) for (kind, v), token in placeholders.items() if kind in ("IP", "SSRC", "CALL_ID")),
+        key=lambda item: -len(item[0]),
+    )
+    if text_ids:
+        pattern = re.compile(_TOKEN_BEFORE + "(?:" + "|".join(re.escape(v) for v, _ in text_ids) + ")" + _TOKEN_AFTER)
+        lookup = dict(text_ids)
+
+        def scrub(value: Any) -> Any:
+            if isinstance(value, dict):
+                return {k: scrub(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [scrub(v) for v in value]
+            if isinstance(value, str) and not _PLACEHOLDER.fullmatch(value):
+                return pattern.sub(lambda m: lookup[m.group(0)], value)
+            return value
+
+        normalized = scrub(normalized)
+
+    canonical = json.dumps(
+        {"v": SIGNATURE_VERSION, "model": model, "question": question, "call": normalized},
+        sort_keys=True,
+        default=str,
+    )
+    key = hashlib.sha256(canonical.encode()).hexdigest()
+    return ExplanationSignature(key=key, normalized=normalized, identifiers=identifiers)
+
+
+class ExplanationCache:
+    """
+    Persistent signature -> explanation cache (one JSON file per entry).
+    Entries expire after ttl_sec; beyond max_entries the least recently
+    used (mtime, bumped on hit) are evicted. Like ResultCache, file I/O
+    and eviction sweeps run outside the lock (counters only).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = EXPLANATION_CACHE_DIR,
+        ttl_sec: int = EXPLANATION_TTL_SEC,
+        max_entries: int = EXPLANATION_CACHE_MAX_ENTRIES,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            if time.time() - entry["created_at"] > self.ttl_sec:
+                os.remove(path)
+                raise ValueError("expired")
+            os.utime(path)  # LRU touch
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return entry["text"]
+
+    def put(self, key: str, text: str) -> None:
+        path = self._path(key)
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")   # unique per writer
+            with os.fdopen(fd, "w") as f:
+                json.dump({"created_at": time.time(), "text": text}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ Explanation cache store failed: {e}")
+            if tmp:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            return
+        with self._lock:
+            self._counters["stores"] += 1
+            self._puts += 1
+            evict = self._puts % EVICT_EVERY == 0
+        if evict:
+            self._evict()
+
+    def _evict(self) -> None:
+        # Directory sweep outside the lock: lookups and stores go on meanwhile
+        entries: List[Any] = []
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+
+        entries.sort()
+        excess = len(entries) - self.max_entries
+        evicted = 0
+        for mtime, path in entries:
+            # mtime is bumped on hits, so an untouched stale file is expired too
+            if excess <= 0 and now - mtime <= self.ttl_sec:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            excess -= 1
+            evicted += 1
+        self._count("evictions", evicted)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = round(counters["hits"] / lookups, 3) if lookups else None
+        counters["max_entries"] = self.max_entries
+        counters["ttl_sec"] = self.ttl_sec
+        return counters
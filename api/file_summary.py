@@ -1,14 +1,20 @@
-from typing import Dict, Any
+from collections import Counter
+from typing import Dict, Any, Mapping
 
 
 def build_file_summary(analysis: Dict[str, Any]) -> Dict[str, Any]:
-    calls = analysis["calls"]
+    return file_summary_from_verdicts(Counter(c["final_verdict"] for c in analysis["calls"]))
 
-    total_calls = len(calls)
 
-    sip_failures = sum(1 for c in calls if c["final_verdict"] == "SIP_FAILURE")
-    media_failures = sum(1 for c in calls if c["final_verdict"] == "MEDIA_FAILURE")
-    success_calls = sum(1 for c in calls if c["final_verdict"] == "SUCCESS")
+def file_summary_from_verdicts(verdicts: Mapping[str, int]) -> Dict[str, Any]:
+    """
+    Same summary from final_verdict -> call count (running totals).
+    """
+    total_calls = sum(verdicts.values())
+
+    sip_failures = verdicts.get("SIP_FAILURE", 0)
+    media_failures = verdicts.get("MEDIA_FAILURE", 0)
+    success_calls = verdicts.get("SUCCESS", 0)
 
     dominant_failure = None
     if sip_failures > media_failures:
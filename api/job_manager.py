@@ -0,0 +1,272 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from metrics import SpanRecorder, recording, span
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", "16"))
+MAX_RETAINED_JOBS = 200
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+PENDING = "pending"
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+class Job:
+    """
+    One analysis job: overall status, per-stage progress and a result
+    that fills in stage by stage (readable before the job finishes).
+    All mutations bump `version` so pollers / SSE streams can diff cheaply.
+    """
+
+    def __init__(self, job_id: str, filename: str, stage_names: List[str]):
+        self.job_id = job_id
+        self.filename = filename
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.stages: Dict[str, Dict[str, Any]] = {
+            name: {"status": PENDING} for name in stage_names
+        }
+        self.result: Dict[str, Any] = {}
+        self.timings = SpanRecorder()   # per-stage / per-span breakdown
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def _touch(self) -> None:
+        self.version += 1
+
+    @contextmanager
+    def stage(self, name: str, required: bool = True):
+        """
+        A failing stage is marked failed; only a required one fails the
+        job (best-effort stages let the pipeline go on).
+        """
+        with self._lock:
+            self.stages[name] = {"status": RUNNING, "started_at": time.time()}
+            self._touch()
+        try:
+            with span(f"job.{name}", recorder=self.timings):
+                yield
+        except Exception as e:
+            with self._lock:
+                self.stages[name].update(status=FAILED, error=str(e), finished_at=time.time())
+                self._touch()
+            if required:
+                raise
+            print(f"⚠️ Job {self.job_id}: stage {name} failed: {e}")
+            return
+        with self._lock:
+            self.stages[name].update(status=DONE, finished_at=time.time())
+            self._touch()
+
+    def progress(self, name: str, done: int, total: int) -> None:
+        with self._lock:
+            self.stages[name].update(done=done, total=total)
+            self._touch()
+
+    def publish(self, **fields: Any) -> None:
+        """
+        Merge (partial) results; visible to pollers immediately.
+        """
+        with self._lock:
+            self.result.update(fields)
+            self._touch()
+
+    def update_call(self, index: int, **fields: Any) -> None:
+        with self._lock:
+            self.result["calls"][index].update(fields)
+            self._touch()
+
+    def add_call(self, call: Dict[str, Any]) -> None:
+        """
+        Appends one call as soon as it is analyzed (streamed to clients);
+        a later publish(calls=...) must keep this order.
+        """
+        with self._lock:
+            self.result.setdefault("calls", []).append(call)
+            self._touch()
+
+    def calls_page(
+        self,
+        offset: int,
+        limit: int,
+        match: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        (total matching, copies of matching calls [offset:offset+limit]).
+        """
+        page: List[Dict[str, Any]] = []
+        total = 0
+        with self._lock:
+            for call in self.result.get("calls") or []:
+                if match is not None and not match(call):
+                    continue
+                if offset <= total < offset + limit:
+                    page.append(dict(call))
+                total += 1
+        return total, page
+
+    def calls_since(self, start: int, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Copies of calls[start:start+limit] and whether that reaches the
+        end of a finished job (no more calls will come).
+        """
+        with self._lock:
+            calls = self.result.get("calls") or []
+            page = [dict(c) for c in calls[start:start + limit]]
+            return page, self.status in (DONE, FAILED) and start + len(page) >= len(calls)
+
+    def finished_calls(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        The calls of a DONE job (no copy: they no longer change), else None.
+        """
+        with self._lock:
+            return self.result.get("calls") if self.status == DONE else None
+
+    def has_calls(self) -> bool:
+        with self._lock:
+            return bool(self.result.get("calls"))
+
+    def _set_status(self, status: str) -> None:
+        with self._lock:
+            self.status = status
+            self._touch()
+
+    def _finish(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._touch()
+
+    def snapshot(
+        self,
+        include_result: bool = True,
+        include_timings: bool = False,
+        include_calls: bool = True,
+    ) -> Dict[str, Any]:
+        with self._lock:
+            snap = {
+                "job_id": self.job_id,
+                "file": self.filename,
+                "status": self.status,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "version": self.version,
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+            }
+            if include_result:
+                # calls are updated in place while AI explanations arrive
+                result = dict(self.result)
+                if "calls" in result:
+                    if include_calls:
+                        result["calls"] = [dict(c) for c in result["calls"]]
+                    else:
+                        del result["calls"]   # paged via /jobs/{id}/calls
+                snap["result"] = result
+        if include_timings:
+            snap["timings"] = self.timings.breakdown()
+        return snap
+
+
+class JobManager:
+    """
+    Bounded in-process worker pool.
+    At most `workers` jobs run at once and `max_pending` wait; further
+    submissions raise JobQueueFull. Finished jobs are retained (LRU) so
+    clients can keep polling them. on_finish(job) runs when a job is
+    done or failed; on_discard(job) when it is evicted, or fails before
+    any call was published (releases its on-disk files).
+    """
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        max_pending: int = MAX_PENDING_JOBS,
+        on_finish: Optional[Callable[[Job], None]] = None,
+        on_discard: Optional[Callable[[Job], None]] = None,
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._on_finish = on_finish
+        self._on_discard = on_discard
+
+    def create(self, job_id: str, filename: str, stage_names: List[str]) -> Job:
+        job = Job(job_id, filename, stage_names)
+        with self._lock:
+            self._jobs[job_id] = job
+            evicted = self._evict()
+        for old in evicted:
+            self._discard(old)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit(self, job: Job, fn: Callable[[Job], None]) -> None:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+            raise JobQueueFull("Analysis queue is full, retry later")
+
+        def _run():
+            job._set_status(RUNNING)
+            try:
+                with recording(job.timings):
+                    fn(job)
+                job._finish(DONE)
+            except Exception as e:
+                print(f"⚠️ Job {job.job_id} failed: {e}")
+                job._finish(FAILED, str(e))
+                if not job.has_calls():
+                    self._discard(job)  # nothing left to serve (exports)
+            finally:
+                self._hook(self._on_finish, job)
+                self._slots.release()
+
+        self._executor.submit(_run)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _discard(self, job: Job) -> None:
+        self._hook(self._on_discard, job)
+
+    @staticmethod
+    def _hook(fn: Optional[Callable[[Job], None]], job: Job) -> None:
+        if fn is None:
+            return
+        try:
+            fn(job)
+        except Exception as e:
+            print(f"⚠️ Job {job.job_id} hook failed: {e}")
+
+    def _evict(self) -> List[Job]:
+        # Called with the lock held; the caller discards the evicted jobs
+        finished = [jid for jid, j in self._jobs.items() if j.status in (DONE, FAILED)]
+        evicted = []
+        while len(self._jobs) > MAX_RETAINED_JOBS and finished:
+            evicted.append(self._jobs.pop(finished.pop(0)))
+        return evicted
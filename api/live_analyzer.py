@@ -0,0 +1,461 @@
+import os
+import json
+import mmap
+import struct
+import argparse
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+import numpy as np
+
+from tshark_runner import detect_context_from_protocols
+from packet_store import RtpColumns
+from pcap_reader import PCAPNG_SHB, PCAPNG_IDB, PCAPNG_BYTE_ORDER_MAGIC, SIP_UDP_PORT, iter_frames, scan_frames
+from parallel_reader import announced_before
+from media_index import route_media
+from rtp_index import RtpTimeIndex
+from call_analyzer import analyze_call
+from sip_dialog import DialogState, SIP_DIALOG_CONFIRMED_IDLE_SEC
+from file_summary import file_summary_from_verdicts
+from pcap_exporter import OUTPUT_DIR
+
+LIVE_DIR = os.path.join(OUTPUT_DIR, "live")
+LIVE_POLL_SEC = float(os.getenv("LIVE_POLL_SEC", "1.0"))
+
+# Capture-clock seconds (not wall clock: replays behave like live)
+LIVE_LINGER_SEC = float(os.getenv("LIVE_LINGER_SEC", "5"))       # after BYE / CANCEL / final error
+LIVE_IDLE_SEC = float(os.getenv("LIVE_IDLE_SEC", "120"))         # no SIP/RTP: emit unfinished call
+LIVE_CONFIRMED_IDLE_SEC = float(os.getenv("LIVE_CONFIRMED_IDLE_SEC", str(SIP_DIALOG_CONFIRMED_IDLE_SEC)))  # answered, no BYE yet
+LIVE_UNROUTED_RETAIN_SEC = 300.0                                  # RTP for calls without SDP
+LIVE_ANNOUNCED_RETAIN_SEC = 300.0                                 # SDP endpoints without SDP / RTP since
+LIVE_EMITTED_MEMORY = 10000                                       # late packets of emitted calls are dropped
+
+CAPTURE_SUFFIXES = (".pcap", ".pcapng", ".cap")
+LIVE_EXPORT = {"pcap_available": False, "reason": "Live mode: per-call pcaps are not cut from ring files"}
+
+
+class CaptureCursor:
+    """
+    Read position in one (possibly still growing) capture file.
+    Every poll maps the file as it is now and walks only complete records
+    past `offset`, so each packet is decoded exactly once; a record that
+    is still being written is picked up by the next poll.
+    """
+
+    def __init__(self, path: str, frame_no: int = 0):
+        self.path = path
+        self.offset = 0
+        self.frame_no = frame_no                       # global frames before the next record
+        self.preamble: List[Tuple[int, int]] = []      # pcapng SHB + IDBs in effect at offset
+        self._endian = "<"
+        self.first_ts_ns: Optional[int] = None    # first packet of the last read
+        self.last_ts_ns: Optional[int] = None
+
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def read(self, consume: Callable[[Any, Any], Any]) -> Optional[Any]:
+        """
+        consume(mm, frames) over the new complete records; None when
+        nothing new has been written yet.
+        """
+        size = self.size()
+        if size < 24 or size <= self.offset:
+            return None
+
+        with open(self.path, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), size, access=mmap.ACCESS_READ)
+
+        try:
+            pcapng = struct.unpack_from("<I", mm, 0)[0] == PCAPNG_SHB
+            if pcapng:
+                stop, blocks = self._complete_blocks(mm, self.offset, size)
+                if stop == self.offset:
+                    return None
+                frames = iter_frames(mm, start=self.offset, stop=stop, frame_no=self.frame_no, preamble=self.preamble)
+            else:
+                stop, blocks = None, []
+                frames = iter_frames(mm, start=max(self.offset, 24), frame_no=self.frame_no)
+
+            first: List[int] = []
+            last: List[Tuple[int, int, int]] = []
+
+            def tracked():
+                for frame in frames:
+                    if not first:
+                        first.append(frame[1])
+                    last[:] = [(frame[0], frame[1], frame[5] + frame[6])]
+                    yield frame
+
+            result = consume(mm, tracked())
+        finally:
+            mm.close()
+
+        if last:
+            self.first_ts_ns = first[0]
+            self.frame_no, self.last_ts_ns, end = last[0]
+        else:
+            end = max(self.offset, 24)
+
+        if pcapng:
+            self.offset = stop
+            for off, blen, btype in blocks:
+                if btype == PCAPNG_SHB:
+                    self.preamble = [(off, blen)]
+                else:
+                    self.preamble.append((off, blen))
+        else:
+            self.offset = end
+        return result
+
+    def _complete_blocks(self, mm, off: int, size: int) -> Tuple[int, List[Tuple[int, int, int]]]:
+        """
+        End of the last complete pcapng block, plus the SHB/IDBs found
+        on the way (they become the preamble for later reads).
+        """
+        blocks = []
+        while off + 12 <= size:
+            btype = struct.unpack_from(self._endian + "I", mm, off)[0]
+            if btype == PCAPNG_SHB:
+                bom = struct.unpack_from("<I", mm, off + 8)[0]
+                self._endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            blen = struct.unpack_from(self._endian + "I", mm, off + 4)[0]
+            if blen < 12 or off + blen > size:
+                break
+            if btype in (PCAPNG_SHB, PCAPNG_IDB):
+                blocks.append((off, blen, btype))
+            off += blen
+        return off, blocks
+
+
+class _LiveCall:
+    __slots__ = ("dialog", "rtp_parts", "sdp_events", "last_time")
+
+    def __init__(self, call_id: str):
+        self.dialog = DialogState(call_id, keep_events=True)   # SIP state + termination
+        self.rtp_parts: List[RtpColumns] = []
+        self.sdp_events: List[Dict[str, Any]] = []
+        self.last_time = 0.0
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        return self.dialog.events
+
+    def add_sip(self, pkt: Dict[str, Any]) -> None:
+        self.dialog.feed(pkt)
+        self.last_time = max(self.last_time, pkt["time"])
+        if pkt.get("media"):
+            self.sdp_events.append(pkt)
+
+    def add_rtp(self, rtp: RtpColumns) -> None:
+        self.rtp_parts.append(rtp)
+        self.last_time = max(self.last_time, float(rtp.time.max()))
+
+
+class LiveAnalyzer:
+    """
+    Incremental analysis of a growing capture, or of a directory of
+    rotating ring files (dumpcap -b), read in name order.
+
+    SIP dialogs and their SDP-routed RTP are kept per Call-ID across
+    polls and files; a call is analyzed (same record as
+    analyze_pcap_calls) and handed to on_call once it has ended and
+    linger_sec of capture time passed, or after idle_sec without traffic
+    (confirmed_idle_sec once answered: held / unrouted media is silent).
+    Per-packet work is constant: each record is decoded once and only
+    open calls (plus recently active SDP endpoints and unrouted RTP) are
+    kept in memory.
+
+    Native reader only (plain UDP SIP/RTP); UnsupportedCapture propagates.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        on_call: Callable[[Dict[str, Any]], None],
+        linger_sec: float = LIVE_LINGER_SEC,
+        idle_sec: float = LIVE_IDLE_SEC,
+        confirmed_idle_sec: float = LIVE_CONFIRMED_IDLE_SEC,
+    ):
+        self.source = source
+        self.on_call = on_call
+        self.linger_sec = linger_sec
+        self.idle_sec = idle_sec
+        self.confirmed_idle_sec = confirmed_idle_sec
+
+        self._cursor: Optional[CaptureCursor] = None
+        self._finished_path: Optional[str] = None
+        self.frame_no = 0
+        self.first_ts_ns: Optional[int] = None
+        self.now = 0.0   # capture clock (seconds since the first packet)
+
+        self._calls: Dict[str, _LiveCall] = {}
+        self._emitted: "OrderedDict[str, None]" = OrderedDict()
+        self._announced: Dict[Tuple[str, int], int] = {}          # endpoint -> announcing frame
+        self._announced_active: Dict[Tuple[str, int], float] = {}  # endpoint -> last SDP / RTP (capture time)
+        self._unrouted: List[RtpColumns] = []
+
+        self._counts = Counter()
+        self._layers = set()
+        self._verdicts = Counter()
+
+    # -----------------------------
+    # Source files
+    # -----------------------------
+    def _files(self) -> List[str]:
+        if not os.path.isdir(self.source):
+            return [self.source]
+        names = sorted(n for n in os.listdir(self.source) if n.lower().endswith(CAPTURE_SUFFIXES))
+        return [os.path.join(self.source, n) for n in names]
+
+    def _next_file(self, after: Optional[str]) -> Optional[str]:
+        for path in self._files():
+            if after is None or path > after:
+                return path
+        return None
+
+    def poll(self) -> int:
+        """
+        Reads everything written since the last poll (moving on to newer
+        ring files), then emits calls that are complete. Returns packets read.
+        """
+        packets = 0
+        while True:
+            if self._cursor is None:
+                path = self._next_file(self._finished_path)
+                if path is None:
+                    break
+                self._cursor = CaptureCursor(path, self.frame_no)
+
+            cursor = self._cursor
+            try:
+                if cursor.size() < cursor.offset:
+                    print(f"⚠️ {cursor.path} shrank, reading it from the start")
+                    cursor = self._cursor = CaptureCursor(cursor.path, self.frame_no)
+                packets += self._read(cursor)
+                gone = False
+            except FileNotFoundError:
+                gone = True  # rotated away before we got to it
+
+            newer = self._next_file(cursor.path) if os.path.isdir(self.source) else None
+            if newer is None and not gone:
+                break
+            if newer is None:
+                self._cursor = None
+                self._finished_path = cursor.path
+                break
+
+            # dumpcap has moved on: this file is complete, drain its tail
+            if not gone:
+                try:
+                    packets += self._read(cursor)
+                except FileNotFoundError:
+                    pass
+            self._finished_path = cursor.path
+            self._cursor = None
+
+        self._expire()
+        return packets
+
+    def _read(self, cursor: CaptureCursor) -> int:
+        part = cursor.read(lambda mm, frames: scan_frames(mm, frames, first_ts=self.first_ts_ns, defer_rtp=True))
+        if part is None:
+            return 0
+
+        if self.first_ts_ns is None:
+            self.first_ts_ns = cursor.first_ts_ns  # scan_frames timed this read from it
+        self.frame_no = cursor.frame_no
+        if cursor.last_ts_ns is not None and self.first_ts_ns is not None:
+            self.now = max(self.now, (cursor.last_ts_ns - self.first_ts_ns) / 1e9)
+
+        self._ingest(part)
+        return part["packet_stats"]["total_packets"]
+
+    # -----------------------------
+    # State
+    # -----------------------------
+    def _ingest(self, part: Dict[str, Any]) -> None:
+        self._counts["total_packets"] += part["packet_stats"]["total_packets"]
+        self._counts["sip_packets"] += part["packet_stats"]["sip_packets"]
+        self._layers |= part["layers"]
+
+        for endpoint, frame in part["sdp_endpoints"].items():
+            self._announced.setdefault(endpoint, frame)
+            self._announced_active[endpoint] = self.now
+
+        # RTP candidates: kept when SDP announced the endpoint earlier (any file)
+        candidates = part["rtp_packets"]
+        keep = announced_before(candidates, self._announced)
+        rtp = candidates.take(np.flatnonzero(keep))
+
+        on_sip_port = (candidates.src_port == SIP_UDP_PORT) | (candidates.dst_port == SIP_UDP_PORT)
+        sip_noise = int(np.count_nonzero(on_sip_port & ~keep))
+        if sip_noise:
+            self._counts["sip_packets"] += sip_noise
+            self._layers.add("sip")
+        if len(rtp):
+            self._counts["rtp_packets"] += len(rtp)
+            self._layers.add("rtp")
+            self._touch_announced(rtp)
+
+        for pkt in part["sip_packets"]:
+            call_id = pkt["call_id"]
+            if call_id in self._emitted:
+                continue  # late retransmission of an emitted call
+            call = self._calls.get(call_id)
+            if call is None:
+                call = self._calls[call_id] = _LiveCall(call_id)
+            call.add_sip(pkt)
+
+        if not len(rtp):
+            return
+
+        # Route with the SDP of every open call (offers may be files back)
+        sdp = [pkt for call in self._calls.values() for pkt in call.sdp_events]
+        routed, unrouted = route_media(sdp, rtp)
+        for call_id, view in routed.items():
+            call = self._calls.get(call_id)
+            if call is not None:
+                call.add_rtp(view)
+        if len(unrouted):
+            self._unrouted.append(unrouted)
+
+    def _touch_announced(self, rtp: RtpColumns) -> None:
+        # announced endpoints this RTP flowed to / from stay active
+        keys = np.unique(np.concatenate([
+            (rtp.dst.astype(np.int64) << 16) | rtp.dst_port,
+            (rtp.src.astype(np.int64) << 16) | rtp.src_port,
+        ]))
+        for key in keys.tolist():
+            endpoint = (rtp.ips.values[key >> 16], key & 0xFFFF)
+            if endpoint in self._announced_active:
+                self._announced_active[endpoint] = self.now
+
+    def _expire(self) -> None:
+        for call_id, call in list(self._calls.items()):
+            ended = call.dialog.ended_at is not None and self.now - call.dialog.ended_at >= self.linger_sec
+            idle_sec = self.confirmed_idle_sec if call.dialog.confirmed else self.idle_sec
+            if ended or self.now - call.last_time >= idle_sec:
+                self._emit(call_id)
+            elif call.dialog.confirmed:
+                # answered calls keep their SDP endpoints through silent media
+                for pkt in call.sdp_events:
+                    for addr, port, _fmts in pkt["media"]:
+                        if (addr, port) in self._announced_active:
+                            self._announced_active[(addr, port)] = self.now
+
+        horizon = self.now - LIVE_UNROUTED_RETAIN_SEC
+        self._unrouted = [u for u in self._unrouted if float(u.time.max()) >= horizon]
+
+        # Endpoints outlive their call by LIVE_ANNOUNCED_RETAIN_SEC at most
+        # (longer than idle_sec; open answered calls keep theirs active)
+        horizon = self.now - LIVE_ANNOUNCED_RETAIN_SEC
+        for endpoint in [e for e, t in self._announced_active.items() if t < horizon]:
+            del self._announced_active[endpoint]
+            del self._announced[endpoint]
+
+    def flush(self) -> int:
+        """
+        Emits every open call (end of capture / shutdown).
+        """
+        open_calls = list(self._calls)
+        for call_id in open_calls:
+            self._emit(call_id)
+        return len(open_calls)
+
+    def _emit(self, call_id: str) -> None:
+        call = self._calls.pop(call_id)
+        events = sorted(call.events, key=lambda e: (e["time"], e["frame"]))
+
+        if call.sdp_events:
+            rtp = RtpColumns.concat(call.rtp_parts)
+        else:
+            # No SDP: scoped to the SIP window, like the batch analyzer
+            rtp = RtpTimeIndex(RtpColumns.concat(self._unrouted)).window(events[0]["time"], events[-1]["time"])
+
+        result = analyze_call(call_id, events, rtp)
+        result["export"] = dict(LIVE_EXPORT)
+
+        self._verdicts[result["final_verdict"]] += 1
+        self._emitted[call_id] = None
+        while len(self._emitted) > LIVE_EMITTED_MEMORY:
+            self._emitted.popitem(last=False)
+
+        self.on_call(result)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "file": self._cursor.path if self._cursor else self._finished_path,
+            "capture_time_sec": round(self.now, 3),
+            "open_calls": len(self._calls),
+            "emitted_calls": sum(self._verdicts.values()),
+            "packet_stats": {
+                "total_packets": self._counts["total_packets"],
+                "sip_packets": self._counts["sip_packets"],
+                "rtp_packets": self._counts["rtp_packets"],
+            },
+            "capture_context": detect_context_from_protocols(self._layers),
+            "file_summary": file_summary_from_verdicts(self._verdicts),
+        }
+
+    def run(self, poll_sec: float = LIVE_POLL_SEC, stop: Optional[threading.Event] = None,
+            once: bool = False, on_poll: Optional[Callable[[int], None]] = None) -> None:
+        """
+        Polls until stop is set (or, with once=True, until no new data),
+        then flushes the calls still open.
+        """
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                packets = self.poll()
+                if on_poll:
+                    on_poll(packets)
+                if once and packets == 0:
+                    break
+                if packets == 0:
+                    stop.wait(poll_sec)
+        finally:
+            self.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live SIP/RTP analysis of a growing capture or ring-buffer directory")
+    parser.add_argument("source", help="capture file being written, or dumpcap ring directory")
+    parser.add_argument("--output-dir", default=LIVE_DIR, help="calls.jsonl + summary.json")
+    parser.add_argument("--poll", type=float, default=LIVE_POLL_SEC)
+    parser.add_argument("--once", action="store_true", help="read what is there, emit everything, exit")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    calls_path = os.path.join(args.output_dir, "calls.jsonl")
+    summary_path = os.path.join(args.output_dir, "summary.json")
+
+    with open(calls_path, "a") as calls_out:
+        def on_call(call: Dict[str, Any]) -> None:
+            calls_out.write(json.dumps(call, default=str) + "\n")
+            calls_out.flush()
+            print(f"{call['final_verdict']:<15} {call['call_id']}  ({call['root_cause']})")
+
+        analyzer = LiveAnalyzer(args.source, on_call)
+
+        def write_summary(packets: int) -> None:
+            if not packets:
+                return
+            tmp = f"{summary_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(analyzer.summary(), f, indent=2)
+            os.replace(tmp, summary_path)
+
+        try:
+            analyzer.run(args.poll, once=args.once, on_poll=write_summary)
+        except KeyboardInterrupt:
+            pass
+        write_summary(1)
+
+    print(json.dumps(analyzer.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,94 @@
+import time
+
+_BOOT_STARTED = time.perf_counter()  # API import time (/metrics)
+
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
-import tempfile
+import asyncio
+import glob
 import os
+import shutil
+import threading
 import uuid
 import dotenv
+from typing import List, Optional
 
 dotenv.load_dotenv()
 
-from call_analyzer import analyze_pcap_calls
-from db import supabase
-from ai_explainer import explain_call
-from chat_engine import chat_about_job
-from tshark_runner import get_packet_counts, analyze_capture_context
+from db import get_supabase
+from ai_explainer import explain_call, explain_calls, explanation_cache
+from chat_engine import chat_about_job, chat_contexts
+from pcap_exporter import OUTPUT_DIR, export_call, load_call_frames
+from result_cache import ResultCache
+from upload_stream import save_upload_stream, UploadRejected, MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES
+from job_manager import JobManager, Job, JobQueueFull, DONE, FAILED
+from persistence import SupabaseWriter
+from tshark_runner import tshark_slots, tshark_version
+from sharkd import sharkd_pool
+from batch_analyzer import BatchInputs, batch_pool, correlate_calls, merge_file_summary, BATCH_MAX_FILES
+from metrics import registry, SpanRecorder, span
+from fast_json import FastJSONResponse, dumps
+from call_views import call_filter, call_projection, MAX_PAGE_SIZE
 
 # -------------------------
 # CONFIG
 # -------------------------
 ENABLE_SUPABASE = True  # set False to fully disable DB during demo
 
+# Per-job working dir: uploaded capture + per-call exports + frame manifest.
+# Removed when the job fails or is evicted; dirs left behind by an earlier
+# process are swept at startup once older than JOB_DIR_TTL_SEC.
+JOBS_DIR = os.path.join(OUTPUT_DIR, "jobs")
+JOB_DIR_TTL_SEC = float(os.getenv("JOB_DIR_TTL_SEC", str(24 * 3600)))
+
+def discard_job_dir(job_id: str):
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    # single capture, or files/<i>/capture.* for batch jobs
+    for capture in glob.glob(os.path.join(job_dir, "capture.*")) + glob.glob(os.path.join(job_dir, "files", "*", "capture.*")):
+        sharkd_pool.close_file(capture)
+    shutil.rmtree(job_dir, ignore_errors=True)
+
+def sweep_job_dirs(max_age_sec: float = JOB_DIR_TTL_SEC) -> int:
+    if not os.path.isdir(JOBS_DIR):
+        return 0
+    cutoff = time.time() - max_age_sec
+    swept = 0
+    for job_id in os.listdir(JOBS_DIR):
+        if job_manager.get(job_id) is not None:
+            continue
+        try:
+            if os.path.getmtime(os.path.join(JOBS_DIR, job_id)) >= cutoff:
+                continue
+        except OSError:
+            continue
+        discard_job_dir(job_id)
+        swept += 1
+    return swept
+
+# Re-uploads of the same capture skip tshark entirely
+result_cache = ResultCache()
+
+# Background analysis jobs (bounded worker pool)
+job_manager = JobManager(
+    on_finish=lambda job: chat_contexts.invalidate(job.job_id),  # drop contexts built while it ran
+    on_discard=lambda job: discard_job_dir(job.job_id),
+)
+JOB_RETRY_AFTER_SEC = 10
+
+# Supabase rows / uploads go through a background bulk writer
+db_writer = SupabaseWriter(get_supabase)
+JOB_EVENTS_POLL_SEC = 0.5
+
 app = FastAPI(title="PCAP AI Reader")
 
+@app.on_event("startup")
+def start_job_dir_sweep():
+    # Off the boot path: leftover dirs can be many
+    threading.Thread(target=sweep_job_dirs, name="job-dir-sweep", daemon=True).start()
+
 # -------------------------
 # CORS
 # -------------------------
@@ -36,40 +104,200 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -------------------------
+# Upload size limit (before multipart parsing)
+# -------------------------
+class UploadLimitMiddleware:
+    """
+    Refuses upload bodies over the limit for their path before the
+    multipart parser spools them to disk: 413 on the declared
+    Content-Length, or as soon as a chunked body streams past the limit.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        detail = f"Upload exceeds {MAX_UPLOAD_BYTES} bytes"
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared and declared.isdigit() and int(declared) > limit:
+            return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/analyze/sip": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    "/analyze/batch": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES * BATCH_MAX_FILES,
+})
+
 # -------------------------
 # Helpers
 # -------------------------
 def safe_supabase_insert(table: str, payload: dict):
+    # Buffered: bulk-inserted in the background by db_writer
     if not ENABLE_SUPABASE:
         return
-    try:
-        supabase.table(table).insert(payload).execute()
-    except Exception as e:
-        print(f"⚠️ Supabase insert failed [{table}]: {e}")
+    db_writer.insert(table, payload)
 
-def safe_supabase_storage_upload(bucket: str, path: str, file_bytes: bytes):
+def safe_supabase_storage_upload(bucket: str, path: str, file_path: str):
+    # Streams from the on-disk file (no in-memory copy)
     if not ENABLE_SUPABASE:
         return
-    try:
-        supabase.storage.from_(bucket).upload(
-            path,
-            file_bytes,
-            file_options={"content-type": "application/octet-stream"},
-        )
-    except Exception as e:
-        print("⚠️ Storage upload failed:", e)
+    db_writer.upload(bucket, path, file_path)
 
 # -------------------------
 # Health Check
 # -------------------------
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "tshark": {**tshark_slots.stats(), "version": tshark_version()},
+        "sharkd": sharkd_pool.stats(),
+        "batch": batch_pool.stats(),
+    }
+
+# -------------------------
+# SIP Analysis pipeline (runs on the job worker pool)
+# -------------------------
+PIPELINE_STAGES = ["upload", "analysis", "file_insight", "call_explanations", "persist"]
+
+# Seconds a finished job waits for its rows to reach the DB (chat reads them)
+PERSIST_WAIT_SEC = 30
+
+def analyze_capture_cached(capture_path: str, capture_digest: str, output_dir: str, on_call=None):
+    """
+    analyze_pcap_calls, or the cached analysis of the same capture
+    re-homed onto output_dir. Returns (analysis, cache_hit). on_call only
+    fires on a cache miss (a hit has every call at once).
+    """
+    # Analyzers (numpy & co.) load with the first job, not at API boot
+    from call_analyzer import analyze_pcap_calls, restore_cached_analysis, ANALYZER_VERSION
+
+    cache_key = ResultCache.key_for(capture_digest, ANALYZER_VERSION)
+    cached = result_cache.get(cache_key)
+
+    if cached:
+        return restore_cached_analysis(capture_path, cached, output_dir=output_dir), True
+
+    analysis = analyze_pcap_calls(capture_path, output_dir=output_dir, on_call=on_call)
+    result_cache.put(cache_key, {
+        "analysis": analysis,
+        "call_frames": load_call_frames(output_dir),
+    })
+    return analysis, False
+
+def run_sip_pipeline(job: Job, capture_path: str, capture_digest: str):
+    job_id = job.job_id
+    job_dir = os.path.dirname(capture_path)
+    bucket_path = f"{job_id}/{job.filename}"
+
+    # 1) Upload original PCAP to storage (best effort) - alongside analysis
+    def upload_capture():
+        with job.stage("upload", required=False):
+            safe_supabase_storage_upload("pcap", bucket_path, capture_path)
+
+    upload = db_writer.background(upload_capture)
+    job.publish(bucket_path=bucket_path)
+
+    # Stages 2-5: the upload reads the capture, so it is always waited for
+    # before the job ends (a failed job's dir may be discarded after)
+    try:
+        # 2) Deterministic analysis (engine, single tshark pass) - or cached
+        with job.stage("analysis"):
+            # Calls are readable (/jobs/{id}/calls/stream) as each one is analyzed
+            analysis, cache_hit = analyze_capture_cached(capture_path, capture_digest, job_dir, on_call=job.add_call)
+
+        # Partial result: file overview + calls are readable from here on
+        calls = analysis.get("calls", [])
+        job.publish(
+            packet_stats=analysis.get("packet_stats"),
+            capture_context=analysis.get("capture_context"),
+            total_calls=analysis.get("total_calls", 0),
+            cache_hit=cache_hit,
+            calls=calls,
+        )
+
+        # Save pcap job (queued; written before its call rows)
+        safe_supabase_insert("pcap_jobs", {
+            "id": job_id,
+            "filename": job.filename,
+            "total_calls": analysis.get("total_calls", 0),
+            "bucket_path": bucket_path
+        })
+
+        # 3) File-level AI Insight
+        # We reuse explain_call() by passing a "file summary" object.
+        file_ai_insight = None
+        with job.stage("file_insight", required=False):
+            file_ai_input = {
+                "type": "FILE_SUMMARY",
+                "filename": job.filename,
+                "packet_stats": analysis.get("packet_stats"),
+                "context": analysis.get("capture_context"),
+                "total_calls": analysis.get("total_calls"),
+                "calls_preview": calls[:5],  # keep it small for cost + speed
+            }
+            file_ai_insight = explain_call(file_ai_input, "Give file overview + key issues + what to check in Wireshark next.")
+        job.publish(file_ai_insight=file_ai_insight)
+
+        # 4) Per-call AI explanations (concurrent fan-out); each call row is
+        #    queued for the bulk writer as soon as its explanation lands
+        with job.stage("call_explanations", required=False):
+            explained = 0
+            job.progress("call_explanations", 0, len(calls))
+
+            def on_explained(i: int, ai_text: str):
+                nonlocal explained
+                explained += 1
+                call = calls[i]
+                safe_supabase_insert("sip_calls", {
+                    "id": str(uuid.uuid4()),
+                    "job_id": job_id,
+                    "call_id": call.get("call_id"),
+
+                    # schema-aligned
+                    "outcome": call.get("final_verdict"),
+                    "reason": call.get("root_cause"),
+                    "root_cause": call.get("root_cause"),
+                    "events": call.get("timeline"),
+
+                    "ai_explanation": ai_text or "AI explanation unavailable"
+                })
+                job.update_call(i, ai_explanation=ai_text)
+                job.progress("call_explanations", explained, len(calls))
+
+            explain_calls(calls, "Explain this call in bullet points for an engineer.", on_result=on_explained)
+
+        # 5) Storage upload + buffered rows done before the job reports done
+        with job.stage("persist"):
+            sharkd_pool.close_file(capture_path)  # loaded for this job only
+            upload.result()
+            if ENABLE_SUPABASE and not db_writer.flush(timeout=PERSIST_WAIT_SEC):
+                print(f"⚠️ Job {job_id}: rows still pending after {PERSIST_WAIT_SEC}s")
+    finally:
+        upload.result()
 
 # -------------------------
 # SIP Analysis API (MVP-1)
 # -------------------------
-@app.post("/analyze/sip")
+@app.post("/analyze/sip", status_code=202)
 async def analyze_sip(file: UploadFile = File(...)):
     if not file or not file.filename:
         raise HTTPException(status_code=400, detail="No file received")
@@ -79,91 +307,356 @@ async def analyze_sip(file: UploadFile = File(...)):
 
     job_id = str(uuid.uuid4())
 
-    # 1) Read bytes once
-    file_bytes = await file.read()
+    # Stream the capture into the job dir (on-demand call exports read it):
+    # chunked copy, hashed + magic-checked on the fly, never whole in memory
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    capture_path = os.path.join(job_dir, "capture" + os.path.splitext(file.filename)[1].lower())
+    request_timings = SpanRecorder()
+    try:
+        with span("request.upload_stream", recorder=request_timings):
+            saved = await run_in_threadpool(save_upload_stream, file.file, capture_path, MAX_UPLOAD_BYTES)
+    except UploadRejected as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-    # 2) Upload original PCAP to storage (best effort)
-    bucket_path = f"{job_id}/{file.filename}"
-    safe_supabase_storage_upload("pcap", bucket_path, file_bytes)
+    # Heavy work runs in the background; the client polls / streams progress
+    job = job_manager.create(job_id, file.filename, PIPELINE_STAGES)
+    job.timings.merge(request_timings)
+    try:
+        job_manager.submit(job, lambda j: run_sip_pipeline(j, capture_path, saved.sha256))
+    except JobQueueFull as e:
+        discard_job_dir(job_id)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(JOB_RETRY_AFTER_SEC)})
 
-    # 3) Write temp file for tshark
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-        tmp.write(file_bytes)
-        tmp_path = tmp.name
+    return {
+        "job_id": job_id,
+        "file": file.filename,
+        "status": job.status,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    }
 
-    try:
-        # 4) Deterministic analysis (engine)
-        analysis = analyze_pcap_calls(tmp_path)
+# -------------------------
+# Multi-capture batch (one job, files fanned out on the shared batch pool)
+# -------------------------
+BATCH_STAGES = ["analysis", "correlation", "persist"]
 
-        # 5) File-level facts (what PCAP is about)
-        packet_stats = get_packet_counts(tmp_path)
-        context_info = analyze_capture_context(tmp_path)  # includes protocol hierarchy + capture context
+def run_batch_pipeline(job: Job, inputs: BatchInputs):
+    job_id = job.job_id
+    files = [None] * len(inputs.files)
 
-        # 6) File-level AI Insight (so UI can show it immediately)
-        # We reuse explain_call() by passing a "file summary" object.
-        file_ai_input = {
-            "type": "FILE_SUMMARY",
-            "filename": file.filename,
-            "packet_stats": packet_stats,
-            "context": context_info.get("context"),
-            "total_calls": analysis.get("total_calls"),
-            "calls_preview": analysis.get("calls", [])[:5],  # keep it small for cost + speed
+    # 1) Per-file analysis (cached per capture), results published as they land
+    def analyze_file(batch_file):
+        file_dir = inputs.file_dir(batch_file.index)
+        with span("batch.file", file=batch_file.name, bytes=batch_file.size):
+            analysis, cache_hit = analyze_capture_cached(batch_file.path, batch_file.sha256, file_dir)
+        sharkd_pool.close_file(batch_file.path)
+        return {
+            "index": batch_file.index,
+            "file": batch_file.name,
+            "status": DONE,
+            "cache_hit": cache_hit,
+            "total_calls": analysis.get("total_calls", 0),
+            "file_summary": analysis.get("file_summary"),
+            "packet_stats": analysis.get("packet_stats"),
+            "capture_context": analysis.get("capture_context"),
+            "calls": analysis.get("calls", []),
         }
-        file_ai_insight = explain_call(file_ai_input, "Give file overview + key issues + what to check in Wireshark next.")
 
-        # 7) Save pcap job
+    def overview():
+        return [{k: v for k, v in f.items() if k != "calls"} for f in files if f]
+
+    with job.stage("analysis"):
+        done = 0
+        job.progress("analysis", 0, len(files))
+
+        def on_file(batch_file, result, error):
+            nonlocal done
+            done += 1
+            if error is not None:
+                print(f"⚠️ Job {job_id}: {batch_file.name} failed: {error}")
+                result = {"index": batch_file.index, "file": batch_file.name, "status": FAILED, "error": str(error)}
+            files[batch_file.index] = result
+            job.publish(files=overview())
+            job.progress("analysis", done, len(files))
+
+        batch_pool.map(inputs.files, analyze_file, on_result=on_file)
+
+    # 2) Cross-file view from the per-file call records (no re-extraction)
+    with job.stage("correlation"):
+        calls = [
+            dict(call, file_index=f["index"], file=f["file"])
+            for f in files for call in f.get("calls", [])
+        ]
+        job.publish(
+            files=overview(),
+            file_summary=merge_file_summary(files),
+            correlated_calls=correlate_calls(files),
+            skipped=inputs.skipped,
+            total_calls=len(calls),
+            calls=calls,
+        )
+
+    # 3) Captures to storage + job / call rows (no per-call AI for batches)
+    with job.stage("persist"):
+        for batch_file in inputs.files:
+            bucket_path = f"{job_id}/{batch_file.index}-{os.path.basename(batch_file.name)}"
+            safe_supabase_storage_upload("pcap", bucket_path, batch_file.path)
+
         safe_supabase_insert("pcap_jobs", {
             "id": job_id,
-            "filename": file.filename,
-            "total_calls": analysis.get("total_calls", 0),
-            "bucket_path": bucket_path
+            "filename": job.filename,
+            "total_calls": len(calls),
+            "bucket_path": f"{job_id}/",
         })
-
-        # 8) Save each call row + per-call AI explanation (optional but good)
-        for call in analysis.get("calls", []):
-            try:
-                ai_text = explain_call(call, "Explain this call in bullet points for an engineer.")
-            except Exception as e:
-                print("⚠️ AI explanation failed:", e)
-                ai_text = "AI explanation unavailable"
-
+        for call in calls:
             safe_supabase_insert("sip_calls", {
                 "id": str(uuid.uuid4()),
                 "job_id": job_id,
                 "call_id": call.get("call_id"),
-
-                # schema-aligned
                 "outcome": call.get("final_verdict"),
                 "reason": call.get("root_cause"),
                 "root_cause": call.get("root_cause"),
                 "events": call.get("timeline"),
-
-                "ai_explanation": ai_text
+                "ai_explanation": "AI explanation unavailable",
             })
 
-        # 9) Response (UI should display these)
-        return {
-            "job_id": job_id,
-            "file": file.filename,
-            "bucket_path": bucket_path,
+        if ENABLE_SUPABASE and not db_writer.flush(timeout=PERSIST_WAIT_SEC):
+            print(f"⚠️ Job {job_id}: rows still pending after {PERSIST_WAIT_SEC}s")
 
-            # NEW: file overview
-            "packet_stats": packet_stats,
-            "capture_context": context_info.get("context"),
-            "total_calls": analysis.get("total_calls", 0),
+@app.post("/analyze/batch", status_code=202)
+async def analyze_batch(files: List[UploadFile] = File(...)):
+    """
+    Several captures in one job: pcap/pcapng files and/or zip/tar
+    archives of them (one per SBC / P-CSCF ...).
+    """
+    files = [f for f in files if f and f.filename]
+    if not files:
+        raise HTTPException(status_code=400, detail="No file received")
+
+    job_id = str(uuid.uuid4())
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    inputs = BatchInputs(job_dir)
+    request_timings = SpanRecorder()
+    try:
+        with span("request.upload_stream", recorder=request_timings):
+            for upload in files:
+                await run_in_threadpool(inputs.add_upload, upload.filename, upload.file)
+    except UploadRejected as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-            # NEW: AI insight for the entire file
-            "file_ai_insight": file_ai_insight,
+    if not inputs.files:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="No pcap/pcapng captures found in the upload")
 
-            # keep calls so UI can show “all details”
-            "calls": analysis.get("calls", [])
-        }
+    label = files[0].filename if len(files) == 1 else f"{len(files)} uploads"
+    job = job_manager.create(job_id, f"{label} ({len(inputs.files)} captures)", BATCH_STAGES)
+    job.timings.merge(request_timings)
+    try:
+        job_manager.submit(job, lambda j: run_batch_pipeline(j, inputs))
+    except JobQueueFull as e:
+        discard_job_dir(job_id)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(JOB_RETRY_AFTER_SEC)})
 
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
+    return {
+        "job_id": job_id,
+        "files": [{"index": f.index, "file": f.name, "bytes": f.size} for f in inputs.files],
+        "skipped": inputs.skipped,
+        "status": job.status,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    }
+
+# -------------------------
+# Job status / progress
+# -------------------------
+def _get_job(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str, timings: bool = False, calls: bool = True):
+    # ?timings=true adds the per-stage / per-span breakdown;
+    # ?calls=false leaves calls out (paged via /jobs/{id}/calls)
+    return FastJSONResponse(_get_job(job_id).snapshot(include_timings=timings, include_calls=calls))
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, calls: bool = True):
+    job = _get_job(job_id)
+
+    async def stream():
+        seen = -1
+        while True:
+            snap = job.snapshot(include_result=False)
+            if snap["version"] != seen:
+                seen = snap["version"]
+                yield f"event: progress\ndata: {dumps(snap).decode()}\n\n"
+            if snap["status"] in (DONE, FAILED):
+                final = job.snapshot(include_timings=True, include_calls=calls)
+                yield f"event: {snap['status']}\ndata: {dumps(final).decode()}\n\n"
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_SEC)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# -------------------------
+# Calls: paged / projected / NDJSON stream
+# -------------------------
+def _call_view(verdict: Optional[str], status: Optional[str], fields: Optional[str]):
+    try:
+        return call_filter(verdict, status), call_projection(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/jobs/{job_id}/calls")
+def job_calls(
+    job_id: str,
+    offset: int = 0,
+    limit: int = 100,
+    verdict: Optional[str] = None,
+    status: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    ?verdict=SIP_FAILURE,MEDIA_FAILURE  ?status=failing|success
+    ?fields=summary|full|call_id,timeline,...
+    """
+    job = _get_job(job_id)
+    if offset < 0 or not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"offset >= 0 and 1 <= limit <= {MAX_PAGE_SIZE}")
+    match, project = _call_view(verdict, status, fields)
+
+    total, page = job.calls_page(offset, limit, match)
+    end = offset + len(page)
+    return FastJSONResponse({
+        "job_id": job_id,
+        "status": job.status,   # totals still grow while running
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": end if end < total else None,
+        "calls": [project(c) for c in page],
+    })
+
+@app.get("/jobs/{job_id}/calls/stream")
+async def job_calls_stream(
+    job_id: str,
+    verdict: Optional[str] = None,
+    status: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    NDJSON, one call per line, as calls are produced; ends with the job.
+    Streamed calls carry what was known when they were read (exports and
+    AI explanations of a running job may still be missing).
+    """
+    job = _get_job(job_id)
+    match, project = _call_view(verdict, status, fields)
+
+    async def stream():
+        sent = 0
+        while True:
+            calls, finished = job.calls_since(sent, MAX_PAGE_SIZE)
+            sent += len(calls)
+            lines = [dumps(project(c)) for c in calls if match is None or match(c)]
+            if lines:
+                yield b"\n".join(lines) + b"\n"
+            if finished:
+                return
+            if len(calls) < MAX_PAGE_SIZE:
+                await asyncio.sleep(JOB_EVENTS_POLL_SEC)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+# -------------------------
+# Result cache stats
+# -------------------------
+@app.get("/cache/stats")
+def cache_stats():
+    return {**result_cache.stats(), "explanations": explanation_cache.stats()}
+
+# -------------------------
+# Persistence writer stats
+# -------------------------
+@app.get("/persistence/stats")
+def persistence_stats():
+    return db_writer.stats()
+
+# -------------------------
+# Prometheus metrics
+# -------------------------
+JOBS_GAUGE = registry.gauge("pcap_jobs", "Retained analysis jobs by status.")
+TSHARK_SLOTS_GAUGE = registry.gauge("tshark_slots", "tshark admission control (running / waiting / limits).")
+TSHARK_REJECTED_GAUGE = registry.gauge("tshark_rejected", "tshark runs refused while saturated (since start).")
+SHARKD_GAUGE = registry.gauge("sharkd_sessions", "Pooled sharkd sessions (busy / idle) and lifecycle counters (since start).")
+PERSIST_GAUGE = registry.gauge("persistence", "Supabase writer counters (since start) and pending rows.")
+CACHE_GAUGE = registry.gauge("cache", "Result / explanation cache counters (since start).")
+STARTUP_GAUGE = registry.gauge("api_import_seconds", "Time to import the API module (worker boot).")
+
+@app.get("/metrics")
+def metrics():
+    for status, count in job_manager.stats().items():
+        JOBS_GAUGE.set(count, status=status)
+
+    slots = tshark_slots.stats()
+    for key in ("running", "waiting", "max_procs", "max_waiters"):
+        TSHARK_SLOTS_GAUGE.set(slots[key], state=key)
+    TSHARK_REJECTED_GAUGE.set(slots["rejected"])
+
+    for key, value in sharkd_pool.stats().items():
+        SHARKD_GAUGE.set(int(value), state=key)
+
+    for key, value in db_writer.stats().items():
+        PERSIST_GAUGE.set(value, counter=key)
+
+    for cache, stats in (("result", result_cache.stats()), ("explanations", explanation_cache.stats())):
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                CACHE_GAUGE.set(value, cache=cache, counter=key)
+
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+# -------------------------
+# Per-call PCAP export (on demand)
+# -------------------------
+@app.get("/jobs/{job_id}/calls/{call_id}/pcap")
+def download_call_pcap(job_id: str, call_id: str, file: Optional[int] = None):
+    # Batch jobs: ?file=<file_index> picks the capture the call was seen in
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid job_id")
+
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    if file is not None:
+        job_dir = os.path.join(job_dir, "files", str(file))
+    captures = glob.glob(os.path.join(job_dir, "capture.*"))
+    if not captures:
+        raise HTTPException(status_code=404, detail="Job capture not found")
+
+    frames = load_call_frames(job_dir).get(call_id)
+    if frames is None:
+        raise HTTPException(status_code=404, detail=f"Unknown call: {call_id}")
+
+    export_info = export_call(captures[0], call_id, frames, output_dir=job_dir)
+    if export_info.get("retry_after"):
+        raise HTTPException(
+            status_code=429,
+            detail=export_info.get("reason", "Busy"),
+            headers={"Retry-After": str(export_info["retry_after"])},
+        )
+    if not export_info.get("pcap_available"):
+        raise HTTPException(status_code=500, detail=export_info.get("reason", "Export failed"))
+
+    return FileResponse(
+        export_info["path"],
+        media_type="application/vnd.tcpdump.pcap",
+        filename=os.path.basename(export_info["path"]),
+    )
 
 # -------------------------
 # Chat API
@@ -176,6 +669,16 @@ async def chat(job_id: str, payload: ChatRequest):
     if not payload.question:
         raise HTTPException(400, "Question is required")
 
-    answer = chat_about_job(job_id, payload.question)
+    # In-memory analysis of a finished job (if this API still holds it)
+    # skips the DB read; a running job's rows are partial, so not cached
+    job = job_manager.get(job_id)
+    calls = job.finished_calls() if job else None
+    cache = job is None or job.status in (DONE, FAILED)
+
+    # Blocking (Supabase + OpenAI): keep it off the event loop
+    answer = await run_in_threadpool(chat_about_job, job_id, payload.question, calls, cache)
 
     return {"job_id": job_id, "question": payload.question, "answer": answer}
+
+# Boot cost of this worker (clients / analyzers load lazily, after this)
+STARTUP_GAUGE.set(round(time.perf_counter() - _BOOT_STARTED, 4))
@@ -0,0 +1,116 @@
+import socket
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+
+from packet_store import RtpColumns, MISSING
+
+
+def normalize_ip(addr: str) -> str:
+    """
+    Canonical text form so SDP addresses match packet addresses
+    (e.g. "2001:DB8:0::1" -> "2001:db8::1").
+    """
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return socket.inet_ntop(family, socket.inet_pton(family, addr))
+        except OSError:
+            continue
+    return addr
+
+
+class MediaIndex:
+    """
+    SDP media endpoint (ip, port) -> Call-ID, as of any frame number.
+
+    Each offer/answer is one (endpoint, frame, call) event; events are kept
+    sorted by (endpoint, frame) so a whole RTP column is resolved with one
+    searchsorted: the owner of a packet is the latest event for its
+    endpoint before the packet's frame (later SDP takes a reused port over).
+    """
+
+    def __init__(self, rtp: RtpColumns):
+        self.rtp = rtp
+        self._events: List[Tuple[int, int, int]] = []  # (endpoint key, frame, call code)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def learn(self, frame: int, call_id: str, media: List[Tuple[str, int, List[str]]]) -> None:
+        call = self.rtp.call_ids.code(call_id)
+        for addr, port, _fmts in media:
+            ip = self.rtp.ips.code(normalize_ip(addr))
+            self._events.append(((ip << 16) | port, frame, call))
+
+    def owners(self) -> np.ndarray:
+        """
+        Call code per RTP packet (MISSING when no SDP announced its endpoints).
+        Destination endpoint wins, source endpoint is the fallback.
+        """
+        rtp = self.rtp
+        owners = np.full(len(rtp), MISSING, dtype=np.int32)
+        if not self._events or not len(rtp):
+            return owners
+
+        ev = np.array(self._events, dtype=np.int64)
+        ev = ev[np.lexsort((ev[:, 1], ev[:, 0]))]
+        ev_key, ev_frame, ev_call = ev[:, 0], ev[:, 1], ev[:, 2]
+
+        # Dense endpoint ranks keep the (rank, frame) composite within int64
+        keys = np.unique(ev_key)
+        span = int(max(ev_frame.max(), rtp.frame.max())) + 1
+        ev_comp = np.searchsorted(keys, ev_key) * span + ev_frame
+
+        for ip_col, port_col in ((rtp.dst, rtp.dst_port), (rtp.src, rtp.src_port)):
+            todo = owners == MISSING
+            if not todo.any():
+                break
+
+            key = (ip_col.astype(np.int64) << 16) | port_col
+            rank = np.searchsorted(keys, key)
+            known = (rank < len(keys)) & (port_col >= 0)
+            known[known] = keys[rank[known]] == key[known]
+
+            pos = np.searchsorted(ev_comp, rank * span + rtp.frame, side="left") - 1
+            hit = todo & known & (pos >= 0)
+            hit[hit] = ev_key[pos[hit]] == key[hit]
+
+            owners[hit] = ev_call[pos[hit]]
+
+        return owners
+
+
+def route_media(
+    sip_packets: List[Dict[str, Any]],
+    rtp: RtpColumns,
+) -> Tuple[Dict[str, RtpColumns], RtpColumns]:
+    """
+    SDP bodies teach the index, every RTP packet is resolved to its call
+    in one vectorized lookup (no per-packet Python work).
+
+    Returns (RTP column view per Call-ID, unrouted RTP).
+    """
+    index = MediaIndex(rtp)
+    for pkt in sip_packets:
+        if pkt.get("media"):
+            index.learn(pkt["frame"], pkt["call_id"], pkt["media"])
+
+    rtp.call = index.owners()
+
+    # Group once by call (stable: capture order kept inside each call),
+    # then hand out contiguous slices of the regrouped columns.
+    order = np.argsort(rtp.call, kind="stable")
+    grouped = rtp.take(order)
+    codes, starts, counts = np.unique(grouped.call, return_index=True, return_counts=True)
+
+    routed: Dict[str, RtpColumns] = {}
+    unrouted = RtpColumns.empty(rtp.ips, rtp.call_ids)
+
+    for code, start, count in zip(codes.tolist(), starts.tolist(), counts.tolist()):
+        view = grouped[start:start + count]
+        if code == MISSING:
+            unrouted = view
+        else:
+            routed[rtp.call_ids.values[code]] = view
+
+    return routed, unrouted
@@ -0,0 +1,283 @@
+import sys
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# Seconds; spans range from sub-ms per-call steps to multi-minute tshark runs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+MAX_RECORDED_EVENTS = 50   # per job: individual tshark runs etc. kept verbatim
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_max(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = max(self._values.get(key, value), value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}   # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for key, values in series:
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, values):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {values[-2]!r}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_value(values[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, **kw):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kw)
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format (0.0.4).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram("pcap_stage_seconds", "Wall time per pipeline stage / span.")
+STAGE_ERRORS = registry.counter("pcap_stage_errors_total", "Spans that ended with an exception.")
+
+TSHARK_SECONDS = registry.histogram("tshark_run_seconds", "Wall time per tshark process.")
+TSHARK_RUNS = registry.counter("tshark_runs_total", "tshark processes by command kind and outcome.")
+TSHARK_CPU = registry.counter("tshark_cpu_seconds_total", "tshark user+system CPU (rusage).")
+TSHARK_OUTPUT = registry.counter("tshark_output_bytes_total", "Bytes tshark wrote to stdout.")
+TSHARK_MAX_RSS = registry.gauge("tshark_max_rss_bytes", "Largest tshark peak RSS seen (rusage).")
+
+
+# -----------------------------
+# Per-job breakdown
+# -----------------------------
+class SpanRecorder:
+    """
+    Aggregated spans of one job (name -> count / total / max) plus the
+    first MAX_RECORDED_EVENTS individual events (tshark runs).
+    """
+
+    def __init__(self):
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, **attrs: Any) -> None:
+        with self._lock:
+            entry = self._totals.setdefault(name, {"count": 0, "total_sec": 0.0, "max_sec": 0.0})
+            entry["count"] += 1
+            entry["total_sec"] += seconds
+            entry["max_sec"] = max(entry["max_sec"], seconds)
+            if attrs and len(self._events) < MAX_RECORDED_EVENTS:
+                self._events.append({"name": name, "seconds": round(seconds, 4), **attrs})
+
+    def merge(self, other: "SpanRecorder") -> None:
+        with other._lock:
+            totals = {k: dict(v) for k, v in other._totals.items()}
+            events = list(other._events)
+        with self._lock:
+            for name, theirs in totals.items():
+                entry = self._totals.setdefault(name, {"count": 0, "total_sec": 0.0, "max_sec": 0.0})
+                entry["count"] += theirs["count"]
+                entry["total_sec"] += theirs["total_sec"]
+                entry["max_sec"] = max(entry["max_sec"], theirs["max_sec"])
+            self._events.extend(events[:MAX_RECORDED_EVENTS - len(self._events)])
+
+    def breakdown(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = {
+                name: {
+                    "count": int(v["count"]),
+                    "total_sec": round(v["total_sec"], 4),
+                    "max_sec": round(v["max_sec"], 4),
+                }
+                for name, v in self._totals.items()
+            }
+            return {"spans": spans, "events": list(self._events)}
+
+
+_recorder: ContextVar[Optional[SpanRecorder]] = ContextVar("span_recorder", default=None)
+
+
+@contextmanager
+def recording(recorder: SpanRecorder) -> Iterator[SpanRecorder]:
+    """
+    Spans opened in this context (thread / task) also land in `recorder`.
+    """
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def span(name: str, recorder: Optional[SpanRecorder] = None, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Times the block into pcap_stage_seconds{stage=name} and the current
+    job's recorder. The yielded dict takes extra attributes for the job
+    breakdown (kept only for spans that carry attributes).
+    """
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        attrs["outcome"] = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        target = recorder or _recorder.get()
+        if target is not None:
+            target.add(name, elapsed, **attrs)
+
+
+# -----------------------------
+# tshark
+# -----------------------------
+def tshark_kind(args: List[str]) -> str:
+    """
+    Low-cardinality label for a tshark command line.
+    """
+    if "-w" in args:
+        return "export"
+    if "-z" in args:
+        return "stats"
+    if "-T" in args:
+        return "fields"
+    if "-v" in args or "--version" in args:
+        return "version"
+    return "other"
+
+
+def record_tshark(args: List[str], seconds: float, rusage: Any, output_bytes: int, outcome: str) -> None:
+    kind = tshark_kind(args)
+    TSHARK_SECONDS.observe(seconds, kind=kind)
+    TSHARK_RUNS.inc(kind=kind, outcome=outcome)
+    TSHARK_OUTPUT.inc(output_bytes, kind=kind)
+
+    attrs: Dict[str, Any] = {
+        "kind": kind,
+        "args": " ".join(args)[:300],
+        "outcome": outcome,
+        "output_bytes": output_bytes,
+    }
+    if rusage is not None:
+        cpu = rusage.ru_utime + rusage.ru_stime
+        # ru_maxrss is KB on Linux, bytes on macOS
+        rss = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        TSHARK_CPU.inc(cpu, kind=kind)
+        TSHARK_MAX_RSS.set_max(rss, kind=kind)
+        attrs.update(cpu_sec=round(cpu, 3), max_rss_bytes=rss)
+
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.add("tshark", seconds, **attrs)
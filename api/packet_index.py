@@ -0,0 +1,112 @@
+import mmap
+import struct
+from array import array
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from pcap_reader import (
+    UnsupportedCapture,
+    PCAP_MAGIC_US,
+    PCAP_MAGIC_NS,
+    PCAPNG_SHB,
+    PCAPNG_BYTE_ORDER_MAGIC,
+    PCAPNG_IDB,
+)
+
+# pcapng blocks that carry one captured packet each (obsolete, simple, enhanced)
+PCAPNG_PACKET_BLOCKS = {0x00000002, 0x00000003, 0x00000006}
+
+
+@dataclass
+class PacketIndex:
+    """
+    Frame number -> on-disk record, built once per capture.
+
+    offsets[n - 1] / lengths[n - 1] locate frame n (record header included),
+    so a writer can copy any set of frames without re-dissecting the file.
+    """
+    pcap_file: str
+    fmt: str                                  # "pcap" | "pcapng"
+    header: bytes = b""                       # classic pcap global header
+    sections: List[List[Tuple[int, int]]] = field(default_factory=list)  # pcapng SHB + IDBs
+    offsets: array = field(default_factory=lambda: array("Q"))
+    lengths: array = field(default_factory=lambda: array("I"))
+    section_of: array = field(default_factory=lambda: array("H"))         # pcapng only
+
+    @property
+    def total_frames(self) -> int:
+        return len(self.offsets)
+
+
+def build_packet_index(pcap_file: str) -> PacketIndex:
+    """
+    Walks record headers only (no decoding). Works for any link type.
+    """
+    with open(pcap_file, "rb") as fh:
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            raise UnsupportedCapture(f"cannot map capture: {e}") from e
+
+    try:
+        if len(mm) < 24:
+            raise UnsupportedCapture("file too short for pcap/pcapng")
+
+        if struct.unpack_from("<I", mm, 0)[0] == PCAPNG_SHB:
+            return _index_pcapng(pcap_file, mm)
+
+        for endian in ("<", ">"):
+            if struct.unpack_from(endian + "I", mm, 0)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                return _index_pcap(pcap_file, mm, endian)
+
+        raise UnsupportedCapture("unknown capture magic")
+    finally:
+        mm.close()
+
+
+def _index_pcap(pcap_file: str, mm, endian: str) -> PacketIndex:
+    index = PacketIndex(pcap_file=pcap_file, fmt="pcap", header=mm[:24])
+    size = len(mm)
+    off = 24
+
+    while off + 16 <= size:
+        caplen = struct.unpack_from(endian + "I", mm, off + 8)[0]
+        rec_len = 16 + caplen
+        if off + rec_len > size:
+            break
+        index.offsets.append(off)
+        index.lengths.append(rec_len)
+        off += rec_len
+
+    return index
+
+
+def _index_pcapng(pcap_file: str, mm) -> PacketIndex:
+    index = PacketIndex(pcap_file=pcap_file, fmt="pcapng")
+    size = len(mm)
+    off = 0
+    endian = "<"
+
+    while off + 12 <= size:
+        btype = struct.unpack_from(endian + "I", mm, off)[0]
+
+        if btype == PCAPNG_SHB:
+            bom = struct.unpack_from("<I", mm, off + 8)[0]
+            endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+
+        blen = struct.unpack_from(endian + "I", mm, off + 4)[0]
+        if blen < 12 or off + blen > size:
+            break
+
+        if btype == PCAPNG_SHB:
+            index.sections.append([(off, blen)])
+        elif btype == PCAPNG_IDB:
+            index.sections[-1].append((off, blen))
+        elif btype in PCAPNG_PACKET_BLOCKS:
+            index.offsets.append(off)
+            index.lengths.append(blen)
+            index.section_of.append(len(index.sections) - 1)
+
+        off += blen
+
+    return index
@@ -0,0 +1,232 @@
+from array import array
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Union
+
+import numpy as np
+
+
+MISSING = -1
+
+RTP_COLUMNS = (
+    "frame", "time", "src", "dst", "src_port", "dst_port", "ssrc",
+    "seq", "timestamp", "payload_type", "call",
+)
+
+# (array typecode used while building, numpy dtype of the finished column)
+_RTP_TYPES = {
+    "frame": ("q", np.int64),
+    "time": ("d", np.float64),
+    "src": ("i", np.int32),
+    "dst": ("i", np.int32),
+    "src_port": ("i", np.int32),
+    "dst_port": ("i", np.int32),
+    "ssrc": ("q", np.int64),
+    "seq": ("i", np.int32),
+    "timestamp": ("q", np.int64),
+    "payload_type": ("i", np.int32),
+}
+
+
+class StringTable:
+    """
+    Dictionary encoding: each distinct string (IP, Call-ID) is stored once,
+    columns hold its int code.
+    """
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def find(self, value: str) -> int:
+        return self._codes.get(value, MISSING)
+
+    def decode(self, codes: Iterable[int]) -> List[Optional[str]]:
+        values = self.values
+        return [values[c] if c >= 0 else None for c in codes]
+
+
+class RtpColumns:
+    """
+    Columnar RTP packet container (one NumPy array per field).
+
+    - slicing (rtp[a:b]) returns a view sharing the same columns and tables
+    - take(indices) returns a reordered / filtered copy
+    - rtp[i] returns the legacy per-packet dict, so row-oriented callers
+      (timeline first/last packet, CLI output) keep working
+    """
+    __slots__ = RTP_COLUMNS + ("ips", "call_ids")
+
+    def __init__(self, ips: StringTable, call_ids: StringTable, **columns: np.ndarray):
+        self.ips = ips
+        self.call_ids = call_ids
+        for name in RTP_COLUMNS:
+            setattr(self, name, columns[name])
+
+    @classmethod
+    def empty(cls, ips: Optional[StringTable] = None, call_ids: Optional[StringTable] = None) -> "RtpColumns":
+        columns = {name: np.empty(0, dtype=dtype) for name, (_, dtype) in _RTP_TYPES.items()}
+        columns["call"] = np.empty(0, dtype=np.int32)
+        return cls(ips or StringTable(), call_ids or StringTable(), **columns)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @classmethod
+    def concat(cls, parts: List["RtpColumns"]) -> "RtpColumns":
+        """
+        Joins column sets built with separate string tables (e.g. one per
+        capture shard), re-coding IPs / Call-IDs into shared tables.
+        """
+        ips, call_ids = StringTable(), StringTable()
+        columns: Dict[str, List[np.ndarray]] = {name: [] for name in RTP_COLUMNS}
+
+        for part in parts:
+            remap_ip = np.array([ips.code(v) for v in part.ips.values] + [MISSING], dtype=np.int32)
+            remap_call = np.array([call_ids.code(v) for v in part.call_ids.values] + [MISSING], dtype=np.int32)
+            for name in RTP_COLUMNS:
+                col = getattr(part, name)
+                if name in ("src", "dst"):
+                    col = remap_ip[col]
+                elif name == "call":
+                    col = remap_call[col]  # MISSING (-1) indexes the trailing MISSING
+                columns[name].append(col)
+
+        if not parts:
+            return cls.empty(ips, call_ids)
+        return cls(ips, call_ids, **{name: np.concatenate(cols) for name, cols in columns.items()})
+
+    def _with(self, selector) -> "RtpColumns":
+        return RtpColumns(
+            self.ips,
+            self.call_ids,
+            **{name: getattr(self, name)[selector] for name in RTP_COLUMNS}
+        )
+
+    def take(self, indices: np.ndarray) -> "RtpColumns":
+        return self._with(indices)
+
+    def __getitem__(self, key: Union[int, slice, np.ndarray]):
+        if isinstance(key, slice):
+            return self._with(key)
+        if isinstance(key, np.ndarray):
+            return self._with(key)
+        return self.row(key)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        ssrc = int(self.ssrc[i])
+        sport = int(self.src_port[i])
+        dport = int(self.dst_port[i])
+        seq = int(self.seq[i])
+        ts = int(self.timestamp[i])
+        pt = int(self.payload_type[i])
+        call = int(self.call[i])
+        return {
+            "frame": int(self.frame[i]),
+            "time": float(self.time[i]),
+            "src": self.ips.values[self.src[i]],
+            "dst": self.ips.values[self.dst[i]],
+            "src_port": sport if sport != MISSING else None,
+            "dst_port": dport if dport != MISSING else None,
+            "ssrc": "0x%08x" % ssrc if ssrc != MISSING else None,
+            "seq": seq if seq != MISSING else None,
+            "timestamp": ts if ts != MISSING else None,
+            "payload_type": pt if pt != MISSING else None,
+            "call_id": self.call_ids.values[call] if call != MISSING else None,
+        }
+
+
+class RtpColumnsBuilder:
+    """
+    Append-only builder backed by array.array (compact while growing);
+    build() wraps the buffers as NumPy columns without copying.
+    """
+
+    def __init__(self, ips: Optional[StringTable] = None):
+        self.ips = ips or StringTable()
+        self._cols = {name: array(code) for name, (code, _) in _RTP_TYPES.items()}
+
+    def __len__(self) -> int:
+        return len(self._cols["frame"])
+
+    def append(self, frame: int, time: float, src: str, dst: str,
+               src_port: int, dst_port: int, ssrc: int,
+               seq: int, timestamp: int, payload_type: int) -> None:
+        cols = self._cols
+        cols["frame"].append(frame)
+        cols["time"].append(time)
+        cols["src"].append(self.ips.code(src))
+        cols["dst"].append(self.ips.code(dst))
+        cols["src_port"].append(src_port)
+        cols["dst_port"].append(dst_port)
+        cols["ssrc"].append(ssrc)
+        cols["seq"].append(seq)
+        cols["timestamp"].append(timestamp)
+        cols["payload_type"].append(payload_type)
+
+    def extend_fields(self, frames: List[str], times: List[str], srcs: List[str], dsts: List[str],
+                      sports: List[str], dports: List[str], ssrcs: List[str],
+                      seqs: List[str], timestamps: List[str], payload_types: List[str]) -> None:
+        """
+        Bulk-append tshark field columns (strings, one list per field).
+        """
+        cols = self._cols
+        code = self.ips.code
+        cols["frame"].extend(map(int, frames))
+        cols["time"].extend(map(float, times))
+        cols["src"].extend(map(code, srcs))
+        cols["dst"].extend(map(code, dsts))
+        cols["src_port"].extend([int(p) if p else MISSING for p in sports])
+        cols["dst_port"].extend([int(p) if p else MISSING for p in dports])
+        cols["ssrc"].extend([int(s, 16) if s else MISSING for s in ssrcs])
+        cols["seq"].extend([int(v) if v else MISSING for v in seqs])
+        cols["timestamp"].extend([int(v) if v else MISSING for v in timestamps])
+        cols["payload_type"].extend([int(v) if v else MISSING for v in payload_types])
+
+    def build(self) -> RtpColumns:
+        columns = {
+            name: np.frombuffer(self._cols[name], dtype=dtype)
+            for name, (_, dtype) in _RTP_TYPES.items()
+        }
+        columns["call"] = np.full(len(columns["frame"]), MISSING, dtype=np.int32)
+        return RtpColumns(self.ips, StringTable(), **columns)
+
+
+def split_field_rows(block: str, width: int) -> List[str]:
+    """
+    Splits a line-aligned tshark fields block into one flat list
+    (row i, field k -> flat[i * width + k]) with two C-level calls
+    instead of a split per line. Falls back to per-line splitting
+    (dropping short rows) only when a row is malformed.
+    """
+    flat = block.replace("\n", "|").split("|")
+    if flat and flat[-1] == "":
+        flat.pop()
+    if len(flat) % width == 0 and block.count("\n") == len(flat) // width:
+        return flat
+
+    flat = []
+    for line in block.splitlines():
+        parts = line.split("|")
+        if len(parts) >= width:
+            flat.extend(parts[:width])
+    return flat
+
+
+def first_values(values: List[str], aggregator: str = ",") -> List[str]:
+    """
+    occurrence=a columns -> first occurrence of each value.
+    """
+    return [v.partition(aggregator)[0] for v in values]
@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import mmap
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from tshark_runner import detect_context_from_protocols
+from packet_store import RtpColumns, MISSING
+from packet_index import PacketIndex
+from pcap_reader import (
+    ENABLE_NATIVE_READER,
+    SIP_UDP_PORT,
+    UnsupportedCapture,
+    iter_frames,
+    read_capture,
+    read_capture_range,
+    try_read_capture,
+)
+from pcap_exporter import load_packet_index
+
+
+# Worker processes used to decode one capture (1 = single pass)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(os.cpu_count() or 1)))
+
+# Below this size process start-up / pickling costs more than it saves
+SHARD_MIN_BYTES = int(os.getenv("SHARD_MIN_BYTES", str(64 * 1024 * 1024)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # spawn: the API process is multi-threaded (job workers), fork is unsafe there
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=ANALYSIS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def plan_shards(index: PacketIndex, shards: int) -> List[Tuple[int, int, int, List[Tuple[int, int]]]]:
+    """
+    Contiguous frame ranges -> (start, stop, frames_before, preamble) byte
+    ranges for read_capture_range. pcapng shards carry the SHB/IDBs of the
+    section they start in.
+    """
+    total = index.total_frames
+    shards = max(1, min(shards, total))
+    plan = []
+
+    for i in range(shards):
+        lo = total * i // shards
+        hi = total * (i + 1) // shards
+        if lo == hi:
+            continue
+        start = index.offsets[lo]
+        stop = index.offsets[hi - 1] + index.lengths[hi - 1]
+        preamble = index.sections[index.section_of[lo]] if index.fmt == "pcapng" else []
+        plan.append((start, stop, lo, list(preamble)))
+
+    return plan
+
+
+def announced_before(rtp: RtpColumns, endpoints: Dict[Tuple[str, int], int]) -> np.ndarray:
+    """
+    True where the packet's destination or source endpoint was announced
+    by SDP in an earlier frame (same rule as the single-pass reader).
+    """
+    keys, frames = [], []
+    for (ip, port), frame in endpoints.items():
+        code = rtp.ips.find(ip)
+        if code != MISSING:
+            keys.append((code << 16) | port)
+            frames.append(frame)
+
+    keep = np.zeros(len(rtp), dtype=bool)
+    if not keys:
+        return keep
+
+    keys_arr = np.array(keys, dtype=np.int64)
+    order = np.argsort(keys_arr)
+    keys_arr = keys_arr[order]
+    frames_arr = np.array(frames, dtype=np.int64)[order]
+
+    for ip_col, port_col in ((rtp.dst, rtp.dst_port), (rtp.src, rtp.src_port)):
+        key = (ip_col.astype(np.int64) << 16) | port_col
+        pos = np.minimum(np.searchsorted(keys_arr, key), len(keys_arr) - 1)
+        keep |= (keys_arr[pos] == key) & (frames_arr[pos] < rtp.frame)
+
+    return keep
+
+
+def merge_shards(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Deterministic merge (shards are in frame order): identical output to
+    pcap_reader.read_capture on the whole file.
+    """
+    sip_packets: List[Dict[str, Any]] = []
+    endpoints: Dict[Tuple[str, int], int] = {}
+    layers = set()
+    total_packets = 0
+    sip_count = 0
+
+    for part in parts:
+        sip_packets.extend(part["sip_packets"])
+        layers |= part["layers"]
+        total_packets += part["packet_stats"]["total_packets"]
+        sip_count += part["packet_stats"]["sip_packets"]
+        for endpoint, frame in part["sdp_endpoints"].items():
+            if frame < endpoints.get(endpoint, frame + 1):
+                endpoints[endpoint] = frame
+
+    candidates = RtpColumns.concat([p["rtp_packets"] for p in parts])
+    keep = announced_before(candidates, endpoints)
+    rtp = candidates.take(np.flatnonzero(keep))
+
+    # Rejected candidates on the SIP port are dissected as (non-message) sip
+    on_sip_port = (candidates.src_port == SIP_UDP_PORT) | (candidates.dst_port == SIP_UDP_PORT)
+    sip_noise = int(np.count_nonzero(on_sip_port & ~keep))
+    if sip_noise:
+        sip_count += sip_noise
+        layers.add("sip")
+    if len(rtp):
+        layers.add("rtp")
+
+    return {
+        "sip_packets": sip_packets,
+        "rtp_packets": rtp,
+        "packet_stats": {
+            "total_packets": total_packets,
+            "sip_packets": sip_count,
+            "rtp_packets": len(rtp)
+        },
+        "context": detect_context_from_protocols(layers)
+    }
+
+
+def read_capture_sharded(
+    pcap_file: str,
+    workers: int = ANALYSIS_WORKERS,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Dict[str, Any]:
+    """
+    Native read split over `workers` processes: the capture is cut into
+    contiguous frame ranges (from the packet index, which the failing-call
+    export reuses), every shard is decoded independently and the results
+    are merged in frame order. Raises UnsupportedCapture like read_capture.
+    """
+    if workers <= 1:
+        return read_capture(pcap_file)
+
+    index = load_packet_index(pcap_file)
+    if index.total_frames == 0:
+        return read_capture(pcap_file)
+
+    with open(pcap_file, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            first_ts = next(iter_frames(mm))[1]
+        finally:
+            mm.close()
+
+    pool = pool or _get_pool()
+    futures = [
+        pool.submit(read_capture_range, pcap_file, start, stop, frame_no, preamble, first_ts)
+        for start, stop, frame_no, preamble in plan_shards(index, workers)
+    ]
+    return merge_shards([f.result() for f in futures])
+
+
+def try_read_capture_sharded(pcap_file: str) -> Optional[Dict[str, Any]]:
+    """
+    try_read_capture, sharded over ANALYSIS_WORKERS processes for large
+    captures. None when the capture needs tshark.
+    """
+    if not ENABLE_NATIVE_READER:
+        return None
+    if ANALYSIS_WORKERS <= 1 or os.path.getsize(pcap_file) < SHARD_MIN_BYTES:
+        return try_read_capture(pcap_file)
+    try:
+        return read_capture_sharded(pcap_file)
+    except UnsupportedCapture as e:
+        print(f"⚠️ Native reader fallback to tshark: {e}")
+        return None
+
+
+def main():
+    """
+    Scaling benchmark: python parallel_reader.py <pcap_file> [1,2,4,8]
+    """
+    if len(sys.argv) < 2:
+        print("Usage: python parallel_reader.py <pcap_file> [worker counts, e.g. 1,2,4,8]")
+        sys.exit(1)
+
+    pcap_file = sys.argv[1]
+    counts = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 2, 4, 8]
+    size_mb = os.path.getsize(pcap_file) / 1e6
+
+    results = []
+    baseline = None
+    reference = None
+
+    for workers in counts:
+        pool = None
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            list(pool.map(abs, range(workers)))  # warm the workers up
+
+        try:
+            started = time.perf_counter()
+            capture = read_capture_sharded(pcap_file, workers, pool)
+            elapsed = time.perf_counter() - started
+        finally:
+            if pool:
+                pool.shutdown()
+
+        summary = (capture["packet_stats"], len(capture["sip_packets"]), capture["rtp_packets"].frame.tolist())
+        if reference is None:
+            reference = summary
+        baseline = baseline or elapsed
+
+        results.append({
+            "workers": workers,
+            "seconds": round(elapsed, 3),
+            "mb_per_sec": round(size_mb / elapsed, 1),
+            "speedup": round(baseline / elapsed, 2),
+            "efficiency": round(baseline / elapsed / workers, 2),
+            "identical": summary == reference,
+        })
+
+    print(json.dumps({
+        "pcap": pcap_file,
+        "size_mb": round(size_mb, 1),
+        "cpus": os.cpu_count(),
+        "runs": results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,263 @@
-from tshark_runner import run_tshark
+from tshark_runner import run_tshark, TsharkBusy
+from packet_index import PacketIndex, build_packet_index
+from pcap_reader import UnsupportedCapture
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional
+import hashlib
+import json
+import mmap
 import os
+import re
+import tempfile
+import threading
 
 OUTPUT_DIR = "output"
+CALL_FRAMES_FILE = "call_frames.json"
 
+# Indexes of recently analyzed captures (on-demand exports reuse them)
+INDEX_CACHE_SIZE = 16
+_index_cache: "OrderedDict[str, PacketIndex]" = OrderedDict()
+_index_lock = threading.Lock()   # job workers + export requests
 
-def export_failing_call(pcap_file: str, call_id: str):
+
+def load_packet_index(pcap_file: str) -> PacketIndex:
+    """
+    Frame-offset index for a capture, built once and kept in a small LRU.
+    """
+    key = os.path.abspath(pcap_file)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+
+    # Built outside the lock (a concurrent build of the same file is harmless)
+    index = build_packet_index(pcap_file)
+    with _index_lock:
+        _index_cache[key] = index
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _call_pcap_path(output_dir: str, call_id: str, fmt: str) -> str:
+    # Sanitized Call-IDs can collide: the raw Call-ID hash keeps them apart
+    safe_id = re.sub(r"[^A-Za-z0-9_.@-]", "_", call_id)
+    digest = hashlib.sha1(call_id.encode("utf-8", "replace")).hexdigest()[:10]
+    return os.path.join(output_dir, f"{safe_id}-{digest}_failing.{fmt}")
+
+
+def _temp_path(output_path: str) -> str:
+    # Written here, then os.replace'd: concurrent exports never share a file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(output_path) or ".", suffix=".tmp")
+    os.close(fd)
+    return tmp
+
+
+def _discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _write_frames(index: PacketIndex, mm, frames: List[int], output_path: str) -> int:
+    """
+    Copies the given frames (sorted, 1-based) straight from the mapped
+    capture. pcapng sections are re-emitted with their SHB + IDBs.
+    """
+    written = 0
+    tmp = _temp_path(output_path)
+    try:
+        written = _copy_frames(index, mm, frames, tmp)
+        os.replace(tmp, output_path)
+    finally:
+        _discard(tmp)
+    return written
+
+
+def _copy_frames(index: PacketIndex, mm, frames: List[int], path: str) -> int:
+    written = 0
+    with open(path, "wb") as out:
+        if index.fmt == "pcap":
+            out.write(index.header)
+
+        current_section = None
+        for frame in frames:
+            if frame < 1 or frame > index.total_frames:
+                continue
+            i = frame - 1
+
+            if index.fmt == "pcapng" and index.section_of[i] != current_section:
+                current_section = index.section_of[i]
+                for j, (off, blen) in enumerate(index.sections[current_section]):
+                    block = bytearray(mm[off:off + blen])
+                    if j == 0:
+                        block[16:24] = b"\xff" * 8  # section length: unknown
+                    out.write(block)
+
+            off = index.offsets[i]
+            out.write(mm[off:off + index.lengths[i]])
+            written += 1
+
+    return written
+
+
+def export_calls(
+    pcap_file: str,
+    call_frames: Dict[str, Iterable[int]],
+    output_dir: str = OUTPUT_DIR,
+    reuse: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Batched exporter: writes every call's own SIP + media frames in one
+    sweep over the capture (one mmap, no tshark per call).
+    Falls back to one tshark frame-filtered read per call when the
+    capture cannot be indexed. reuse=True keeps an export already in
+    output_dir (same capture, same frames) instead of rewriting it.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    try:
+        index = load_packet_index(pcap_file)
+    except (UnsupportedCapture, OSError) as e:
+        print(f"⚠️ Packet index unavailable, exporting with tshark: {e}")
+        for call_id, frames in call_frames.items():
+            results[call_id] = export_failing_call(pcap_file, call_id, frames, output_dir, reuse)
+        return results
+
+    with open(pcap_file, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        for call_id, frames in call_frames.items():
+            output_pcap = _call_pcap_path(output_dir, call_id, index.fmt)
+            frames = sorted(set(frames))
+            try:
+                if reuse and os.path.exists(output_pcap):
+                    count = sum(1 for f in frames if 1 <= f <= index.total_frames)
+                else:
+                    count = _write_frames(index, mm, frames, output_pcap)
+                results[call_id] = {
+                    "pcap_available": True,
+                    "path": output_pcap,
+                    "packets": count
+                }
+            except Exception as e:
+                results[call_id] = {
+                    "pcap_available": False,
+                    "reason": str(e)
+                }
+    finally:
+        mm.close()
+
+    return results
+
+
+def export_call(
+    pcap_file: str,
+    call_id: str,
+    frames: Iterable[int],
+    output_dir: str = OUTPUT_DIR,
+) -> Dict[str, Any]:
     """
-    MVP-1 exporter
-    Exports SIP + RTP packets related to a Call-ID
+    Single call on demand (same index, same output layout); an earlier
+    export of the call is served as is.
     """
+    return export_calls(pcap_file, {call_id: frames}, output_dir, reuse=True)[call_id]
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    output_pcap = os.path.join(
-        OUTPUT_DIR,
-        f"{call_id}_failing.pcap"
+def _frame_filter(frames: Iterable[int]) -> str:
+    """
+    Compact display filter: frame.number in {1..4 9 12..20}
+    """
+    ranges: List[str] = []
+    start = prev = None
+    for f in sorted(set(frames)):
+        if start is None:
+            start = prev = f
+        elif f == prev + 1:
+            prev = f
+        else:
+            ranges.append(f"{start}..{prev}" if prev != start else str(start))
+            start = prev = f
+    if start is not None:
+        ranges.append(f"{start}..{prev}" if prev != start else str(start))
+    return "frame.number in {" + " ".join(ranges) + "}"
+
+
+def export_failing_call(
+    pcap_file: str,
+    call_id: str,
+    frames: Optional[Iterable[int]] = None,
+    output_dir: str = OUTPUT_DIR,
+    reuse: bool = False,
+):
+    """
+    MVP-1 exporter (tshark path)
+    Exports the call's own frames when known, otherwise its SIP by Call-ID.
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    output_pcap = _call_pcap_path(output_dir, call_id, "pcap")
+    if reuse and os.path.exists(output_pcap):
+        return {
+            "pcap_available": True,
+            "path": output_pcap
+        }
+
+    display_filter = (
+        _frame_filter(frames) if frames
+        else f'sip.Call-ID == "{call_id}"'
     )
 
+    tmp = _temp_path(output_pcap)
     args = [
         "-r", pcap_file,
-        "-Y", f'sip.Call-ID == "{call_id}" or rtp',
-        "-w", output_pcap
+        "-Y", display_filter,
+        "-F", "pcap",
+        "-w", tmp
     ]
 
     try:
         run_tshark(args)
+        os.replace(tmp, output_pcap)
         return {
             "pcap_available": True,
             "path": output_pcap
         }
+    except TsharkBusy as e:
+        return {
+            "pcap_available": False,
+            "reason": str(e),
+            "retry_after": e.retry_after
+        }
     except Exception as e:
         return {
             "pcap_available": False,
             "reason": str(e)
         }
+    finally:
+        _discard(tmp)
+
+
+# -----------------------------
+# Per-analysis frame manifest (on-demand exports)
+# -----------------------------
+def save_call_frames(output_dir: str, call_frames: Dict[str, List[int]]) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, CALL_FRAMES_FILE)
+    with open(path, "w") as f:
+        json.dump(call_frames, f)
+    return path
+
+
+def load_call_frames(output_dir: str) -> Dict[str, List[int]]:
+    path = os.path.join(output_dir, CALL_FRAMES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,599 @@
+import sys
+import json
+import mmap
+import socket
+import struct
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Set, Tuple
+
+from tshark_runner import detect_context_from_protocols
+
+
+# set False to always dissect with tshark
+ENABLE_NATIVE_READER = True
+
+
+class UnsupportedCapture(Exception):
+    """
+    Raised when the native reader meets a link type or encapsulation it
+    does not decode. Callers fall back to tshark.
+    """
+    pass
+
+
+# -----------------------------
+# File formats
+# -----------------------------
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+PCAPNG_IDB = 0x00000001
+PCAPNG_EPB = 0x00000006
+
+# -----------------------------
+# Link layer / network
+# -----------------------------
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8, 0x9100)
+
+# Non-IP ethertypes that can never carry SIP/RTP: safe to skip.
+IGNORED_ETHERTYPES = {
+    0x0806,  # ARP
+    0x8035,  # RARP
+    0x88CC,  # LLDP
+    0x8809,  # LACP / slow protocols
+    0x888E,  # 802.1X
+    0x88F7,  # PTP
+}
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_SCTP = 132
+IPV6_EXT_HEADERS = {0, 43, 60}
+IPV6_FRAGMENT = 44
+
+# Encapsulations tshark would dissect into inner SIP/RTP.
+TUNNEL_IP_PROTOS = {4, 41, 47, 50}
+TUNNEL_UDP_PORTS = {2152, 4500, 4789, 6081}
+
+SIP_UDP_PORT = 5060
+SIP_METHODS = {
+    b"INVITE", b"ACK", b"BYE", b"CANCEL", b"OPTIONS", b"REGISTER",
+    b"PRACK", b"SUBSCRIBE", b"NOTIFY", b"PUBLISH", b"INFO", b"REFER",
+    b"MESSAGE", b"UPDATE",
+}
+
+
+# -----------------------------
+# 1️⃣ Record walkers (zero-copy over the mmap)
+# -----------------------------
+def iter_frames(buf, start: Optional[int] = None, stop: Optional[int] = None,
+                frame_no: int = 0, preamble: Iterable[Tuple[int, int]] = ()) -> Iterator[Tuple[int, int, int, int, int, int, int]]:
+    """
+    Yields one tuple per packet record:
+    (frame_no, ts_ns, linktype, data_offset, caplen, block_offset, block_len)
+
+    block_offset/block_len cover the whole on-disk record (header included),
+    data_offset/caplen the captured link-layer bytes.
+
+    start/stop restrict the walk to a record-aligned byte range (a shard);
+    frame_no is the number of frames before `start`, and for pcapng
+    `preamble` lists the (offset, length) of the SHB/IDBs in effect there.
+    """
+    if len(buf) < 24:
+        raise UnsupportedCapture("file too short for pcap/pcapng")
+
+    magic_le = struct.unpack_from("<I", buf, 0)[0]
+
+    if magic_le == PCAPNG_SHB:
+        return _iter_pcapng(buf, start or 0, stop, frame_no, preamble)
+
+    for endian in ("<", ">"):
+        magic = struct.unpack_from(endian + "I", buf, 0)[0]
+        if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            return _iter_pcap(buf, endian, magic == PCAP_MAGIC_NS, start or 24, stop, frame_no)
+
+    raise UnsupportedCapture("unknown capture magic")
+
+
+def _iter_pcap(buf, endian: str, nanos: bool, start: int = 24, stop: Optional[int] = None, frame_no: int = 0):
+    linktype = struct.unpack_from(endian + "I", buf, 20)[0] & 0xFFFF
+    rec_hdr = struct.Struct(endian + "IIII")
+    frac_ns = 1 if nanos else 1000
+
+    size = len(buf) if stop is None else stop
+    off = start
+
+    while off + 16 <= size:
+        ts_sec, ts_frac, caplen, _orig = rec_hdr.unpack_from(buf, off)
+        end = off + 16 + caplen
+        if end > size:
+            break  # truncated last record (tshark reports it as cut short)
+
+        frame_no += 1
+        yield frame_no, ts_sec * 1_000_000_000 + ts_frac * frac_ns, linktype, off + 16, caplen, off, 16 + caplen
+        off = end
+
+
+def _tsresol_to_ns(ts: int, resol: int) -> int:
+    if resol & 0x80:
+        return (ts * 1_000_000_000) >> (resol & 0x7F)
+    if resol <= 9:
+        return ts * 10 ** (9 - resol)
+    return ts // 10 ** (resol - 9)
+
+
+def _iter_pcapng(buf, start: int = 0, stop: Optional[int] = None, frame_no: int = 0,
+                 preamble: Iterable[Tuple[int, int]] = ()):
+    endian = "<"
+    interfaces: List[Tuple[int, int]] = []  # (linktype, tsresol) per section
+
+    # Section header + interfaces first (shards), then the packet range
+    ranges = [(off, off + blen) for off, blen in preamble if off < start]
+    ranges.append((start, len(buf) if stop is None else stop))
+
+    for off, size in ranges:
+        while off + 12 <= size:
+            btype = struct.unpack_from(endian + "I", buf, off)[0]
+
+            if btype == PCAPNG_SHB:
+                bom = struct.unpack_from("<I", buf, off + 8)[0]
+                endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                interfaces = []
+
+            blen = struct.unpack_from(endian + "I", buf, off + 4)[0]
+            if blen < 12 or off + blen > size:
+                break
+
+            if btype == PCAPNG_IDB:
+                linktype = struct.unpack_from(endian + "H", buf, off + 8)[0]
+                interfaces.append((linktype, _idb_tsresol(buf, endian, off, blen)))
+
+            elif btype == PCAPNG_EPB:
+                if_id, ts_hi, ts_lo, caplen = struct.unpack_from(endian + "IIII", buf, off + 8)
+                if if_id >= len(interfaces):
+                    raise UnsupportedCapture("EPB references unknown interface")
+                linktype, resol = interfaces[if_id]
+                frame_no += 1
+                yield frame_no, _tsresol_to_ns((ts_hi << 32) | ts_lo, resol), linktype, off + 28, caplen, off, blen
+
+            elif btype in (0x00000002, 0x00000003):
+                # Obsolete / simple packet blocks (no usable timestamp)
+                raise UnsupportedCapture(f"pcapng block type {btype} not supported")
+
+            off += blen
+
+
+def _idb_tsresol(buf, endian: str, off: int, blen: int) -> int:
+    opt = off + 16
+    end = off + blen - 4
+    while opt + 4 <= end:
+        code, length = struct.unpack_from(endian + "HH", buf, opt)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            return buf[opt + 4]
+        opt += 4 + ((length + 3) & ~3)
+    return 6
+
+
+# -----------------------------
+# 2️⃣ Header decoding
+# -----------------------------
+def _network_offset(buf, linktype: int, off: int, end: int) -> Optional[Tuple[int, int]]:
+    """
+    Returns (ethertype-like version marker, ip_offset) or None for
+    non-IP frames that cannot carry SIP/RTP.
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        if off + 14 > end:
+            return None
+        ethertype = struct.unpack_from("!H", buf, off + 12)[0]
+        off += 14
+        while ethertype in ETHERTYPE_VLAN:
+            if off + 4 > end:
+                return None
+            ethertype = struct.unpack_from("!H", buf, off + 2)[0]
+            off += 4
+
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if off + 16 > end:
+            return None
+        ethertype = struct.unpack_from("!H", buf, off + 14)[0]
+        off += 16
+
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if off >= end:
+            return None
+        ethertype = ETHERTYPE_IPV6 if (buf[off] >> 4) == 6 else ETHERTYPE_IPV4
+
+    else:
+        raise UnsupportedCapture(f"link type {linktype} not supported")
+
+    if ethertype in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+        return ethertype, off
+    if ethertype < 0x0600 or ethertype in IGNORED_ETHERTYPES:
+        return None  # 802.3 length field (LLC/STP) or harmless L2 protocol
+
+    raise UnsupportedCapture(f"ethertype 0x{ethertype:04x} not supported")
+
+
+def _transport(buf, ethertype: int, off: int, end: int):
+    """
+    Returns (layer, src_ip_bytes, dst_ip_bytes, proto, l4_offset, l4_end)
+    """
+    if ethertype == ETHERTYPE_IPV4:
+        if off + 20 > end:
+            return None
+        ihl = (buf[off] & 0x0F) * 4
+        total_len = struct.unpack_from("!H", buf, off + 2)[0]
+        frag = struct.unpack_from("!H", buf, off + 6)[0]
+        if frag & 0x3FFF:
+            raise UnsupportedCapture("IPv4 fragments need reassembly")
+        proto = buf[off + 9]
+        src = bytes(buf[off + 12:off + 16])
+        dst = bytes(buf[off + 16:off + 20])
+        l4_end = min(end, off + total_len) if total_len else end
+        return "ip", src, dst, proto, off + ihl, l4_end
+
+    if off + 40 > end:
+        return None
+    payload_len = struct.unpack_from("!H", buf, off + 4)[0]
+    proto = buf[off + 6]
+    src = bytes(buf[off + 8:off + 24])
+    dst = bytes(buf[off + 24:off + 40])
+    l4_end = min(end, off + 40 + payload_len)
+    l4 = off + 40
+
+    while proto in IPV6_EXT_HEADERS:
+        if l4 + 8 > l4_end:
+            return None
+        proto, hdr_len = buf[l4], (buf[l4 + 1] + 1) * 8
+        l4 += hdr_len
+
+    if proto == IPV6_FRAGMENT:
+        raise UnsupportedCapture("IPv6 fragments need reassembly")
+
+    return "ipv6", src, dst, proto, l4, l4_end
+
+
+def _looks_like_sip(payload: bytes) -> bool:
+    if payload.startswith(b"SIP/2.0 "):
+        return True
+    line_end = payload.find(b"\r\n")
+    first = payload[:line_end] if line_end >= 0 else payload[:256]
+    return first.split(b" ", 1)[0] in SIP_METHODS and first.endswith(b"SIP/2.0")
+
+
+# -----------------------------
+# 3️⃣ SIP / SDP / RTP decoding
+# -----------------------------
+def parse_sip_message(payload: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Start line + Call-ID + SDP media of one SIP message.
+    Returns None when the payload is not a SIP message (e.g. keep-alive).
+    """
+    line_end = payload.find(b"\r\n")
+    if line_end < 0:
+        return None
+
+    start = payload[:line_end].decode("utf-8", "replace")
+    method = status = None
+
+    if start.startswith("SIP/2.0 "):
+        status = start[8:11]
+        if not status.isdigit():
+            return None
+    else:
+        token, _, rest = start.partition(" ")
+        if token.encode() not in SIP_METHODS or not rest.endswith("SIP/2.0"):
+            return None
+        method = token
+
+    head_end = payload.find(b"\r\n\r\n")
+    head = payload[line_end + 2:head_end if head_end >= 0 else len(payload)]
+
+    call_id = None
+    is_sdp = False
+    for raw in head.split(b"\r\n"):
+        name, sep, value = raw.partition(b":")
+        if not sep:
+            continue
+        name = name.strip().lower()
+        if name in (b"call-id", b"i") and call_id is None:
+            call_id = value.strip().decode("utf-8", "replace")
+        elif name in (b"content-type", b"c"):
+            is_sdp = b"application/sdp" in value.lower()
+
+    media: List[Tuple[str, int, List[str]]] = []
+    if is_sdp and head_end >= 0:
+        media = parse_sdp_media(payload[head_end + 4:].decode("utf-8", "replace"))
+
+    return {
+        "method": method,
+        "status": status,
+        "call_id": call_id,
+        "media": media
+    }
+
+
+def parse_sdp_media(body: str) -> List[Tuple[str, int, List[str]]]:
+    """
+    SDP body -> [(connection_address, media_port, payload_types)]
+    A media-level c= line overrides the session-level one.
+    """
+    session_addr = None
+    media: List[List[Any]] = []
+
+    for line in body.splitlines():
+        line = line.strip()
+        if line.startswith("c="):
+            parts = line[2:].split()
+            if len(parts) >= 3:
+                addr = parts[2].split("/")[0]
+                if media:
+                    media[-1][0] = addr
+                else:
+                    session_addr = addr
+        elif line.startswith("m="):
+            parts = line[2:].split()
+            if len(parts) >= 3 and parts[1].split("/")[0].isdigit():
+                media.append([None, int(parts[1].split("/")[0]), parts[3:]])
+
+    return [
+        (addr or session_addr, port, fmts)
+        for addr, port, fmts in media
+        if (addr or session_addr) and port
+    ]
+
+
+def _format_ip(raw: bytes, cache: Dict[bytes, str]) -> str:
+    ip = cache.get(raw)
+    if ip is None:
+        family = socket.AF_INET if len(raw) == 4 else socket.AF_INET6
+        ip = cache[raw] = socket.inet_ntop(family, raw)
+    return ip
+
+
+def _pack_ip(ip: str) -> Optional[bytes]:
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return socket.inet_pton(family, ip)
+        except OSError:
+            continue
+    return None
+
+
+# -----------------------------
+# 4️⃣ Capture reader (tshark-compatible records)
+# -----------------------------
+def read_capture(pcap_file: str) -> Dict[str, Any]:
+    """
+    Native single pass over plain Ethernet/VLAN/SLL/raw-IP + IPv4/IPv6 + UDP
+    captures. Returns the same shape as capture_extractor.extract_capture.
+
+    RTP is recognised the way tshark does it by default: UDP traffic to or
+    from an address:port announced in an earlier SDP body.
+
+    Raises UnsupportedCapture for anything tshark would need to reassemble
+    or de-tunnel (fragments, SIP over TCP, GTP-U/VXLAN/GRE, unknown links).
+    """
+    with open(pcap_file, "rb") as fh:
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            raise UnsupportedCapture(f"cannot map capture: {e}") from e
+
+    try:
+        scan = scan_frames(mm, iter_frames(mm))
+    finally:
+        mm.close()
+
+    return {
+        "sip_packets": scan["sip_packets"],
+        "rtp_packets": scan["rtp_packets"],
+        "packet_stats": scan["packet_stats"],
+        "context": detect_context_from_protocols(scan["layers"])
+    }
+
+
+def read_capture_range(pcap_file: str, start: int, stop: int, frame_no: int,
+                       preamble: List[Tuple[int, int]], first_ts: int) -> Dict[str, Any]:
+    """
+    One shard of a capture (record-aligned byte range), scanned with
+    deferred RTP recognition: see scan_frames(defer_rtp=True).
+    """
+    with open(pcap_file, "rb") as fh:
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            raise UnsupportedCapture(f"cannot map capture: {e}") from e
+
+    try:
+        return scan_frames(mm, iter_frames(mm, start, stop, frame_no, preamble), first_ts, defer_rtp=True)
+    finally:
+        mm.close()
+
+
+def scan_frames(mm, frames: Iterator[Tuple[int, int, int, int, int, int, int]],
+                first_ts: Optional[int] = None, defer_rtp: bool = False) -> Dict[str, Any]:
+    """
+    Decodes SIP/RTP from the given frames.
+
+    defer_rtp=False (whole capture): RTP is kept only on endpoints an
+    earlier SDP body announced.
+
+    defer_rtp=True (one shard): earlier SDP may live in another shard, so
+    every RTP-shaped UDP packet is kept as a candidate and the SDP
+    endpoints seen here are returned as "sdp_endpoints"
+    {(ip, port): first announcing frame}; the merge filters candidates.
+    """
+    # numpy-backed: imported on first decode, not by header / index users (API boot)
+    from packet_store import RtpColumnsBuilder
+
+    sip_packets: List[Dict[str, Any]] = []
+    rtp_builder = RtpColumnsBuilder()
+
+    total_packets = 0
+    sip_count = 0
+    layers_seen: Set[str] = set()
+
+    ip_cache: Dict[bytes, str] = {}
+    media_endpoints = set()  # {(ip_bytes, port)} announced via SDP
+    sdp_endpoints: Dict[Tuple[str, int], int] = {}
+
+    for frame_no, ts_ns, linktype, off, caplen, _boff, _blen in frames:
+        total_packets += 1
+        if first_ts is None:
+            first_ts = ts_ns
+
+        end = off + caplen
+        net = _network_offset(mm, linktype, off, end)
+        if net is None:
+            continue
+
+        if linktype in (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL):
+            layers_seen.add("eth" if linktype == LINKTYPE_ETHERNET else "sll")
+
+        l4 = _transport(mm, net[0], net[1], end)
+        if l4 is None:
+            continue
+
+        layer, src, dst, proto, l4_off, l4_end = l4
+        layers_seen.add(layer)
+
+        if proto in TUNNEL_IP_PROTOS:
+            raise UnsupportedCapture(f"IP protocol {proto} tunnel not supported")
+
+        if proto == IPPROTO_TCP:
+            layers_seen.add("tcp")
+            if l4_off + 20 <= l4_end:
+                data_off = l4_off + ((mm[l4_off + 12] >> 4) * 4)
+                sport, dport = struct.unpack_from("!HH", mm, l4_off)
+                if SIP_UDP_PORT in (sport, dport) or _looks_like_sip(mm[data_off:min(l4_end, data_off + 512)]):
+                    raise UnsupportedCapture("SIP over TCP needs reassembly")
+            continue
+
+        if proto == IPPROTO_SCTP:
+            layers_seen.add("sctp")
+            continue
+
+        if proto != IPPROTO_UDP or l4_off + 8 > l4_end:
+            continue
+
+        layers_seen.add("udp")
+        sport, dport = struct.unpack_from("!HH", mm, l4_off)
+        if sport in TUNNEL_UDP_PORTS or dport in TUNNEL_UDP_PORTS:
+            raise UnsupportedCapture("UDP tunnel (GTP-U/VXLAN/Geneve/NAT-T) not supported")
+
+        data_off = l4_off + 8
+        time_rel = (ts_ns - first_ts) / 1e9
+
+        # ---- RTP (SDP-announced endpoints only, like tshark) ----
+        if defer_rtp or (media_endpoints and ((dst, dport) in media_endpoints or (src, sport) in media_endpoints)):
+            if data_off + 12 <= l4_end and (mm[data_off] >> 6) == 2:
+                b1, seq, rtp_ts, ssrc = struct.unpack_from("!xBHII", mm, data_off)
+                rtp_builder.append(
+                    frame_no,
+                    time_rel,
+                    _format_ip(src, ip_cache),
+                    _format_ip(dst, ip_cache),
+                    sport,
+                    dport,
+                    ssrc,
+                    seq,
+                    rtp_ts,
+                    b1 & 0x7F
+                )
+                continue
+
+        # ---- SIP ----
+        on_sip_port = SIP_UDP_PORT in (sport, dport)
+        if not on_sip_port and not _looks_like_sip(mm[data_off:min(l4_end, data_off + 512)]):
+            continue
+
+        msg = parse_sip_message(bytes(mm[data_off:l4_end]))
+        if msg is None:
+            if on_sip_port and l4_end > data_off:
+                sip_count += 1  # keep-alive / non-message payload still dissected as sip
+                layers_seen.add("sip")
+            continue
+
+        sip_count += 1
+        layers_seen.add("sip")
+
+        for addr, port, _fmts in msg["media"]:
+            packed = _pack_ip(addr)
+            if packed:
+                media_endpoints.add((packed, port))
+                sdp_endpoints.setdefault((_format_ip(packed, ip_cache), port), frame_no)
+
+        if msg["call_id"]:
+            sip_packets.append({
+                "frame": frame_no,
+                "time": time_rel,
+                "call_id": msg["call_id"],
+                "method": msg["method"],
+                "status": msg["status"],
+                "media": msg["media"]
+            })
+
+    if len(rtp_builder) and not defer_rtp:
+        layers_seen.add("rtp")
+
+    return {
+        "sip_packets": sip_packets,
+        "rtp_packets": rtp_builder.build(),
+        "packet_stats": {
+            "total_packets": total_packets,
+            "sip_packets": sip_count,
+            "rtp_packets": len(rtp_builder)
+        },
+        "layers": layers_seen,
+        "sdp_endpoints": sdp_endpoints
+    }
+
+
+def try_read_capture(pcap_file: str) -> Optional[Dict[str, Any]]:
+    """
+    Fast path used by the extractors: native result, or None when the
+    capture needs tshark.
+    """
+    if not ENABLE_NATIVE_READER:
+        return None
+    try:
+        return read_capture(pcap_file)
+    except UnsupportedCapture as e:
+        print(f"⚠️ Native reader fallback to tshark: {e}")
+        return None
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python pcap_reader.py <pcap_file>")
+        sys.exit(1)
+
+    try:
+        capture = read_capture(sys.argv[1])
+    except UnsupportedCapture as e:
+        print(f"UNSUPPORTED (tshark fallback needed): {e}")
+        sys.exit(2)
+
+    print(json.dumps({
+        "packet_stats": capture["packet_stats"],
+        "context": capture["context"],
+        "sip_records": len(capture["sip_packets"]),
+        "rtp_records": len(capture["rtp_packets"])
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
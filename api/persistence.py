@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import queue
+import random
+import atexit
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Union
+
+from pcap_exporter import OUTPUT_DIR
+from metrics import span
+
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "200"))          # rows per bulk insert
+PERSIST_FLUSH_SEC = float(os.getenv("PERSIST_FLUSH_SEC", "1.0"))          # max buffering delay
+PERSIST_MAX_QUEUE = int(os.getenv("PERSIST_MAX_QUEUE", "10000"))          # rows waiting for the writer
+PERSIST_MAX_RETRIES = 3
+PERSIST_BACKOFF_SEC = 0.5
+ENQUEUE_TIMEOUT_SEC = 5.0
+STORAGE_UPLOAD_WORKERS = int(os.getenv("STORAGE_UPLOAD_WORKERS", "4"))
+
+# Failed batches land here and are replayed when the writer starts
+SPILL_FILE = os.path.join(OUTPUT_DIR, "spill", "supabase_rows.jsonl")
+
+# Parents before children (sip_calls.job_id -> pcap_jobs.id)
+TABLE_ORDER = ("pcap_jobs", "sip_calls")
+
+_FLUSH = object()
+_STOP = object()
+
+
+class SupabaseWriter:
+    """
+    Background persistence to Supabase, off the request/job path.
+
+    - insert(table, row) only enqueues (bounded queue; when it stays full
+      the row is spilled instead of blocking analysis)
+    - one writer thread buffers rows per table and sends bulk inserts
+      every batch_size rows or flush_sec seconds, parents first
+    - failed batches are retried with jittered backoff, then appended to
+      a local spill file that is replayed on the next start
+    - storage uploads run on their own small pool (upload / background)
+
+    client_factory is called lazily on first use.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        batch_size: int = PERSIST_BATCH_SIZE,
+        flush_sec: float = PERSIST_FLUSH_SEC,
+        max_queue: int = PERSIST_MAX_QUEUE,
+        max_retries: int = PERSIST_MAX_RETRIES,
+        spill_file: str = SPILL_FILE,
+        upload_workers: int = STORAGE_UPLOAD_WORKERS,
+    ):
+        self._client_factory = client_factory
+        self._client = None
+        self.batch_size = batch_size
+        self.flush_sec = flush_sec
+        self.max_retries = max_retries
+        self.spill_file = spill_file
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._uploads = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="storage")
+        self._counters = defaultdict(int)   # request, writer and upload threads
+        self._counters_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    # -----------------------------
+    # Rows
+    # -----------------------------
+    def insert(self, table: str, row: Dict[str, Any]) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put((table, row), timeout=ENQUEUE_TIMEOUT_SEC)
+            self._count("queued")
+        except queue.Full:
+            print(f"⚠️ Persistence queue full, spilling row [{table}]")
+            self._spill(table, [row], "queue full")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every row enqueued so far has been sent (or spilled).
+        False when that did not happen within timeout (or the queue stayed
+        full for ENQUEUE_TIMEOUT_SEC).
+        """
+        self._ensure_started()
+        done = threading.Event()
+        try:
+            self._queue.put((_FLUSH, done), timeout=ENQUEUE_TIMEOUT_SEC if timeout is None else timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        if self._thread and self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join(timeout)
+        self._uploads.shutdown(wait=False)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="supabase-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        buffers: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._replay_spill(buffers)
+        deadline = time.monotonic() + self.flush_sec if buffers else None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                table, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush_buffers(buffers)
+                deadline = None
+                continue
+
+            if table is _FLUSH or table is _STOP:
+                self._flush_buffers(buffers)
+                deadline = None
+                if table is _STOP:
+                    return
+                payload.set()
+                continue
+
+            buffers[table].append(payload)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_sec
+            if len(buffers[table]) >= self.batch_size:
+                self._flush_buffers(buffers)
+                deadline = None
+
+    def _flush_buffers(self, buffers: Dict[str, List[Dict[str, Any]]]) -> None:
+        order = sorted(buffers, key=lambda t: TABLE_ORDER.index(t) if t in TABLE_ORDER else len(TABLE_ORDER))
+        for table in order:
+            rows = buffers.pop(table)
+            for start in range(0, len(rows), self.batch_size):
+                self._insert_batch(table, rows[start:start + self.batch_size])
+
+    def _insert_batch(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("supabase.insert_batch"):
+                    self.client.table(table).insert(rows).execute()
+                self._count("batches")
+                self._count("rows", len(rows))
+                return
+            except Exception as e:
+                error = e
+                self._count("retries")
+                if attempt < self.max_retries:
+                    time.sleep(random.uniform(0, PERSIST_BACKOFF_SEC * (2 ** attempt)))
+
+        print(f"⚠️ Supabase bulk insert failed [{table}], {len(rows)} rows spilled: {error}")
+        self._spill(table, rows, str(error))
+
+    # -----------------------------
+    # Spill file
+    # -----------------------------
+    def _spill(self, table: str, rows: List[Dict[str, Any]], error: str) -> None:
+        with self._spill_lock:
+            try:
+                os.makedirs(os.path.dirname(self.spill_file), exist_ok=True)
+                with open(self.spill_file, "a") as f:
+                    f.write(json.dumps({"table": table, "rows": rows, "error": error, "at": time.time()}, default=str) + "\n")
+                self._count("spilled_rows", len(rows))
+            except OSError as e:
+                print(f"⚠️ Spill write failed, {len(rows)} rows lost [{table}]: {e}")
+
+    def _replay_spill(self, buffers: Dict[str, List[Dict[str, Any]]]) -> None:
+        with self._spill_lock:
+            replaying = f"{self.spill_file}.replay"
+            try:
+                os.replace(self.spill_file, replaying)
+            except OSError:
+                return  # nothing spilled
+
+        with open(replaying) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                buffers[entry["table"]].extend(entry["rows"])
+                self._count("replayed_rows", len(entry["rows"]))
+        os.remove(replaying)
+
+    # -----------------------------
+    # Storage
+    # -----------------------------
+    def upload(self, bucket: str, path: str, source: Union[str, bytes]) -> bool:
+        """
+        Blocking upload with retries (run it via background()).
+        source is a local file path (streamed from disk) or bytes.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                if isinstance(source, str):
+                    with open(source, "rb") as fh:
+                        self._upload_once(bucket, path, fh)
+                else:
+                    self._upload_once(bucket, path, source)
+                self._count("uploads")
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print("⚠️ Storage upload failed:", e)
+                    self._count("upload_failures")
+                    return False
+                time.sleep(random.uniform(0, PERSIST_BACKOFF_SEC * (2 ** attempt)))
+        return False
+
+    def _upload_once(self, bucket: str, path: str, data: Any) -> None:
+        with span("supabase.upload"):
+            self.client.storage.from_(bucket).upload(
+                path,
+                data,
+                file_options={"content-type": "application/octet-stream"},
+            )
+
+    def background(self, fn: Callable[..., Any], *args: Any) -> Future:
+        return self._uploads.submit(fn, *args)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._counters_lock:
+            self._counters[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        counters["pending"] = self._queue.qsize()
+        return counters
+
+
+# -----------------------------
+# Local fake (tests)
+# -----------------------------
+class FakeSupabase:
+    """
+    In-memory stand-in for the supabase client surface the writer uses
+    (table().insert().execute(), storage.from_().upload()).
+    fail_next makes the next N calls raise, to exercise retries / spill.
+    """
+
+    def __init__(self, fail_next: int = 0):
+        self.tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.objects: Dict[str, bytes] = {}
+        self.fail_next = fail_next
+        self.requests = 0
+        self.storage = self
+        self._lock = threading.Lock()
+
+    def _call(self, apply: Callable[[], None]) -> "FakeSupabase":
+        with self._lock:
+            self.requests += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise ConnectionError("fake supabase failure")
+            apply()
+        return self
+
+    def table(self, name: str) -> "_FakeTable":
+        return _FakeTable(self, name)
+
+    def from_(self, bucket: str) -> "_FakeBucket":
+        return _FakeBucket(self, bucket)
+
+
+class _FakeTable:
+    def __init__(self, db: FakeSupabase, name: str):
+        self.db = db
+        self.name = name
+        self._rows: List[Dict[str, Any]] = []
+
+    def insert(self, rows: Any) -> "_FakeTable":
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self) -> None:
+        self.db._call(lambda: self.db.tables[self.name].extend(self._rows))
+
+
+class _FakeBucket:
+    def __init__(self, db: FakeSupabase, bucket: str):
+        self.db = db
+        self.bucket = bucket
+
+    def upload(self, path: str, data: Any, file_options: Optional[Dict[str, str]] = None) -> None:
+        content = data.read() if hasattr(data, "read") else data
+        self.db._call(lambda: self.db.objects.__setitem__(f"{self.bucket}/{path}", content))
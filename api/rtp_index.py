@@ -0,0 +1,26 @@
+import numpy as np
+
+from packet_store import RtpColumns
+
+
+class RtpTimeIndex:
+    """
+    RTP columns sorted by time, answering [start, end] windows with
+    searchsorted on the time column: O(log n + k) per call, and each
+    window is a column view (no copy).
+    """
+
+    def __init__(self, rtp: RtpColumns):
+        if len(rtp) > 1 and np.any(np.diff(rtp.time) < 0):
+            rtp = rtp.take(np.argsort(rtp.time, kind="stable"))
+
+        self.packets = rtp
+
+    def __len__(self) -> int:
+        return len(self.packets)
+
+    def window(self, start_time: float, end_time: float) -> RtpColumns:
+        times = self.packets.time
+        lo = int(np.searchsorted(times, start_time, side="left"))
+        hi = int(np.searchsorted(times, end_time, side="right"))
+        return self.packets[lo:max(lo, hi)]
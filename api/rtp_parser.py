@@ -1,5 +1,10 @@
-from typing import Dict, List, Any, Tuple
-from tshark_runner import run_tshark
+from typing import Dict, Any
+import numpy as np
+from contextlib import closing
+from tshark_runner import iter_tshark_chunks
+from pcap_reader import try_read_capture
+from packet_store import RtpColumns, RtpColumnsBuilder, split_field_rows, first_values
+from sharkd import iter_sharkd_fields
 
 
 RTP_FIELDS = [
@@ -9,11 +14,28 @@ RTP_FIELDS = [
     "ip.dst",
     "udp.srcport",
     "udp.dstport",
-    "rtp.ssrc"
+    "rtp.ssrc",
+    "rtp.seq",
+    "rtp.timestamp",
+    "rtp.p_type"
 ]
 
 
-def extract_rtp_packets(pcap_file: str) -> List[Dict[str, Any]]:
+def extract_rtp_packets(pcap_file: str) -> RtpColumns:
+    native = try_read_capture(pcap_file)
+    if native is not None:
+        return native["rtp_packets"]
+
+    builder = RtpColumnsBuilder()
+    width = len(RTP_FIELDS)
+
+    # sharkd columns carry every occurrence: keep the first (occurrence=f)
+    pages = iter_sharkd_fields(pcap_file, RTP_FIELDS, display_filter="rtp")
+    if pages is not None:
+        for flat in pages:
+            builder.extend_fields(*(first_values(flat[k::width]) for k in range(width)))
+        return builder.build()
+
     args = [
         "-r", pcap_file,
         "-Y", "rtp",
@@ -25,43 +47,28 @@ def extract_rtp_packets(pcap_file: str) -> List[Dict[str, Any]]:
     for f in RTP_FIELDS:
         args += ["-e", f]
 
-    result = run_tshark(args)
-
-    packets = []
-    for line in result.stdout.splitlines():
-        parts = line.split("|")
-        if len(parts) < len(RTP_FIELDS):
-            continue
-
-        frame, time_rel, src, dst, sport, dport, ssrc = parts
+    # Bulk parse: one flat split per streamed block, then column slices
+    with closing(iter_tshark_chunks(args)) as chunks:
+        for block in chunks:
+            flat = split_field_rows(block, width)
+            builder.extend_fields(*(flat[k::width] for k in range(width)))
 
-        packets.append({
-            "frame": int(frame),
-            "time": float(time_rel),
-            "src": src,
-            "dst": dst,
-            "src_port": int(sport) if sport else None,
-            "dst_port": int(dport) if dport else None,
-            "ssrc": ssrc or None
-        })
+    return builder.build()
 
-    return packets
 
-def analyze_rtp_direction(rtp_packets: List[Dict[str, Any]]) -> Dict[str, Any]:
-    if not rtp_packets:
+def analyze_rtp_direction(rtp_packets: RtpColumns) -> Dict[str, Any]:
+    if not len(rtp_packets):
         return {
             "rtp_present": False,
             "direction": "NONE",
             "inference": "No RTP detected → media did not start"
         }
 
-    directions = set()
-    endpoints = set()
+    src = rtp_packets.src.astype(np.int64)
+    dst = rtp_packets.dst.astype(np.int64)
 
-    for pkt in rtp_packets:
-        endpoints.add(pkt["src"])
-        endpoints.add(pkt["dst"])
-        directions.add((pkt["src"], pkt["dst"]))
+    directions = np.unique(src * len(rtp_packets.ips) + dst)
+    endpoints = rtp_packets.ips.decode(np.union1d(src, dst))
 
     if len(directions) > 1:
         direction = "BIDIRECTIONAL"
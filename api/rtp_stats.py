@@ -0,0 +1,170 @@
+from typing import Dict, List, Any
+
+import numpy as np
+
+from packet_store import RtpColumns, MISSING
+
+
+# RFC 3551 static payload types -> RTP clock rate (Hz)
+STATIC_CLOCK_RATES = {
+    0: 8000, 3: 8000, 4: 8000, 5: 8000, 6: 16000, 7: 8000, 8: 8000,
+    9: 8000, 10: 44100, 11: 44100, 12: 8000, 13: 8000, 14: 90000,
+    15: 8000, 16: 11025, 17: 22050, 18: 8000, 25: 90000, 26: 90000,
+    28: 90000, 31: 90000, 32: 90000, 33: 90000, 34: 90000,
+}
+COMMON_CLOCK_RATES = np.array([8000, 16000, 32000, 44100, 48000, 90000])
+
+# MEDIA_DEGRADED thresholds (per stream)
+DEGRADED_LOSS_PCT = 2.0
+DEGRADED_JITTER_MS = 30.0
+
+# RFC 3550 jitter filter J += (|D| - J) / 16 is linear: evaluated in
+# blocks with closed-form powers so it never loops per packet.
+_JITTER_GAIN = 1.0 / 16.0
+_JITTER_DECAY = 15.0 / 16.0
+_JITTER_BLOCK = 256
+_DECAY_POWERS = _JITTER_DECAY ** np.arange(_JITTER_BLOCK + 1)
+
+
+def _unwrap_seq(seq: np.ndarray) -> np.ndarray:
+    """
+    16-bit sequence numbers -> signed deltas (wraparound aware).
+    """
+    d = np.diff(seq.astype(np.int64))
+    return ((d + 32768) % 65536) - 32768
+
+
+def _clock_rate(payload_type: int, arrival: np.ndarray, ts: np.ndarray) -> int:
+    rate = STATIC_CLOCK_RATES.get(payload_type)
+    if rate:
+        return rate
+
+    # Dynamic PT: estimate from timestamp advance vs. wall-clock advance
+    span = float(arrival[-1] - arrival[0]) if len(arrival) > 1 else 0.0
+    if span <= 0:
+        return 8000
+    ts_span = float(np.sum(((np.diff(ts) + 2**31) % 2**32) - 2**31))
+    estimate = abs(ts_span) / span
+    return int(COMMON_CLOCK_RATES[np.argmin(np.abs(COMMON_CLOCK_RATES - estimate))])
+
+
+def _rfc3550_jitter(abs_d: np.ndarray) -> np.ndarray:
+    """
+    Running interarrival jitter J_i for every packet (timestamp units).
+    """
+    out = np.empty(len(abs_d), dtype=np.float64)
+    j = 0.0
+    for start in range(0, len(abs_d), _JITTER_BLOCK):
+        block = abs_d[start:start + _JITTER_BLOCK]
+        n = len(block)
+        # J_k = decay^k * J_0 + gain * sum_{i<=k} decay^(k-i) * D_i
+        scaled = block * _JITTER_GAIN / _DECAY_POWERS[1:n + 1]
+        out[start:start + n] = _DECAY_POWERS[1:n + 1] * (j + np.cumsum(scaled))
+        j = out[start + n - 1]
+    return out
+
+
+def _stream_stats(rtp: RtpColumns, rows: np.ndarray) -> Dict[str, Any]:
+    arrival = rtp.time[rows]
+    seq = rtp.seq[rows]
+    ts = rtp.timestamp[rows]
+    pt = int(rtp.payload_type[rows[0]])
+    n = len(rows)
+
+    stats: Dict[str, Any] = {
+        "ssrc": "0x%08x" % int(rtp.ssrc[rows[0]]) if rtp.ssrc[rows[0]] != MISSING else None,
+        "src": rtp.ips.values[rtp.src[rows[0]]],
+        "dst": rtp.ips.values[rtp.dst[rows[0]]],
+        "src_port": int(rtp.src_port[rows[0]]),
+        "dst_port": int(rtp.dst_port[rows[0]]),
+        "payload_type": pt if pt != MISSING else None,
+        "packets": n,
+        "first_packet": int(rtp.frame[rows[0]]),
+        "last_packet": int(rtp.frame[rows[-1]]),
+    }
+
+    if n < 2 or np.any(seq < 0):
+        stats.update({
+            "expected": n, "lost": 0, "loss_pct": 0.0, "seq_gaps": 0,
+            "max_seq_gap": 0, "out_of_order": 0, "duplicates": 0,
+            "jitter_ms": 0.0, "max_jitter_ms": 0.0, "max_delta_ms": 0.0,
+            "clock_rate": None,
+        })
+        return stats
+
+    # ---- sequence analysis ----
+    d_seq = _unwrap_seq(seq)
+    ext = np.concatenate(([0], np.cumsum(d_seq)))
+    expected = int(ext.max() - ext.min()) + 1
+    lost = max(0, expected - n)
+
+    forward_gaps = d_seq[d_seq > 1] - 1
+
+    # ---- timing / RFC 3550 jitter ----
+    clock = _clock_rate(pt, arrival, ts)
+    d_arrival = np.diff(arrival)
+    d_ts = ((np.diff(ts) + 2**31) % 2**32) - 2**31
+    jitter = _rfc3550_jitter(np.abs(d_arrival * clock - d_ts))
+    to_ms = 1000.0 / clock
+
+    stats.update({
+        "expected": expected,
+        "lost": lost,
+        "loss_pct": round(100.0 * lost / expected, 2),
+        "seq_gaps": int(len(forward_gaps)),
+        "max_seq_gap": int(forward_gaps.max()) if len(forward_gaps) else 0,
+        "out_of_order": int(np.count_nonzero(d_seq < 0)),
+        "duplicates": int(np.count_nonzero(d_seq == 0)),
+        "jitter_ms": round(float(jitter[-1]) * to_ms, 3),
+        "max_jitter_ms": round(float(jitter.max()) * to_ms, 3),
+        "max_delta_ms": round(float(d_arrival.max()) * 1000.0, 3),
+        "clock_rate": clock,
+    })
+    return stats
+
+
+def analyze_rtp_streams(rtp: RtpColumns) -> List[Dict[str, Any]]:
+    """
+    Per-SSRC stream statistics: loss, sequence gaps, out-of-order,
+    duplicates, RFC 3550 interarrival jitter and max packet delta.
+    Packets are grouped once (stable sort by SSRC keeps arrival order).
+    """
+    if not len(rtp):
+        return []
+
+    order = np.argsort(rtp.ssrc, kind="stable")
+    _, starts = np.unique(rtp.ssrc[order], return_index=True)
+    bounds = list(starts.tolist()) + [len(order)]
+
+    return [
+        _stream_stats(rtp, order[bounds[i]:bounds[i + 1]])
+        for i in range(len(starts))
+    ]
+
+
+def summarize_rtp_quality(streams: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Call-level quality rollup + degradation reasons for the verdict.
+    """
+    if not streams:
+        return {"degraded": False, "reasons": []}
+
+    worst_loss = max(s["loss_pct"] for s in streams)
+    worst_jitter = max(s["jitter_ms"] for s in streams)
+    reasons: List[str] = []
+
+    for s in streams:
+        if s["loss_pct"] > DEGRADED_LOSS_PCT:
+            reasons.append(f"RTP loss {s['loss_pct']}% on SSRC {s['ssrc']} ({s['src']} → {s['dst']})")
+        if s["jitter_ms"] > DEGRADED_JITTER_MS:
+            reasons.append(f"RTP jitter {s['jitter_ms']} ms on SSRC {s['ssrc']} ({s['src']} → {s['dst']})")
+
+    return {
+        "degraded": bool(reasons),
+        "reasons": reasons,
+        "max_loss_pct": worst_loss,
+        "max_jitter_ms": worst_jitter,
+        "total_lost": sum(s["lost"] for s in streams),
+        "out_of_order": sum(s["out_of_order"] for s in streams),
+    }
+
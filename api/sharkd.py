@@ -0,0 +1,430 @@
+import os
+import json
+import time
+import queue
+import atexit
+import weakref
+import shutil
+import threading
+import subprocess
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from tshark_runner import TsharkError, TsharkBusy, TSHARK_WAIT_SEC, _drain_stderr, detect_context_from_protocols
+from metrics import span
+
+# Long-lived sharkd sessions (one loaded capture each) replace per-query
+# tshark processes: dissector / plugin init and the file read are paid
+# once per capture, later queries run against the loaded file.
+SHARKD_ENABLED = os.getenv("SHARKD_ENABLED", "1") == "1"
+SHARKD_MAX_SESSIONS = int(os.getenv("SHARKD_MAX_SESSIONS", "2"))
+SHARKD_IDLE_SEC = float(os.getenv("SHARKD_IDLE_SEC", "300"))          # idle sessions are closed after this
+SHARKD_REQUEST_TIMEOUT_SEC = float(os.getenv("SHARKD_REQUEST_TIMEOUT_SEC", "180"))
+SHARKD_PAGE_FRAMES = 20000   # rows per frames request (bounded response size)
+STDERR_LIMIT_CHARS = 16 * 1024
+
+# intervals bucket wide enough to put a whole capture in one (ms)
+_WHOLE_CAPTURE_MS = 365 * 24 * 3600 * 1000
+
+_sharkd_path: Optional[str] = None
+
+
+class SharkdError(TsharkError):
+    pass
+
+
+def sharkd_available() -> Optional[str]:
+    """
+    Resolved sharkd path (cached), or None when disabled / not installed:
+    callers then run plain tshark.
+    """
+    global _sharkd_path
+    if not SHARKD_ENABLED:
+        return None
+    if _sharkd_path and os.access(_sharkd_path, os.X_OK):
+        return _sharkd_path
+    _sharkd_path = shutil.which("sharkd")
+    return _sharkd_path
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class SharkdSession:
+    """
+    One `sharkd -` process speaking JSON-RPC 2.0 over stdin/stdout (one
+    request / response per line). Used by one caller at a time (checked
+    out of SharkdPool). Any protocol error or timeout kills the process.
+    """
+
+    def __init__(self, sharkd_path: str):
+        self.proc = subprocess.Popen(
+            [sharkd_path, "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        self.path: Optional[str] = None     # loaded capture
+        self.stamp: Optional[Tuple[int, int]] = None
+        self.last_used = time.monotonic()
+        self.queries = 0
+        self._next_id = 0
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+
+        self._stderr: List[str] = []
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        threading.Thread(target=_drain_stderr, args=(self.proc.stderr, self._stderr, STDERR_LIMIT_CHARS), daemon=True).start()
+
+    def _read_stdout(self) -> None:
+        for line in iter(self.proc.stdout.readline, ""):
+            self._lines.put(line)
+        self._lines.put(None)  # EOF: process gone
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def request(self, method: str, params: Optional[Dict[str, Any]] = None, timeout_sec: float = SHARKD_REQUEST_TIMEOUT_SEC) -> Any:
+        self._next_id += 1
+        message = {"jsonrpc": "2.0", "id": self._next_id, "method": method}
+        if params:
+            message["params"] = params
+
+        try:
+            self.proc.stdin.write(json.dumps(message) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self.close()
+            raise SharkdError(f"sharkd exited: {self._stderr_tail() or e}")
+
+        deadline = time.monotonic() + timeout_sec
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.close()
+                raise SharkdError(f"sharkd {method} timed out after {timeout_sec}s")
+            if line is None:
+                self.close()
+                raise SharkdError(f"sharkd exited during {method}: {self._stderr_tail()}")
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue  # not a JSON-RPC line (banner / notice)
+            if response.get("id") == self._next_id:
+                break
+
+        self.queries += 1
+        self.last_used = time.monotonic()
+        if "error" in response:
+            error = response["error"]
+            raise SharkdError(f"sharkd {method}: {error.get('message', error) if isinstance(error, dict) else error}")
+        return response.get("result")
+
+    def load(self, path: str) -> None:
+        with span("sharkd.load"):
+            self.request("load", {"file": path})
+        self.path = path
+        self.stamp = _file_stamp(path)
+
+    def _stderr_tail(self) -> str:
+        return (self._stderr[0] if self._stderr else "").strip()[-500:]
+
+    def close(self) -> None:
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+
+
+class SharkdPool:
+    """
+    At most max_sessions sharkd processes, each holding one loaded
+    capture. acquire(path) hands out an idle session that already has the
+    file loaded (unchanged on disk), else starts one (closing the least
+    recently used idle session when full), else waits up to wait_sec and
+    raises TsharkBusy. Sessions idle for idle_sec are closed by a
+    background reaper; broken ones are dropped on release.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SHARKD_MAX_SESSIONS,
+        idle_sec: float = SHARKD_IDLE_SEC,
+        wait_sec: float = TSHARK_WAIT_SEC,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_sec = idle_sec
+        self.wait_sec = wait_sec
+        self._idle: List[SharkdSession] = []
+        self._busy = 0
+        self._cond = threading.Condition()
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = False
+        self._counters = {"started": 0, "reused": 0, "evicted_idle": 0, "broken": 0}
+
+    def acquire(self, path: str) -> SharkdSession:
+        sharkd_path = sharkd_available()
+        if not sharkd_path:
+            raise SharkdError("sharkd not available")
+
+        path = os.path.abspath(path)
+        stamp = _file_stamp(path)
+        deadline = time.monotonic() + self.wait_sec
+        evicted: List[SharkdSession] = []
+
+        with self._cond:
+            while True:
+                for session in reversed(self._idle):
+                    if session.path == path and session.stamp == stamp and session.alive:
+                        self._idle.remove(session)
+                        self._busy += 1
+                        self._counters["reused"] += 1
+                        return session
+
+                if len(self._idle) + self._busy >= self.max_sessions and self._idle:
+                    lru = min(self._idle, key=lambda s: s.last_used)
+                    self._idle.remove(lru)
+                    evicted.append(lru)
+
+                if len(self._idle) + self._busy < self.max_sessions:
+                    self._busy += 1
+                    self._counters["started"] += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TsharkBusy(f"sharkd saturated ({self._busy} sessions busy)")
+                self._cond.wait(remaining)
+
+            self._start_reaper()
+
+        for lru in evicted:
+            lru.close()
+
+        # Start + load outside the lock (seconds on a big capture)
+        session = None
+        try:
+            session = SharkdSession(sharkd_path)
+            session.load(path)
+            return session
+        except BaseException:
+            if session is not None:
+                session.close()
+            with self._cond:
+                self._busy -= 1
+                self._counters["broken"] += 1
+                self._cond.notify()
+            raise
+
+    def release(self, session: SharkdSession, broken: bool = False) -> None:
+        with self._cond:
+            self._busy -= 1
+            if broken or not session.alive or self._closed:
+                self._counters["broken"] += int(broken)
+                session.close()
+            else:
+                session.last_used = time.monotonic()
+                self._idle.append(session)
+            self._cond.notify()
+
+    def close_file(self, path: str) -> None:
+        """
+        Closes idle sessions holding `path` (the job that loaded it is done).
+        """
+        path = os.path.abspath(path)
+        with self._cond:
+            doomed = [s for s in self._idle if s.path == path]
+            self._idle = [s for s in self._idle if s.path != path]
+            self._cond.notify_all()
+        for session in doomed:
+            session.close()
+
+    def evict_idle(self) -> int:
+        now = time.monotonic()
+        with self._cond:
+            doomed = [s for s in self._idle if now - s.last_used >= self.idle_sec or not s.alive]
+            self._idle = [s for s in self._idle if s not in doomed]
+            self._counters["evicted_idle"] += len(doomed)
+            self._cond.notify_all()
+        for session in doomed:
+            session.close()
+        return len(doomed)
+
+    def _start_reaper(self) -> None:
+        # Called with the lock held; one daemon thread per pool
+        if self._reaper is not None:
+            return
+
+        def reap():
+            while not self._closed:
+                time.sleep(max(1.0, min(30.0, self.idle_sec / 2)))
+                self.evict_idle()
+
+        self._reaper = threading.Thread(target=reap, name="sharkd-reaper", daemon=True)
+        self._reaper.start()
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            doomed, self._idle = self._idle, []
+        for session in doomed:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "available": bool(sharkd_available()),
+                "max_sessions": self.max_sessions,
+                "busy": self._busy,
+                "idle": len(self._idle),
+                **self._counters,
+            }
+
+
+sharkd_pool = SharkdPool()
+atexit.register(sharkd_pool.shutdown)
+
+
+# -----------------------------
+# Queries (None = sharkd unavailable: run tshark instead)
+# -----------------------------
+def _fallback(pcap_file: str, error: Exception) -> None:
+    print(f"⚠️ sharkd unavailable for {os.path.basename(pcap_file)}, using tshark: {error}")
+
+
+def iter_sharkd_fields(
+    pcap_file: str,
+    fields: List[str],
+    display_filter: Optional[str] = None,
+    page_frames: int = SHARKD_PAGE_FRAMES,
+) -> Optional[Iterator[List[str]]]:
+    """
+    Field values of every (matching) frame as flat row-major lists, one
+    per page (row i, field k -> flat[i * len(fields) + k]), same layout
+    as split_field_rows over `tshark -T fields -E occurrence=a` output.
+    The session is held while the iterator is consumed.
+    """
+    if not sharkd_available():
+        return None
+
+    params: Dict[str, Any] = {f"column{k}": f for k, f in enumerate(fields)}
+    if display_filter:
+        params["filter"] = display_filter
+
+    def page(session: SharkdSession, skip: int) -> List[Dict[str, Any]]:
+        with span("sharkd.frames"):
+            return session.request("frames", dict(params, skip=skip, limit=page_frames)) or []
+
+    try:
+        session = sharkd_pool.acquire(pcap_file)
+    except TsharkError as e:
+        _fallback(pcap_file, e)
+        return None
+    try:
+        first = page(session, 0)
+    except SharkdError as e:
+        sharkd_pool.release(session, broken=True)
+        _fallback(pcap_file, e)
+        return None
+
+    released = []
+
+    def release(broken: bool = False) -> None:
+        if not released:
+            released.append(True)
+            sharkd_pool.release(session, broken)
+
+    def pages() -> Iterator[List[str]]:
+        broken = False
+        try:
+            rows, skip = first, 0
+            while rows:
+                yield [v for row in rows for v in row["c"]]
+                if len(rows) < page_frames:
+                    break
+                skip += len(rows)
+                rows = page(session, skip)
+        except SharkdError:
+            broken = True
+            raise
+        finally:
+            release(broken)
+
+    iterator = pages()
+    weakref.finalize(iterator, release)  # dropped before its first page
+    return iterator
+
+
+def sharkd_packet_counts(pcap_file: str) -> Optional[Dict[str, int]]:
+    """
+    get_packet_counts as queries on the loaded file: total frames from
+    status, SIP / RTP frame counts from filtered intervals.
+    """
+    if not sharkd_available():
+        return None
+    try:
+        session = sharkd_pool.acquire(pcap_file)
+    except TsharkError as e:
+        _fallback(pcap_file, e)
+        return None
+
+    broken = False
+    try:
+        with span("sharkd.counts"):
+            total = session.request("status")["frames"]
+            counts = {
+                proto: session.request("intervals", {"interval": _WHOLE_CAPTURE_MS, "filter": proto})["frames"]
+                for proto in ("sip", "rtp")
+            }
+        return {"total_packets": total, "sip_packets": counts["sip"], "rtp_packets": counts["rtp"]}
+    except (SharkdError, KeyError, TypeError) as e:
+        broken = True
+        _fallback(pcap_file, e)
+        return None
+    finally:
+        sharkd_pool.release(session, broken)
+
+
+def _phs_stacks(protos: List[Dict[str, Any]], prefix: str = "") -> Iterator[str]:
+    for node in protos or []:
+        stack = f"{prefix}:{node.get('proto', '')}" if prefix else node.get("proto", "")
+        yield stack
+        yield from _phs_stacks(node.get("protos"), stack)
+
+
+def sharkd_capture_context(pcap_file: str) -> Optional[Dict[str, Any]]:
+    """
+    analyze_capture_context from the phs tap (protocol hierarchy tree).
+    """
+    if not sharkd_available():
+        return None
+    try:
+        session = sharkd_pool.acquire(pcap_file)
+    except TsharkError as e:
+        _fallback(pcap_file, e)
+        return None
+
+    broken = False
+    try:
+        with span("sharkd.phs"):
+            taps = session.request("tap", {"tap0": "phs"})["taps"]
+        protos = next((t.get("protos") for t in taps if t.get("tap") == "phs"), [])
+        return {
+            "pcap_path": pcap_file,
+            "protocol_hierarchy_raw": json.dumps(protos),
+            "context": detect_context_from_protocols(_phs_stacks(protos)),
+        }
+    except (SharkdError, KeyError, TypeError) as e:
+        broken = True
+        _fallback(pcap_file, e)
+        return None
+    finally:
+        sharkd_pool.release(session, broken)
@@ -0,0 +1,234 @@
+import os
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+# Capture-clock seconds
+SIP_DIALOG_LINGER_SEC = float(os.getenv("SIP_DIALOG_LINGER_SEC", "5"))   # after BYE / CANCEL / final error
+SIP_DIALOG_IDLE_SEC = float(os.getenv("SIP_DIALOG_IDLE_SEC", "120"))      # no SIP: early dialog timed out
+SIP_DIALOG_CONFIRMED_IDLE_SEC = float(os.getenv("SIP_DIALOG_CONFIRMED_IDLE_SEC", str(4 * 3600)))  # answered, no BYE yet
+SWEEP_EVERY_SEC = 1.0                                                      # expiry sweeps, capture time
+FINISHED_MEMORY = 10000   # recently finished Call-IDs: late retransmissions are dropped
+
+
+class DialogState:
+    """
+    Compact per-dialog SIP state, updated one packet at a time (capture
+    order): first INVITE / 200 OK / error response, ACK, BYE, CANCEL,
+    provisional and retransmission counters. Events are only kept when
+    a timeline needs them (keep_events).
+    """
+    __slots__ = (
+        "call_id", "first_frame", "last_time", "invite", "ok_200", "failure",
+        "ack", "bye", "cancel", "final_status", "provisional", "retransmissions",
+        "packets", "ended_at", "events", "_seen",
+    )
+
+    def __init__(self, call_id: str, keep_events: bool = False):
+        self.call_id = call_id
+        self.first_frame: Optional[int] = None
+        self.last_time = 0.0
+        self.invite: Optional[Tuple[int, float]] = None     # (frame, time)
+        self.ok_200: Optional[Tuple[int, float]] = None
+        self.failure: Optional[Tuple[int, str]] = None      # (frame, status)
+        self.ack = False
+        self.bye = False
+        self.cancel = False
+        self.final_status: Optional[str] = None
+        self.provisional = 0
+        self.retransmissions = 0
+        self.packets = 0
+        self.ended_at: Optional[float] = None
+        self.events: Optional[List[Dict[str, Any]]] = [] if keep_events else None
+        self._seen = set()   # (method or status) within the current transaction
+
+    def feed(self, pkt: Dict[str, Any]) -> None:
+        frame, t = pkt["frame"], pkt["time"]
+        method, status = pkt.get("method"), pkt.get("status")
+
+        self.packets += 1
+        if self.first_frame is None:
+            self.first_frame = frame
+        self.last_time = max(self.last_time, t)
+        if self.events is not None:
+            self.events.append(pkt)
+
+        key = method or status
+        if method == "INVITE" and self.final_status is not None:
+            self._seen = set()   # new INVITE transaction (auth retry / re-INVITE)
+            self.final_status = None
+        if key in self._seen and key != "ACK":
+            self.retransmissions += 1
+        self._seen.add(key)
+
+        if method == "INVITE":
+            if self.invite is None:
+                self.invite = (frame, t)
+            self.ended_at = None  # dialog goes on after a challenge
+        elif method == "ACK":
+            self.ack = True
+        elif method == "BYE":
+            self.bye = True
+        elif method == "CANCEL":
+            self.cancel = True
+
+        if status:
+            if status.startswith("1"):
+                self.provisional += 1
+            elif self.final_status is None:
+                self.final_status = status
+            if status == "200" and self.ok_200 is None:
+                self.ok_200 = (frame, t)
+            if status.startswith(("4", "5", "6")) and self.failure is None:
+                self.failure = (frame, status)
+
+        if self.ended_at is None and (method in ("BYE", "CANCEL") or (status or "")[:1] in ("3", "4", "5", "6")):
+            self.ended_at = t
+
+    def classify(self) -> Dict[str, Any]:
+        # SIP error response
+        if self.failure:
+            return {
+                "root_cause": f"SIP failure response {self.failure[1]}",
+                "failure_packet": self.failure[0]
+            }
+
+        # Missing ACK after 200 OK
+        if self.ok_200 and not self.ack:
+            return {
+                "root_cause": "ACK missing after 200 OK",
+                "failure_packet": self.ok_200[0]
+            }
+
+        # No explicit SIP failure
+        return {
+            "root_cause": "SIP signaling completed without explicit failure",
+            "failure_packet": None
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        build_call_summary shape (without events) + dialog counters.
+        """
+        classification = self.classify()
+
+        latency = None
+        if self.invite and self.ok_200:
+            latency = round(self.ok_200[1] - self.invite[1], 3)
+
+        return {
+            "call_id": self.call_id,
+            "root_cause": classification["root_cause"],
+            "invite_packet": self.invite[0] if self.invite else None,
+            "ok_200_packet": self.ok_200[0] if self.ok_200 else None,
+            "failure_packet": classification.get("failure_packet"),
+            "invite_to_200_latency_sec": latency,
+            "dialog": {
+                "packets": self.packets,
+                "provisional": self.provisional,
+                "final_status": self.final_status,
+                "ack": self.ack,
+                "bye": self.bye,
+                "cancel": self.cancel,
+                "retransmissions": self.retransmissions,
+            },
+        }
+
+    @property
+    def confirmed(self) -> bool:
+        # answered INVITE: a call carries no SIP between ACK and BYE
+        return self.invite is not None and self.ok_200 is not None and self.ended_at is None
+
+    def is_done(self, now: float, linger_sec: float, idle_sec: float, confirmed_idle_sec: float) -> bool:
+        if self.ended_at is not None and now - self.ended_at >= linger_sec:
+            return True
+        return now - self.last_time >= (confirmed_idle_sec if self.confirmed else idle_sec)
+
+
+class SipDialogTracker:
+    """
+    Consumes SIP packets in capture order and hands back each dialog as
+    soon as it has terminated (+ linger_sec) or timed out (idle_sec, or
+    confirmed_idle_sec once answered), releasing its state. Memory
+    follows concurrent calls, not total calls.
+
+    A finished Call-ID only drops retransmissions of its last
+    transaction; anything new (e.g. the BYE of a call that timed out)
+    reopens it as a further dialog with the same Call-ID. expire=False
+    holds every dialog until flush() (one summary per Call-ID).
+
+        tracker = SipDialogTracker()
+        for pkt in packets:
+            for dialog in tracker.feed(pkt):
+                ...
+        for dialog in tracker.flush():
+            ...
+    """
+
+    def __init__(
+        self,
+        linger_sec: float = SIP_DIALOG_LINGER_SEC,
+        idle_sec: float = SIP_DIALOG_IDLE_SEC,
+        confirmed_idle_sec: float = SIP_DIALOG_CONFIRMED_IDLE_SEC,
+        keep_events: bool = False,
+        expire: bool = True,
+    ):
+        self.linger_sec = linger_sec
+        self.idle_sec = idle_sec
+        self.confirmed_idle_sec = confirmed_idle_sec
+        self.keep_events = keep_events
+        self.expire_dialogs = expire
+        self.now = 0.0
+        self._next_sweep = SWEEP_EVERY_SEC
+        self._open: Dict[str, DialogState] = {}
+        self._finished: "OrderedDict[str, frozenset]" = OrderedDict()   # Call-ID -> last transaction's methods / statuses
+        self.finished_count = 0
+        self.reopened = 0
+        self.peak_open = 0
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    def feed(self, pkt: Dict[str, Any]) -> List[DialogState]:
+        call_id = pkt["call_id"]
+        self.now = max(self.now, pkt["time"])
+
+        state = self._open.get(call_id)
+        if state is None:
+            seen = self._finished.get(call_id)
+            if seen is not None:
+                if (pkt.get("method") or pkt.get("status")) in seen:
+                    return []  # late retransmission of a finished dialog
+                del self._finished[call_id]
+                self.reopened += 1
+            state = self._open[call_id] = DialogState(call_id, self.keep_events)
+            self.peak_open = max(self.peak_open, len(self._open))
+        state.feed(pkt)
+
+        if not self.expire_dialogs or self.now < self._next_sweep:
+            return []
+        self._next_sweep = self.now + SWEEP_EVERY_SEC
+        return self.expire()
+
+    def expire(self, now: Optional[float] = None) -> List[DialogState]:
+        """
+        Finishes dialogs that ended / timed out as of `now` (capture time).
+        """
+        if now is not None:
+            self.now = max(self.now, now)
+        done = [
+            s for s in self._open.values()
+            if s.is_done(self.now, self.linger_sec, self.idle_sec, self.confirmed_idle_sec)
+        ]
+        return self._release(done)
+
+    def flush(self) -> List[DialogState]:
+        return self._release(list(self._open.values()))
+
+    def _release(self, states: List[DialogState]) -> List[DialogState]:
+        for state in states:
+            del self._open[state.call_id]
+            self._finished[state.call_id] = frozenset(state._seen)
+        while len(self._finished) > FINISHED_MEMORY:
+            self._finished.popitem(last=False)
+        self.finished_count += len(states)
+        return states
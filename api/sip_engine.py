@@ -1,21 +1,35 @@
-from typing import List, Dict, Any
-from sip_parser import (
-    extract_sip_packets,
-    extract_sip_calls,
-    build_call_summary
-)
+from typing import List, Dict, Any, Iterator
+from sip_parser import iter_sip_packets
+from sip_dialog import SipDialogTracker
 
 
-def analyze_sip_pcap(pcap_path: str) -> List[Dict[str, Any]]:
+def iter_sip_call_summaries(pcap_path: str, keep_events: bool = False, expire: bool = True) -> Iterator[Dict[str, Any]]:
     """
-    SIP-only analysis engine.
-    Returns one summary per Call-ID.
+    Streaming SIP-only analysis: one summary per dialog, yielded as soon
+    as it terminates or times out (state released then). A Call-ID that
+    comes back after timing out yields a further summary; expire=False
+    yields one per Call-ID, all at the end.
     """
-    sip_packets = extract_sip_packets(pcap_path)
-    sip_calls = extract_sip_calls(sip_packets)
+    tracker = SipDialogTracker(keep_events=keep_events, expire=expire)
+
+    def summarize(dialog) -> Dict[str, Any]:
+        summary = dialog.summary()
+        if keep_events:
+            summary["events"] = sorted(dialog.events, key=lambda x: (x["time"], x["frame"]))
+        return summary
+
+    for pkt in iter_sip_packets(pcap_path):
+        for dialog in tracker.feed(pkt):
+            yield summarize(dialog)
+    for dialog in tracker.flush():
+        yield summarize(dialog)
 
-    summaries: List[Dict[str, Any]] = []
-    for call_id, events in sip_calls.items():
-        summaries.append(build_call_summary(call_id, events))
 
+def analyze_sip_pcap(pcap_path: str) -> List[Dict[str, Any]]:
+    """
+    SIP-only analysis engine.
+    Returns one summary per Call-ID (first-seen order).
+    """
+    summaries = list(iter_sip_call_summaries(pcap_path, keep_events=True, expire=False))
+    summaries.sort(key=lambda s: s["events"][0]["frame"] if s["events"] else 0)
     return summaries
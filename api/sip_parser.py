@@ -1,7 +1,11 @@
 import sys
 import json
-from typing import Dict, List, Any
-from tshark_runner import run_tshark
+from contextlib import closing
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+from tshark_runner import iter_tshark_lines
+from pcap_reader import try_read_capture
+from sharkd import iter_sharkd_fields
+from sip_dialog import DialogState, SipDialogTracker
 
 
 SIP_FIELDS = [
@@ -9,48 +13,121 @@ SIP_FIELDS = [
     "frame.time_relative",
     "sip.Call-ID",
     "sip.Method",
-    "sip.Status-Code"
+    "sip.Status-Code",
+    "sdp.connection_info.address",
+    "sdp.media"
 ]
 
+# SDP can carry several c=/m= lines, so SIP rows are extracted with
+# occurrence=a; scalar fields keep their first value.
+AGGREGATOR = ","
+
 
 # -----------------------------
 # 1️⃣ Extract SIP packets
 # -----------------------------
 def extract_sip_packets(pcap_file: str) -> List[Dict[str, Any]]:
+    return list(iter_sip_packets(pcap_file))
+
+
+def iter_sip_packets(pcap_file: str) -> Iterator[Dict[str, Any]]:
+    """
+    SIP records in capture order; the sharkd / tshark paths stream them.
+    """
+    native = try_read_capture(pcap_file)
+    if native is not None:
+        yield from native["sip_packets"]
+        return
+
+    pages = iter_sharkd_fields(pcap_file, SIP_FIELDS, display_filter="sip")
+    if pages is not None:
+        width = len(SIP_FIELDS)
+        for flat in pages:
+            for base in range(0, len(flat), width):
+                pkt = parse_sip_record(flat[base:base + width])
+                if pkt:
+                    yield pkt
+        return
+
     args = [
         "-r", pcap_file,
         "-Y", "sip",
         "-T", "fields",
         "-E", "separator=|",
-        "-E", "occurrence=f",
+        "-E", "occurrence=a",
+        "-E", f"aggregator={AGGREGATOR}",
     ]
 
     for f in SIP_FIELDS:
         args += ["-e", f]
 
-    result = run_tshark(args)
+    with closing(iter_tshark_lines(args)) as lines:
+        for line in lines:
+            parts = line.split("|")
+            if len(parts) < len(SIP_FIELDS):
+                continue
 
-    packets: List[Dict[str, Any]] = []
+            pkt = parse_sip_record(parts)
+            if pkt:
+                yield pkt
 
-    for line in result.stdout.splitlines():
-        parts = line.split("|")
-        if len(parts) < len(SIP_FIELDS):
-            continue
 
-        frame_no, time_rel, call_id, method, status = parts
+def parse_sip_record(parts: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    One SIP_FIELDS row -> packet dict (None when there is no Call-ID).
+    Shared by extract_sip_packets and the single-pass extractor.
+    """
+    frame_no, time_rel, call_id, method, status, sdp_addrs, sdp_media = parts[:len(SIP_FIELDS)]
+
+    call_id = call_id.split(AGGREGATOR, 1)[0]
+    if not call_id:
+        return None
+
+    return {
+        "frame": int(frame_no),
+        "time": float(time_rel),
+        "call_id": call_id.strip(),
+        "method": method.split(AGGREGATOR, 1)[0] or None,
+        "status": status.split(AGGREGATOR, 1)[0] or None,
+        "media": parse_sdp_fields(sdp_addrs, sdp_media) if sdp_media else []
+    }
 
-        if not call_id:
-            continue
 
-        packets.append({
-            "frame": int(frame_no),
-            "time": float(time_rel),
-            "call_id": call_id.strip(),
-            "method": method or None,
-            "status": status or None
-        })
+def parse_sdp_fields(addresses: str, media_lines: str) -> List[Tuple[str, int, List[str]]]:
+    """
+    sdp.connection_info.address + sdp.media (aggregated) ->
+    [(connection_address, media_port, payload_types)]
+
+    The aggregated fields lose which c= line belongs to which m= line.
+    Only two layouts are unambiguous: one c= line (session-level, shared)
+    or one more c= than m= lines (session-level + one per media line, in
+    order). Otherwise a media-level override may sit on any media line,
+    so each media port is announced with every connection address
+    (parse_sdp_media, on the raw body, resolves it exactly).
+    """
+    addrs = [a for a in addresses.split(AGGREGATOR) if a]
+    if not addrs:
+        return []
+
+    lines = [m.split() for m in media_lines.split(AGGREGATOR)]
+    if len(addrs) == 1:
+        candidates = [addrs] * len(lines)
+    elif len(addrs) == len(lines) + 1:
+        candidates = [[a] for a in addrs[1:]]
+    else:
+        candidates = [list(dict.fromkeys(addrs))] * len(lines)
+
+    media: List[Tuple[str, int, List[str]]] = []
+    for parts, line_addrs in zip(lines, candidates):
+        if len(parts) < 3:
+            continue
+        port = parts[1].split("/")[0]
+        if not port.isdigit() or port == "0":
+            continue
+        for addr in line_addrs:
+            media.append((addr, int(port), parts[3:]))
 
-    return packets
+    return media
 
 
 # -----------------------------
@@ -71,59 +148,25 @@ def extract_sip_calls(packets: List[Dict[str, Any]]) -> Dict[str, List[Dict]]:
 # -----------------------------
 # 3️⃣ SIP failure classification (FACTS ONLY)
 # -----------------------------
+def _dialog(call_id: str, events: List[Dict]) -> DialogState:
+    # One pass through the dialog state machine (sip_dialog)
+    state = DialogState(call_id)
+    for e in events:
+        state.feed(e)
+    return state
+
+
 def classify_call(events: List[Dict]) -> Dict[str, Any]:
-    invite = next((e for e in events if e["method"] == "INVITE"), None)
-    ok_200 = next((e for e in events if e["status"] == "200"), None)
-    ack = next((e for e in events if e["method"] == "ACK"), None)
-
-    failure_status = next(
-        (e for e in events if e["status"] and e["status"].startswith(("4", "5", "6"))),
-        None
-    )
-
-    # SIP error response
-    if failure_status:
-        return {
-            "root_cause": f"SIP failure response {failure_status['status']}",
-            "failure_packet": failure_status["frame"]
-        }
-
-    # Missing ACK after 200 OK
-    if ok_200 and not ack:
-        return {
-            "root_cause": "ACK missing after 200 OK",
-            "failure_packet": ok_200["frame"]
-        }
-
-    # No explicit SIP failure
-    return {
-        "root_cause": "SIP signaling completed without explicit failure",
-        "failure_packet": None
-    }
+    return _dialog("", events).classify()
 
 
 # -----------------------------
 # 4️⃣ Build per-call summary (MVP-1 contract)
 # -----------------------------
 def build_call_summary(call_id: str, events: List[Dict]) -> Dict[str, Any]:
-    classification = classify_call(events)
-
-    invite = next((e for e in events if e["method"] == "INVITE"), None)
-    ok_200 = next((e for e in events if e["status"] == "200"), None)
-
-    latency = None
-    if invite and ok_200:
-        latency = round(ok_200["time"] - invite["time"], 3)
-
-    return {
-        "call_id": call_id,
-        "root_cause": classification["root_cause"],
-        "invite_packet": invite["frame"] if invite else None,
-        "ok_200_packet": ok_200["frame"] if ok_200 else None,
-        "failure_packet": classification.get("failure_packet"),
-        "invite_to_200_latency_sec": latency,
-        "events": events
-    }
+    summary = _dialog(call_id, events).summary()
+    summary["events"] = events
+    return summary
 
 
 # -----------------------------
@@ -131,11 +174,21 @@ def build_call_summary(call_id: str, events: List[Dict]) -> Dict[str, Any]:
 # -----------------------------
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python sip_parser.py <pcap_file>")
+        print("Usage: python sip_parser.py <pcap_file> [--stream]")
         sys.exit(1)
 
     pcap_file = sys.argv[1]
 
+    # --stream: one JSON summary (no events) per line as each dialog ends
+    if "--stream" in sys.argv[2:]:
+        tracker = SipDialogTracker()
+        for pkt in iter_sip_packets(pcap_file):
+            for dialog in tracker.feed(pkt):
+                print(json.dumps(dialog.summary()))
+        for dialog in tracker.flush():
+            print(json.dumps(dialog.summary()))
+        return
+
     packets = extract_sip_packets(pcap_file)
     calls = extract_sip_calls(packets)
 
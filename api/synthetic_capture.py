@@ -0,0 +1,265 @@
+import sys
+import json
+import heapq
+import random
+import socket
+import struct
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, Iterator, List, Tuple
+
+from pcap_reader import PCAP_MAGIC_US, SIP_UDP_PORT
+
+# Scenario -> verdict analyze_pcap_calls must reach for it
+SCENARIOS = {
+    "success": "SUCCESS",
+    "sip_4xx": "SIP_FAILURE",
+    "sip_5xx": "SIP_FAILURE",
+    "missing_ack": "SIP_FAILURE",
+    "no_rtp": "MEDIA_FAILURE",
+    "one_way": "MEDIA_DEGRADED",
+}
+
+# Share of calls per failure scenario; the rest succeed
+DEFAULT_FAILURE_MIX = {
+    "sip_4xx": 0.10,
+    "sip_5xx": 0.05,
+    "missing_ack": 0.05,
+    "no_rtp": 0.05,
+    "one_way": 0.05,
+}
+
+CAPTURE_EPOCH = 1_700_000_000      # first packet timestamp (fixed: deterministic output)
+RTP_PAYLOAD_BYTES = 160            # 20 ms of G.711
+RTP_FIRST_PORT = 16384
+LINKTYPE_ETHERNET = 1
+
+_ETH_HEADER = b"\x02\x00\x00\x00\x00\x02" + b"\x02\x00\x00\x00\x00\x01" + b"\x08\x00"
+
+
+@dataclass
+class SyntheticProfile:
+    """
+    Shape of a generated capture. Same profile (incl. seed) -> byte-identical file.
+
+    concurrency is the number of calls active at once: call starts are
+    spaced call_duration_sec / concurrency apart.
+    """
+    calls: int = 100
+    failure_mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_FAILURE_MIX))
+    rtp_pps: int = 50                  # per direction
+    call_duration_sec: float = 10.0    # answer -> BYE
+    concurrency: int = 10
+    seed: int = 1
+
+    def scenarios(self) -> List[str]:
+        unknown = set(self.failure_mix) - set(SCENARIOS)
+        if unknown:
+            raise ValueError(f"Unknown scenarios in failure_mix: {sorted(unknown)}")
+        failures = sum(self.failure_mix.values())
+        if failures > 1:
+            raise ValueError("failure_mix shares add up to more than 1")
+
+        names = ["success"] + list(self.failure_mix)
+        weights = [1 - failures] + list(self.failure_mix.values())
+        rng = random.Random(self.seed)
+        return rng.choices(names, weights=weights, k=self.calls)
+
+
+# -----------------------------
+# Frames
+# -----------------------------
+def _checksum(header: bytes) -> int:
+    total = sum(struct.unpack(f"!{len(header) // 2}H", header))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def udp_frame(src: bytes, dst: bytes, sport: int, dport: int, payload: bytes) -> bytes:
+    """
+    Ethernet / IPv4 / UDP frame (src, dst: packed IPv4 addresses).
+    """
+    udp = struct.pack("!HHHH", sport, dport, 8 + len(payload), 0)
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 28 + len(payload), 0, 0x4000, 64, 17, 0, src, dst)
+    ip = ip[:10] + struct.pack("!H", _checksum(ip)) + ip[12:]
+    return _ETH_HEADER + ip + udp + payload
+
+
+def sip_message(first_line: str, call_id: str, caller: str, callee: str, cseq: str, sdp: str = "") -> bytes:
+    headers = [
+        first_line,
+        f"Via: SIP/2.0/UDP {caller}:{SIP_UDP_PORT};branch=z9hG4bK-{call_id}",
+        f"From: <sip:caller@{caller}>;tag=a-{call_id}",
+        f"To: <sip:callee@{callee}>",
+        f"Call-ID: {call_id}",
+        f"CSeq: {cseq}",
+    ]
+    if sdp:
+        headers.append("Content-Type: application/sdp")
+    headers.append(f"Content-Length: {len(sdp)}")
+    return ("\r\n".join(headers) + "\r\n\r\n" + sdp).encode()
+
+
+def sdp_body(ip: str, port: int) -> str:
+    return (
+        "v=0\r\n"
+        f"o=- 0 0 IN IP4 {ip}\r\n"
+        "s=-\r\n"
+        f"c=IN IP4 {ip}\r\n"
+        "t=0 0\r\n"
+        f"m=audio {port} RTP/AVP 0\r\n"
+        "a=rtpmap:0 PCMU/8000\r\n"
+    )
+
+
+def rtp_packet(seq: int, timestamp: int, ssrc: int) -> bytes:
+    return struct.pack("!BBHII", 0x80, 0, seq & 0xFFFF, timestamp & 0xFFFFFFFF, ssrc) + b"\xff" * RTP_PAYLOAD_BYTES
+
+
+# -----------------------------
+# Calls
+# -----------------------------
+def _endpoints(n: int) -> Tuple[str, str]:
+    hi, lo = (n >> 8) & 0xFF, n & 0xFF
+    return f"10.1.{hi}.{lo}", f"10.2.{hi}.{lo}"
+
+
+def _call_packets(n: int, scenario: str, start: float, profile: SyntheticProfile) -> Iterator[Tuple[float, int, int, bytes]]:
+    """
+    One call's packets as (time, call, seq, frame), in time order.
+    """
+    caller, callee = _endpoints(n)
+    a, b = socket.inet_aton(caller), socket.inet_aton(callee)
+    port_a = RTP_FIRST_PORT + 2 * (n % 16384)
+    port_b = port_a + 1
+    call_id = f"synthetic-{n}@{caller}"
+    k = 0
+
+    def sip(t: float, from_caller: bool, first_line: str, cseq: str, sdp: str = ""):
+        nonlocal k
+        k += 1
+        src, dst = (a, b) if from_caller else (b, a)
+        payload = sip_message(first_line, call_id, caller, callee, cseq, sdp)
+        return start + t, n, k, udp_frame(src, dst, SIP_UDP_PORT, SIP_UDP_PORT, payload)
+
+    yield sip(0.0, True, f"INVITE sip:callee@{callee} SIP/2.0", "1 INVITE", sdp_body(caller, port_a))
+    yield sip(0.01, False, "SIP/2.0 100 Trying", "1 INVITE")
+
+    if scenario in ("sip_4xx", "sip_5xx"):
+        status = "486 Busy Here" if scenario == "sip_4xx" else "503 Service Unavailable"
+        yield sip(0.2, False, f"SIP/2.0 {status}", "1 INVITE")
+        yield sip(0.21, True, f"ACK sip:callee@{callee} SIP/2.0", "1 ACK")
+        return
+
+    yield sip(0.5, False, "SIP/2.0 180 Ringing", "1 INVITE")
+    yield sip(1.0, False, "SIP/2.0 200 OK", "1 INVITE", sdp_body(callee, port_b))
+    if scenario != "missing_ack":
+        yield sip(1.01, True, f"ACK sip:callee@{callee} SIP/2.0", "1 ACK")
+
+    media_start = 1.02
+    media_end = media_start + profile.call_duration_sec
+    if scenario != "no_rtp":
+        interval = 1.0 / profile.rtp_pps
+        samples = int(8000 * interval)
+        count = int(profile.call_duration_sec * profile.rtp_pps)
+        for i in range(count):
+            t = media_start + i * interval
+            k += 1
+            yield start + t, n, k, udp_frame(a, b, port_a, port_b, rtp_packet(i, i * samples, 0x10000 + n))
+            if scenario != "one_way":
+                k += 1
+                yield start + t + 0.002, n, k, udp_frame(b, a, port_b, port_a, rtp_packet(i, i * samples, 0x20000 + n))
+
+    yield sip(media_end + 0.01, True, f"BYE sip:callee@{callee} SIP/2.0", "2 BYE")
+    yield sip(media_end + 0.02, False, "SIP/2.0 200 OK", "2 BYE")
+
+
+def iter_synthetic_frames(profile: SyntheticProfile) -> Iterator[Tuple[float, bytes]]:
+    """
+    (time, frame) for the whole capture, merged across concurrent calls
+    without materializing it.
+    """
+    spacing = (profile.call_duration_sec + 1.0) / max(profile.concurrency, 1)
+    calls = [
+        _call_packets(n, scenario, n * spacing, profile)
+        for n, scenario in enumerate(profile.scenarios())
+    ]
+    for t, _n, _k, frame in heapq.merge(*calls):
+        yield t, frame
+
+
+def generate_capture(path: str, profile: SyntheticProfile) -> Dict[str, Any]:
+    """
+    Writes a classic pcap (microsecond timestamps) and returns a manifest
+    with the expected per-verdict call counts.
+    """
+    scenarios = profile.scenarios()
+    packets = 0
+    size = 24
+
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", PCAP_MAGIC_US, 2, 4, 0, 0, 65535, LINKTYPE_ETHERNET))
+        for t, frame in iter_synthetic_frames(profile):
+            ts = CAPTURE_EPOCH + t
+            sec = int(ts)
+            usec = int(round((ts - sec) * 1e6))
+            if usec == 1_000_000:
+                sec, usec = sec + 1, 0
+            f.write(struct.pack("<IIII", sec, usec, len(frame), len(frame)))
+            f.write(frame)
+            packets += 1
+            size += 16 + len(frame)
+
+    return {
+        "path": path,
+        "profile": asdict(profile),
+        "packets": packets,
+        "bytes": size,
+        "scenarios": dict(Counter(scenarios)),
+        "expected_verdicts": dict(Counter(SCENARIOS[s] for s in scenarios)),
+    }
+
+
+def _parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in filter(None, value.split(",")):
+        name, _, share = item.partition("=")
+        mix[name.strip()] = float(share)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic synthetic SIP/RTP capture")
+    parser.add_argument("output", help="pcap file to write")
+    parser.add_argument("--calls", type=int, default=SyntheticProfile.calls)
+    parser.add_argument("--mix", type=_parse_mix, default=None,
+                        help="failure shares, e.g. sip_4xx=0.1,sip_5xx=0.05,missing_ack=0.05,no_rtp=0.05,one_way=0.05")
+    parser.add_argument("--pps", type=int, default=SyntheticProfile.rtp_pps, help="RTP packets/s per direction")
+    parser.add_argument("--duration", type=float, default=SyntheticProfile.call_duration_sec)
+    parser.add_argument("--concurrency", type=int, default=SyntheticProfile.concurrency)
+    parser.add_argument("--seed", type=int, default=SyntheticProfile.seed)
+    args = parser.parse_args()
+
+    profile = SyntheticProfile(
+        calls=args.calls,
+        rtp_pps=args.pps,
+        call_duration_sec=args.duration,
+        concurrency=args.concurrency,
+        seed=args.seed,
+    )
+    if args.mix is not None:
+        profile.failure_mix = args.mix
+
+    try:
+        manifest = generate_capture(args.output, profile)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
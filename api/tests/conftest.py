@@ -0,0 +1,5 @@
+import os
+import sys
+
+# api/ modules are flat (imported as `import persistence`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+import json
+
+import persistence
+from persistence import SupabaseWriter, FakeSupabase
+
+
+def make_writer(fake, tmp_path, **kwargs):
+    kwargs.setdefault("flush_sec", 60.0)   # only explicit flushes / full batches send
+    return SupabaseWriter(lambda: fake, spill_file=str(tmp_path / "spill.jsonl"), **kwargs)
+
+
+def test_bulk_flush_sends_batches_parents_first(tmp_path):
+    fake = FakeSupabase()
+    writer = make_writer(fake, tmp_path, batch_size=3)
+
+    for n in range(4):
+        writer.insert("sip_calls", {"job_id": "j", "call_id": f"c{n}"})
+    writer.insert("pcap_jobs", {"id": "j"})
+    assert writer.flush(timeout=5)
+
+    assert fake.tables["pcap_jobs"] == [{"id": "j"}]
+    assert [r["call_id"] for r in fake.tables["sip_calls"]] == ["c0", "c1", "c2", "c3"]
+    # 3 rows (full batch), then 1 sip_calls row + 1 pcap_jobs row on flush
+    assert fake.requests == 3
+    assert writer.stats()["rows"] == 5
+    writer.close()
+
+
+def test_failed_batch_is_retried_then_spilled(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "PERSIST_BACKOFF_SEC", 0.0)
+    fake = FakeSupabase(fail_next=10)
+    writer = make_writer(fake, tmp_path, max_retries=2)
+
+    writer.insert("pcap_jobs", {"id": "j"})
+    assert writer.flush(timeout=5)
+
+    assert fake.requests == 3   # first try + 2 retries
+    assert not fake.tables["pcap_jobs"]
+    with open(writer.spill_file) as f:
+        entries = [json.loads(line) for line in f]
+    assert [(e["table"], e["rows"]) for e in entries] == [("pcap_jobs", [{"id": "j"}])]
+    assert writer.stats()["spilled_rows"] == 1
+    writer.close()
+
+
+def test_spilled_rows_are_replayed_on_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "PERSIST_BACKOFF_SEC", 0.0)
+    failing = make_writer(FakeSupabase(fail_next=10), tmp_path, max_retries=0)
+    failing.insert("sip_calls", {"job_id": "j", "call_id": "c0"})
+    failing.insert("pcap_jobs", {"id": "j"})
+    assert failing.flush(timeout=5)
+    failing.close()
+
+    fake = FakeSupabase()
+    writer = make_writer(fake, tmp_path)
+    assert writer.flush(timeout=5)
+
+    assert fake.tables["pcap_jobs"] == [{"id": "j"}]
+    assert fake.tables["sip_calls"] == [{"job_id": "j", "call_id": "c0"}]
+    assert writer.stats()["replayed_rows"] == 2
+    assert not (tmp_path / "spill.jsonl").exists()
+    writer.close()
+
+
+def test_flush_gives_up_when_the_queue_stays_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, "ENQUEUE_TIMEOUT_SEC", 0.05)
+    writer = make_writer(FakeSupabase(), tmp_path, max_queue=1)
+    writer._thread = object()   # writer never drains the queue
+    writer._queue.put(("pcap_jobs", {"id": "j"}))
+
+    assert writer.flush() is False
@@ -1,9 +1,11 @@
 from typing import List, Dict, Any
 
+from packet_store import RtpColumns
+
 
 def build_timeline(
     events: List[Dict[str, Any]],
-    rtp_packets: List[Dict[str, Any]]
+    rtp_packets: RtpColumns
 ) -> List[Dict[str, Any]]:
     """
     MVP-1 Timeline Builder
@@ -34,24 +36,25 @@ def build_timeline(
     # -----------------------------
     # RTP events (sampled, MVP-1)
     # -----------------------------
-    if rtp_packets:
+    if len(rtp_packets):
+        times = rtp_packets.time
+        frames = rtp_packets.frame
+
         # First RTP packet
-        first_rtp = rtp_packets[0]
         timeline.append({
-            "time": first_rtp["time"],
+            "time": float(times[0]),
             "type": "RTP",
             "label": "RTP started",
-            "packet": first_rtp["frame"]
+            "packet": int(frames[0])
         })
 
         # Last RTP packet
-        last_rtp = rtp_packets[-1]
-        if last_rtp["frame"] != first_rtp["frame"]:
+        if frames[-1] != frames[0]:
             timeline.append({
-                "time": last_rtp["time"],
+                "time": float(times[-1]),
                 "type": "RTP",
                 "label": "RTP ended",
-                "packet": last_rtp["frame"]
+                "packet": int(frames[-1])
             })
 
     # -----------------------------
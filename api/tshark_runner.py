@@ -1,15 +1,137 @@
+import io
+import os
 import sys
 import json
 import subprocess
 import shutil
+import threading
+import time
+from contextlib import closing, contextmanager
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple
+
+from metrics import record_tshark
+
+# Streaming defaults: stdout is read in bounded blocks (the pipe gives
+# tshark natural backpressure), stderr keeps only its last N chars.
+STREAM_CHUNK_CHARS = 1 << 20
+STDERR_LIMIT_CHARS = 64 * 1024
+
+# Admission control: at most MAX_TSHARK_PROCS tshark processes host-wide
+# (per API process), at most MAX_TSHARK_WAITERS callers queued for a slot.
+MAX_TSHARK_PROCS = int(os.getenv("MAX_TSHARK_PROCS", str(max(1, (os.cpu_count() or 2) // 2))))
+MAX_TSHARK_WAITERS = int(os.getenv("MAX_TSHARK_WAITERS", "8"))
+TSHARK_WAIT_SEC = float(os.getenv("TSHARK_WAIT_SEC", "30"))
+TSHARK_RETRY_AFTER_SEC = 5
 
 
 class TsharkError(RuntimeError):
     pass
 
 
+class TsharkBusy(TsharkError):
+    """
+    No tshark slot (queue full or wait timed out); callers map it to 429.
+    """
+    retry_after = TSHARK_RETRY_AFTER_SEC
+
+
+class TsharkSlots:
+    """
+    Counting semaphore with a bounded wait queue.
+    """
+
+    def __init__(self, max_procs: int = MAX_TSHARK_PROCS, max_waiters: int = MAX_TSHARK_WAITERS):
+        self.max_procs = max_procs
+        self.max_waiters = max_waiters
+        self._sem = threading.BoundedSemaphore(max_procs)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._rejected = 0
+
+    @contextmanager
+    def acquire(self, wait_sec: float = TSHARK_WAIT_SEC):
+        with self._lock:
+            if self._waiting >= self.max_waiters:
+                self._rejected += 1
+                raise TsharkBusy(f"tshark saturated ({self.max_procs} running, {self._waiting} queued)")
+            self._waiting += 1
+
+        try:
+            acquired = self._sem.acquire(timeout=wait_sec)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        if not acquired:
+            with self._lock:
+                self._rejected += 1
+            raise TsharkBusy(f"no tshark slot within {wait_sec}s")
+
+        with self._lock:
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._sem.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_procs": self.max_procs,
+                "max_waiters": self.max_waiters,
+                "running": self._running,
+                "waiting": self._waiting,
+                "rejected": self._rejected,
+            }
+
+
+tshark_slots = TsharkSlots()
+
+
+def _reap(proc: subprocess.Popen) -> Tuple[int, Any]:
+    """
+    Waits for a child whose output is fully read, via wait4() where
+    available so its own rusage (CPU, peak RSS) is kept for the tshark
+    metrics. Returns (returncode, rusage or None).
+    """
+    if hasattr(os, "wait4") and proc.returncode is None:
+        try:
+            _pid, status, usage = os.wait4(proc.pid, 0)
+        except ChildProcessError:
+            pass  # already reaped
+        else:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return proc.returncode, usage
+    return proc.wait(), None
+
+
+class _CountingReader(io.RawIOBase):
+    """
+    Raw byte stream that counts what it reads (tshark output bytes,
+    before text decoding).
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buf) -> int:
+        n = self.raw.readinto(buf) or 0
+        self.bytes_read += n
+        return n
+
+    def close(self) -> None:
+        self.raw.close()
+        super().close()
+
+
 @dataclass
 class TsharkResult:
     cmd: List[str]
@@ -18,17 +140,44 @@ class TsharkResult:
     returncode: int
 
 
+# Resolved once (PATH scan), re-resolved only if the binary goes away
+_tshark_path: Optional[str] = None
+_tshark_version: Optional[str] = None
+
+
 def ensure_tshark_available() -> str:
     """
     Ensures tshark is installed and on PATH.
     Returns the resolved tshark path.
     """
+    global _tshark_path
+    path = _tshark_path
+    if path and os.access(path, os.X_OK):
+        return path
+
     path = shutil.which("tshark")
     if not path:
         raise TsharkError("tshark not found. Install Wireshark (includes tshark) and ensure it is on PATH.")
+    _tshark_path = path
     return path
 
 
+def tshark_version() -> Optional[str]:
+    """
+    First line of `tshark -v`, probed once per process; None when tshark
+    is missing or the probe fails (retried on the next call).
+    """
+    global _tshark_version
+    if _tshark_version is None:
+        try:
+            result = run_tshark(["-v"], timeout_sec=30)
+        except TsharkError:
+            return None
+        lines = result.stdout.strip().splitlines()
+        _tshark_version = lines[0].strip() if lines else "unknown"
+    return _tshark_version
+
+
 def run_tshark(cmd_args: List[str], timeout_sec: int = 180, check: bool = True) -> TsharkResult:
     """
     Generic tshark runner for API use.
@@ -37,21 +186,51 @@ def run_tshark(cmd_args: List[str], timeout_sec: int = 180, check: bool = True)
     tshark_path = ensure_tshark_available()
     cmd = [tshark_path] + cmd_args
 
+    proc = None
+    stdout, stderr = b"", b""
+    rusage = None
+    outcome = "error"
+    started = time.perf_counter()
+
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout_sec
-        )
-    except subprocess.TimeoutExpired as e:
-        raise TsharkError(f"tshark timed out after {timeout_sec}s: {' '.join(cmd)}") from e
+        with tshark_slots.acquire():
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+                # Read both pipes ourselves (communicate() would reap the
+                # child before its rusage can be collected)
+                stderr_buf: List[bytes] = []
+                stderr_thread = threading.Thread(target=lambda: stderr_buf.append(proc.stderr.read()), daemon=True)
+                stderr_thread.start()
+
+                timed_out = threading.Event()
+
+                def _on_timeout():
+                    timed_out.set()
+                    proc.kill()
+
+                watchdog = threading.Timer(timeout_sec, _on_timeout)
+                watchdog.daemon = True
+                watchdog.start()
+                try:
+                    stdout = proc.stdout.read()
+                    stderr_thread.join()
+                finally:
+                    watchdog.cancel()
+                stderr = stderr_buf[0] if stderr_buf else b""
+                _, rusage = _reap(proc)
+
+                if timed_out.is_set():
+                    outcome = "timeout"
+                    raise TsharkError(f"tshark timed out after {timeout_sec}s: {' '.join(cmd)}")
+        outcome = "ok" if proc.returncode == 0 else "error"
+    finally:
+        if proc is not None:
+            record_tshark(cmd_args, time.perf_counter() - started, rusage, len(stdout or b""), outcome)
 
     out = TsharkResult(
         cmd=cmd,
-        stdout=result.stdout or "",
-        stderr=result.stderr or "",
-        returncode=result.returncode
+        stdout=stdout.decode("utf-8", errors="replace"),
+        stderr=stderr.decode("utf-8", errors="replace"),
+        returncode=proc.returncode
     )
 
     if check and out.returncode != 0:
@@ -64,6 +243,132 @@ def run_tshark(cmd_args: List[str], timeout_sec: int = 180, check: bool = True)
     return out
 
 
+def _drain_stderr(stream, buf: List[str], limit: int) -> None:
+    """
+    Reads tshark stderr in the background so it can never fill its pipe,
+    keeping only the last `limit` chars.
+    """
+    tail = ""
+    for chunk in iter(lambda: stream.read(4096), ""):
+        tail = (tail + chunk)[-limit:]
+    buf.append(tail)
+
+
+def iter_tshark_chunks(
+    cmd_args: List[str],
+    timeout_sec: int = 180,
+    check: bool = True,
+    chunk_chars: int = STREAM_CHUNK_CHARS,
+    stderr_limit: int = STDERR_LIMIT_CHARS,
+) -> Iterator[str]:
+    """
+    Streaming tshark runner.
+    Yields stdout in blocks of ~chunk_chars that always end on a line
+    boundary, so peak memory is one block regardless of capture size.
+
+    - backpressure: tshark blocks on the pipe until the consumer asks for more
+    - stderr: drained in a thread into a bounded tail buffer
+    - early termination: closing the generator (.close()) kills tshark
+    - timeout: wall-clock watchdog kills tshark and raises TsharkError
+
+    A tshark slot is held from the first block until the generator
+    finishes or is closed. A consumer that may stop early or raise must
+    close it deterministically (contextlib.closing), not leave it to the
+    garbage collector: a traceback keeps a suspended generator alive.
+
+        with closing(iter_tshark_chunks(args)) as chunks:
+            for block in chunks:
+                ...
+    """
+    tshark_path = ensure_tshark_available()
+    cmd = [tshark_path] + cmd_args
+
+    # slot held for the life of the process (released when the generator ends)
+    with tshark_slots.acquire():
+        started = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Bytes counted before decoding (tshark_output_bytes_total)
+        counted = _CountingReader(proc.stdout)
+        stdout = io.TextIOWrapper(io.BufferedReader(counted), encoding="utf-8", errors="replace")
+        stderr_text = io.TextIOWrapper(proc.stderr, encoding="utf-8", errors="replace")
+
+        stderr_buf: List[str] = []
+        stderr_thread = threading.Thread(
+            target=_drain_stderr,
+            args=(stderr_text, stderr_buf, stderr_limit),
+            daemon=True,
+        )
+        stderr_thread.start()
+
+        timed_out = threading.Event()
+
+        def _on_timeout():
+            timed_out.set()
+            proc.kill()
+
+        watchdog = threading.Timer(timeout_sec, _on_timeout)
+        watchdog.daemon = True
+        watchdog.start()
+
+        completed = False
+        try:
+            pending = ""
+            for block in iter(lambda: stdout.read(chunk_chars), ""):
+                block = pending + block
+                cut = block.rfind("\n") + 1
+                if cut == 0:
+                    pending = block
+                    continue
+                pending = block[cut:]
+                yield block[:cut]
+
+            if pending:
+                yield pending
+            completed = True
+
+        finally:
+            watchdog.cancel()
+            if not completed and proc.poll() is None:
+                proc.kill()
+            stdout.close()
+            stderr_thread.join()
+            returncode, rusage = _reap(proc)
+
+            if timed_out.is_set():
+                outcome = "timeout"
+            elif not completed:
+                outcome = "cancelled"
+            else:
+                outcome = "ok" if returncode == 0 else "error"
+            record_tshark(cmd_args, time.perf_counter() - started, rusage, counted.bytes_read, outcome)
+
+    stderr = stderr_buf[0] if stderr_buf else ""
+
+    if timed_out.is_set():
+        raise TsharkError(f"tshark timed out after {timeout_sec}s: {' '.join(cmd)}")
+
+    if check and returncode != 0:
+        raise TsharkError(
+            f"ERROR running tshark (code={returncode})\n"
+            f"CMD: {' '.join(cmd)}\n"
+            f"STDERR:\n{stderr.strip()}"
+        )
+
+
+def iter_tshark_lines(
+    cmd_args: List[str],
+    timeout_sec: int = 180,
+    check: bool = True,
+) -> Iterator[str]:
+    """
+    Line-by-line view over iter_tshark_chunks (same guarantees, close it
+    the same way).
+    """
+    with closing(iter_tshark_chunks(cmd_args, timeout_sec=timeout_sec, check=check)) as chunks:
+        for block in chunks:
+            yield from block.splitlines()
+
+
 def get_protocol_hierarchy(pcap_path: str) -> str:
     """
     Returns tshark protocol hierarchy stats output (io,phs).
@@ -113,6 +418,50 @@ def detect_context(phs_output: str) -> Dict[str, Any]:
     if "sctp" in phs_lower:
         protocols.append("SCTP")
 
+    return classify_context(protocols)
+
+
+def detect_context_from_protocols(frame_protocols: Iterable[str]) -> Dict[str, Any]:
+    """
+    Same context detection, fed from frame.protocols values
+    (e.g. "eth:ethertype:ip:udp:sip:sdp") collected during a single
+    extraction pass instead of a separate io,phs run.
+    """
+    layers = set()
+    for stack in frame_protocols:
+        layers.update((stack or "").lower().split(":"))
+
+    protocols: List[str] = []
+
+    if layers & {"radiotap", "wlan_radio", "wlan"}:
+        protocols.append("802.11")
+
+    if "ip" in layers:
+        protocols.append("IPv4")
+    if "ipv6" in layers:
+        protocols.append("IPv6")
+
+    if "tcp" in layers:
+        protocols.append("TCP")
+    if "udp" in layers:
+        protocols.append("UDP")
+
+    if "sip" in layers:
+        protocols.append("SIP")
+    if "rtp" in layers:
+        protocols.append("RTP")
+    if any(layer.startswith("gtp") for layer in layers):
+        protocols.append("GTP")
+    if "sctp" in layers:
+        protocols.append("SCTP")
+
+    return classify_context(protocols)
+
+
+def classify_context(protocols: List[str]) -> Dict[str, Any]:
+    """
+    Maps detected protocol names to a capture context.
+    """
     # --- Context classification ---
     if "802.11" in protocols:
         context = "WIFI_AIR"
@@ -145,9 +494,14 @@ def detect_context(phs_output: str) -> Dict[str, Any]:
 def analyze_capture_context(pcap_path: str) -> Dict[str, Any]:
     """
     API-friendly helper:
-    1) runs io,phs
+    1) runs io,phs (phs tap of a pooled sharkd session when available)
     2) returns context detection + raw phs output
     """
+    from sharkd import sharkd_capture_context
+    pooled = sharkd_capture_context(pcap_path)
+    if pooled is not None:
+        return pooled
+
     phs_output = get_protocol_hierarchy(pcap_path)
     context_info = detect_context(phs_output)
 
@@ -159,37 +513,37 @@ def analyze_capture_context(pcap_path: str) -> Dict[str, Any]:
 
 def get_packet_counts(pcap_file: str) -> Dict[str, Any]:
     """
-    Reliable packet counts:
+    Reliable packet counts (one streamed pass):
     - total packets = number of frames
-    - sip packets = frames where sip filter matches
-    - rtp packets = frames where rtp filter matches
-    """
+    - sip packets = frames whose protocol stack contains sip
+    - rtp packets = frames whose protocol stack contains rtp
 
-    # Total frames
-    total_frames_res = run_tshark([
-        "-r", pcap_file,
-        "-T", "fields",
-        "-e", "frame.number"
-    ])
-    total_packets = len([x for x in total_frames_res.stdout.splitlines() if x.strip()])
+    Counted by queries on a pooled sharkd session when available.
+    """
+    from sharkd import sharkd_packet_counts
+    pooled = sharkd_packet_counts(pcap_file)
+    if pooled is not None:
+        return pooled
 
-    # SIP frames
-    sip_res = run_tshark([
-        "-r", pcap_file,
-        "-Y", "sip",
-        "-T", "fields",
-        "-e", "frame.number"
-    ])
-    sip_packets = len([x for x in sip_res.stdout.splitlines() if x.strip()])
+    total_packets = 0
+    sip_packets = 0
+    rtp_packets = 0
 
-    # RTP frames
-    rtp_res = run_tshark([
+    with closing(iter_tshark_lines([
         "-r", pcap_file,
-        "-Y", "rtp",
         "-T", "fields",
-        "-e", "frame.number"
-    ])
-    rtp_packets = len([x for x in rtp_res.stdout.splitlines() if x.strip()])
+        "-e", "frame.protocols"
+    ])) as stacks:
+        for stack in stacks:
+            if not stack.strip():
+                continue
+
+            total_packets += 1
+            layers = stack.split(":")
+            if "sip" in layers:
+                sip_packets += 1
+            if "rtp" in layers:
+                rtp_packets += 1
 
     return {
         "total_packets": total_packets,
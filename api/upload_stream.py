@@ -0,0 +1,90 @@
+import os
+import struct
+import hashlib
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from pcap_reader import PCAP_MAGIC_US, PCAP_MAGIC_NS, PCAPNG_SHB
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(4 * 1024 ** 3)))
+
+# pcap global header / pcapng SHB minimum
+MIN_CAPTURE_BYTES = 24
+
+# multipart framing around the file part (boundary, part headers)
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """
+    Upload refused while streaming; status_code/detail map to the HTTP error.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class SavedUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+def capture_magic_ok(head: bytes) -> bool:
+    if len(head) < 4:
+        return False
+    if struct.unpack_from("<I", head)[0] == PCAPNG_SHB:
+        return True
+    return any(
+        struct.unpack_from(endian + "I", head)[0] in (PCAP_MAGIC_US, PCAP_MAGIC_NS)
+        for endian in ("<", ">")
+    )
+
+
+def save_upload_stream(
+    source: BinaryIO,
+    dest_path: str,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_bytes: int = UPLOAD_CHUNK_BYTES,
+) -> SavedUpload:
+    """
+    Copies an upload to disk chunk by chunk (never whole in memory),
+    hashing it on the fly and rejecting non-captures / oversize files as
+    soon as the offending chunk arrives. The partial file is removed on
+    rejection. Blocking: run it in a worker thread.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(dest_path, "wb") as out:
+            while True:
+                chunk = source.read(chunk_bytes)
+                if not chunk:
+                    break
+
+                if size == 0 and not capture_magic_ok(chunk):
+                    raise UploadRejected(400, "Not a pcap/pcapng capture (bad magic)")
+
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(413, f"Capture exceeds {max_bytes} bytes")
+
+                hasher.update(chunk)
+                out.write(chunk)
+
+        if size < MIN_CAPTURE_BYTES:
+            raise UploadRejected(400, "Capture is empty or truncated")
+
+    except BaseException:
+        try:
+            os.remove(dest_path)
+        except OSError:
+            pass
+        raise
+
+    return SavedUpload(path=dest_path, size=size, sha256=hasher.hexdigest())
@@ -64,8 +64,28 @@ export default function Home() {
       return;
     }
   
-    const data = await res.json();
-    setJobId(data.job_id);
+    const submitted = await res.json();
+    setJobId(submitted.job_id);
+
+    // Analysis runs in the background: poll the job until it finishes
+    let job;
+    while (true) {
+      await new Promise(r => setTimeout(r, 1000));
+      // calls=false: calls are paged via /jobs/{id}/calls, not shipped on every poll
+      const statusRes = await fetch(`${API}/jobs/${submitted.job_id}?calls=false`);
+      job = await statusRes.json();
+      if (!statusRes.ok || job.status === "done" || job.status === "failed") break;
+    }
+
+    if (job.status !== "done") {
+      setMessages(m => [
+        ...m,
+        { role: "assistant", content: `❌ Analysis failed:\n${job.error ?? job.detail}` }
+      ]);
+      return;
+    }
+
+    const data = job.result;
   
     setMessages(m => [
       ...m,